@@ -1,39 +1,224 @@
-from fastapi import APIRouter, HTTPException
+import json
+import asyncio
+from fastapi import APIRouter, HTTPException, Request, Header, Query
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from typing import Dict, Any
+from typing import Dict, Any, List, Optional, Union
 from celery.result import AsyncResult
-from tasks.worker import run_backtest_celery
+from config.settings import settings
+from core.engine import STRATEGIES, ENGINES, get_bar_source, parse_window
+from core.optimize import expand_grid, METRIC_KEYS
+from core.metrics import resolve_metrics, METRIC_SETS
+from core.result_cache import ResultCache
+from core.result_store import ResultStore
+from core.charting import chart_rows, CHART_MAX_POINTS, CHART_POINTS_LIMIT
+from core.data.bar_store import timeframe_to_ms
+from core.progress import ProgressHub
+from tasks.worker import celery_app, submit_backtest, submit_sweep, submit_walk_forward
+from tasks.scheduler import SchedulerLimitExceeded
 
 router = APIRouter()
 
+# 本进程所有进度流共用一个 Redis pub/sub 连接
+progress_hub = ProgressHub()
+
+# 进度流空闲时的心跳间隔（秒），同时用来发现客户端已断开
+STREAM_KEEPALIVE = 15.0
+
 class BacktestRequest(BaseModel):
     strategy: str
-    symbol: str
+    symbol: Optional[str] = None
+    # 多个标的时为组合回测（单次运行、共享资金），结果中 symbols 字段为各标的统计
+    symbols: List[str] = []
     start_date: str
     end_date: str
     params: Dict[str, Any] = {}
     initial_cash: float = 10000.0
+    # backtrader: 事件驱动（最终验证）; vector: NumPy 向量化（快速筛选）
+    mode: str = "backtrader"
+    timeframe: str = "1h"
+    # 附加的更大周期（如 ["4h", "1d"]），策略中通过 self.getdatabyname("4h") 使用
+    extra_timeframes: List[str] = []
+    # 返回的指标: 集合名 core/risk/trades/full，或指标名列表（可混用集合名），见 core.metrics
+    metrics: Union[str, List[str]] = "core"
+
+class SweepRequest(BaseModel):
+    strategy: str
+    symbol: str
+    start_date: str
+    end_date: str
+    # 每个参数可以是取值列表，或 {"start": 5, "stop": 20, "step": 5}
+    param_grid: Dict[str, Any]
+    initial_cash: float = 10000.0
+    sort_by: str = "sharpe_ratio"
+    top_n: Optional[int] = 100
+    mode: str = "vector"
+
+class WalkForwardRequest(BaseModel):
+    strategy: str
+    symbol: str
+    start_date: str
+    end_date: str
+    param_grid: Dict[str, Any]
+    # 窗口长度: 整数为 K 线根数，或 "90d"/"12h"/"4w" 等时间长度；step 默认等于 test
+    train: Union[int, str] = "90d"
+    test: Union[int, str] = "30d"
+    step: Optional[Union[int, str]] = None
+    # True 时训练段起点固定（扩张窗口）
+    anchored: bool = False
+    timeframe: str = "1h"
+    initial_cash: float = 10000.0
+    sort_by: str = "sharpe_ratio"
+    # 训练段寻优引擎 / 测试段验证引擎
+    mode: str = "vector"
+    oos_mode: str = "backtrader"
+
+def submitted(scheduled: dict) -> dict:
+    return {
+        "task_id": scheduled["task_id"],
+        "status": "submitted",
+        "queue": scheduled["queue"],
+        "deduplicated": scheduled["deduplicated"],
+    }
 
 @router.post("/run")
-async def run_backtest(request: BacktestRequest):
+async def run_backtest(request: BacktestRequest, x_user: Optional[str] = Header(None)):
     """
     异步提交回测任务
+    与在途任务完全相同的提交合并到同一个 task_id（deduplicated=true），X-User 用于按用户公平调度
     """
-    task = run_backtest_celery.delay(
+    if request.mode not in ENGINES:
+        raise HTTPException(status_code=400, detail=f"Unknown engine mode: {request.mode}")
+    if not request.symbol and not request.symbols:
+        raise HTTPException(status_code=400, detail="symbol or symbols is required")
+    for tf in [request.timeframe, *request.extra_timeframes]:
+        try:
+            timeframe_to_ms(tf)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    try:
+        resolve_metrics(request.metrics)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    try:
+        scheduled = submit_backtest(
+            user=x_user,
             strategy_name=request.strategy,
             symbol=request.symbol,
             params=request.params,
             start_date=request.start_date,
-            end_date=request.end_date
+            end_date=request.end_date,
+            mode=request.mode,
+            timeframe=request.timeframe,
+            extra_timeframes=request.extra_timeframes,
+            symbols=request.symbols,
+            initial_cash=request.initial_cash,
+            metrics=request.metrics,
         )
-    return {"task_id": task.id, "status": "submitted"}
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except SchedulerLimitExceeded as e:
+        raise HTTPException(status_code=429, detail=str(e))
+    return submitted(scheduled)
 
-@router.get("/status/{task_id}")
-async def get_backtest_status(task_id: str):
+@router.post("/sweep")
+async def run_sweep(request: SweepRequest, x_user: Optional[str] = Header(None)):
     """
-    查询回测任务状态
+    提交参数寻优任务，结果通过 /status/{task_id} 查询（按 sort_by 排序的指标表）
+    """
+    if request.strategy not in STRATEGIES:
+        raise HTTPException(status_code=400, detail=f"Unknown strategy: {request.strategy}")
+    if request.mode not in ENGINES:
+        raise HTTPException(status_code=400, detail=f"Unknown engine mode: {request.mode}")
+    if request.sort_by not in METRIC_KEYS:
+        raise HTTPException(status_code=400, detail=f"Unknown metric: {request.sort_by}")
+    try:
+        total = len(expand_grid(request.param_grid))
+    except (KeyError, TypeError, ValueError) as e:
+        raise HTTPException(status_code=400, detail=f"Invalid param_grid: {e}")
+    if total > settings.SWEEP_MAX_COMBOS:
+        raise HTTPException(status_code=400, detail=f"Too many combinations: {total} > {settings.SWEEP_MAX_COMBOS}")
+
+    try:
+        scheduled, total = submit_sweep(
+            user=x_user,
+            strategy_name=request.strategy,
+            symbol=request.symbol,
+            param_grid=request.param_grid,
+            start_date=request.start_date,
+            end_date=request.end_date,
+            initial_cash=request.initial_cash,
+            sort_by=request.sort_by,
+            top_n=request.top_n,
+            mode=request.mode
+        )
+    except SchedulerLimitExceeded as e:
+        raise HTTPException(status_code=429, detail=str(e))
+    return dict(submitted(scheduled), combinations=total)
+
+@router.post("/walk-forward")
+async def run_walk_forward(request: WalkForwardRequest, x_user: Optional[str] = Header(None)):
+    """
+    提交前推优化任务: 滚动窗口上训练段寻优、测试段验证，结果含每个窗口的最优参数和拼接后的样本外权益
     """
-    task_result = AsyncResult(task_id)
+    if request.strategy not in STRATEGIES:
+        raise HTTPException(status_code=400, detail=f"Unknown strategy: {request.strategy}")
+    for mode in (request.mode, request.oos_mode):
+        if mode not in ENGINES:
+            raise HTTPException(status_code=400, detail=f"Unknown engine mode: {mode}")
+    if request.sort_by not in METRIC_KEYS:
+        raise HTTPException(status_code=400, detail=f"Unknown metric: {request.sort_by}")
+    try:
+        timeframe_to_ms(request.timeframe)
+        for window in (request.train, request.test, request.step):
+            if window is not None:
+                parse_window(window)
+        total = len(expand_grid(request.param_grid))
+    except (KeyError, TypeError, ValueError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if total > settings.SWEEP_MAX_COMBOS:
+        raise HTTPException(status_code=400, detail=f"Too many combinations: {total} > {settings.SWEEP_MAX_COMBOS}")
+
+    try:
+        scheduled = submit_walk_forward(
+            user=x_user,
+            strategy_name=request.strategy,
+            symbol=request.symbol,
+            param_grid=request.param_grid,
+            start_date=request.start_date,
+            end_date=request.end_date,
+            train=request.train,
+            test=request.test,
+            step=request.step,
+            anchored=request.anchored,
+            timeframe=request.timeframe,
+            initial_cash=request.initial_cash,
+            sort_by=request.sort_by,
+            mode=request.mode,
+            oos_mode=request.oos_mode,
+        )
+    except SchedulerLimitExceeded as e:
+        raise HTTPException(status_code=429, detail=str(e))
+    return dict(submitted(scheduled), combinations=total)
+
+def expand_result(payload, fields: Optional[List[str]] = None, start: Optional[int] = None, end: Optional[int] = None):
+    """
+    任务返回的结果句柄 {"result_id", "metrics"} -> {"status": "success", "result": ...}
+    fields=["metrics"] 时只返回标量指标（不读取结果存储）；其余 fields 只取指定字段，
+    start/end（毫秒）只取该时间段内的 K 线/成交点/权益。结果已过期时返回 None
+    """
+    if not isinstance(payload, dict) or "result_id" not in payload:
+        return payload
+    if fields == ["metrics"]:
+        result = payload["metrics"]
+    else:
+        result = ResultStore().load(payload["result_id"], fields, start, end)
+        if result is None:
+            return None
+    return {"status": "success", "result_id": payload["result_id"], "result": result}
+
+def task_status(task_id: str, fields: Optional[List[str]] = None, start: Optional[int] = None, end: Optional[int] = None):
+    task_result = AsyncResult(task_id, app=celery_app)
     
     if task_result.state == 'PENDING':
         return {"state": "PENDING", "status": "Pending..."}
@@ -44,6 +229,9 @@ async def get_backtest_status(task_id: str):
                 "state": "FAILURE",
                 "error": result.get("error")
             }
+        result = expand_result(result, fields, start, end)
+        if result is None:
+            return {"state": "FAILURE", "error": "result expired"}
             
         return {
             "state": task_result.state,
@@ -55,6 +243,108 @@ async def get_backtest_status(task_id: str):
             "error": str(task_result.result)
         }
 
+def parse_fields(fields: Optional[str]) -> Optional[List[str]]:
+    return [f.strip() for f in fields.split(",") if f.strip()] if fields else None
+
+@router.get("/status/{task_id}")
+async def get_backtest_status(task_id: str, fields: Optional[str] = None,
+                              start: Optional[int] = None, end: Optional[int] = None):
+    """
+    查询回测任务状态
+    fields: 逗号分隔的结果字段（如 "chart_data,trade_markers"），"metrics" 只返回标量指标
+    start/end: 毫秒时间戳，只返回该区间内的 K 线/成交点（图表按需加载）
+    """
+    return task_status(task_id, parse_fields(fields), start, end)
+
+def sse(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
+def done_event(data, fields=None, start=None, end=None):
+    """done 消息中的结果句柄展开为完整结果（与 /status 相同）"""
+    if data.get("state") != "SUCCESS":
+        return data
+    result = expand_result(data.get("result"), fields, start, end)
+    if result is None:
+        return {"state": "FAILURE", "error": "result expired"}
+    return dict(data, result=result)
+
+@router.get("/stream/{task_id}")
+async def stream_backtest_progress(task_id: str, request: Request, fields: Optional[str] = None,
+                                   start: Optional[int] = None, end: Optional[int] = None):
+    """
+    以 Server-Sent Events 推送任务进度，替代轮询 /status:
+    event: progress  data: {bars, total_bars, equity, pnl, trades, max_drawdown, elapsed, eta, ...}
+    event: done      data: 与 /status 结束时的返回相同（fields/start/end 含义相同），之后连接关闭
+    连接时先补发最近一条消息；任务在此之前已结束（或没有进度记录）时直接返回结果
+    """
+    fields = parse_fields(fields)
+
+    def event(message):
+        data = message["data"]
+        if message["event"] == "done":
+            data = done_event(data, fields, start, end)
+        return sse(message["event"], data)
+
+    async def events():
+        queue, last = await progress_hub.subscribe(task_id)
+        try:
+            if last is not None:
+                yield event(last)
+                if last["event"] == "done":
+                    return
+            else:
+                status = task_status(task_id, fields, start, end)
+                if status["state"] in ("SUCCESS", "FAILURE"):
+                    yield sse("done", status)
+                    return
+            while True:
+                try:
+                    message = await asyncio.wait_for(queue.get(), timeout=STREAM_KEEPALIVE)
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected():
+                        return
+                    yield ": keep-alive\n\n"
+                    continue
+                yield event(message)
+                if message["event"] == "done":
+                    return
+        finally:
+            await progress_hub.unsubscribe(task_id, queue)
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@router.get("/chart")
+def get_chart_data(symbol: str, start: int, end: int, timeframe: str = "1h",
+                   max_points: int = Query(CHART_MAX_POINTS, ge=1, le=CHART_POINTS_LIMIT)):
+    """
+    按时间区间 [start, end]（毫秒时间戳）返回 K 线 [[epoch_ms, open, close, low, high], ...]
+    区间内 K 线数不超过 max_points 时为完整精度，图表放大时按需调用
+    """
+    try:
+        timeframe_to_ms(timeframe)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    bars = get_bar_source().read(symbol, timeframe, start, end + 1)
+    return {
+        "symbol": symbol,
+        "timeframe": timeframe,
+        "bars": len(bars['timestamp']),
+        "chart_data": chart_rows(bars['timestamp'], bars['open'], bars['high'], bars['low'], bars['close'], max_points),
+    }
+
+@router.get("/cache/stats")
+def get_cache_stats():
+    """
+    回测结果缓存命中统计
+    """
+    return ResultCache().stats()
+
 @router.get("/strategies")
 def list_strategies():
-    return ["SmaCross"]
+    return list(STRATEGIES)
+
+@router.get("/metrics")
+def list_metrics():
+    """可选的指标集合及其包含的指标"""
+    return METRIC_SETS
@@ -0,0 +1,164 @@
+import time
+import numpy as np
+import backtrader as bt
+from core.data.frame_feed import nums2ms
+
+
+class SymbolStats(bt.Analyzer):
+    """
+    组合回测中按标的统计: 已平仓交易数/胜率/已实现盈亏、期末持仓及浮动盈亏
+    （附加的大周期数据源不参与交易，不统计）
+    """
+    def create_analysis(self):
+        self.rets = {}
+        for data in self.strategy.trading_datas():
+            self.rets[data._name] = {'trades': 0, 'won': 0, 'realized_pnl': 0.0}
+
+    def notify_trade(self, trade):
+        if not trade.isclosed or trade.data._name not in self.rets:
+            return
+        stats = self.rets[trade.data._name]
+        stats['trades'] += 1
+        stats['won'] += trade.pnlcomm > 0
+        stats['realized_pnl'] += trade.pnlcomm
+
+    def stop(self):
+        for data in self.strategy.trading_datas():
+            stats = self.rets[data._name]
+            position = self.strategy.getposition(data)
+            stats['position'] = position.size
+            stats['position_value'] = position.size * data.close[0]
+            stats['unrealized_pnl'] = position.size * (data.close[0] - position.price) if position.size else 0.0
+            stats['pnl'] = stats['realized_pnl'] + stats['unrealized_pnl']
+            stats['win_rate'] = stats['won'] / max(1, stats['trades'])
+
+
+class _Columns(object):
+    """预分配的定长 numpy 列，写满时容量翻倍"""
+    def __init__(self, capacity, **dtypes):
+        self.n = 0
+        self.cols = {name: np.empty(capacity, dtype=dtype) for name, dtype in dtypes.items()}
+
+    def append(self, *values):
+        if self.n == len(next(iter(self.cols.values()))):
+            for name, col in self.cols.items():
+                self.cols[name] = np.concatenate([col, np.empty_like(col)])
+        for col, value in zip(self.cols.values(), values):
+            col[self.n] = value
+        self.n += 1
+
+    def arrays(self):
+        return {name: col[:self.n] for name, col in self.cols.items()}
+
+
+class Ledger(bt.Analyzer):
+    """
+    成交流水与逐根 K 线权益（含指标预热期），运行中只向预分配的 numpy 数组赋值，结束后按实际长度裁剪
+
+    rets: {
+        'datas': [数据源名称, ...],
+        'equity': {'timestamp', 'value'},                                   # 每根 K 线一条
+        'fills': {'timestamp', 'data', 'size', 'price', 'value', 'commission'},  # 每笔成交（含部分成交）一条
+        'trades': {'timestamp', 'data', 'pnl', 'pnlcomm'},                  # 每笔已平仓交易一条
+        'opened': 开仓的交易数,
+    }
+    data 为数据源在 datas 中的下标，size 为带符号的成交数量（卖出为负），时间均为毫秒时间戳
+    """
+    def start(self):
+        datas = self.strategy.datas
+        self._index = {id(data): i for i, data in enumerate(datas)}
+        capacity = max(1, max(data.buflen() for data in datas))
+        self._dt = np.empty(capacity, dtype=np.float64)
+        self._value = np.empty(capacity, dtype=np.float64)
+        self._n = 0
+        self._fills = _Columns(256, timestamp=np.float64, data=np.int32, size=np.float64, price=np.float64,
+                               value=np.float64, commission=np.float64)
+        self._trades = _Columns(64, timestamp=np.float64, data=np.int32, pnl=np.float64, pnlcomm=np.float64)
+        self._opened = 0
+
+    def notify_order(self, order):
+        if order.status not in (order.Partial, order.Completed):
+            return
+        data = self._index[id(order.data)]
+        for exbit in order.executed.iterpending():
+            if exbit is None:
+                break
+            # value 为成交额（bt 的 closedvalue 按开仓成本计，不用）
+            self._fills.append(exbit.dt, data, exbit.size, exbit.price,
+                               abs(exbit.size) * exbit.price, exbit.closedcomm + exbit.openedcomm)
+
+    def notify_trade(self, trade):
+        if trade.justopened:
+            self._opened += 1
+        elif trade.isclosed:
+            self._trades.append(trade.dtclose, self._index[id(trade.data)], trade.pnl, trade.pnlcomm)
+
+    def next(self):
+        n = self._n
+        if n == len(self._dt):
+            # 实盘/非预加载数据源 buflen 会增长
+            self._dt = np.concatenate([self._dt, np.empty_like(self._dt)])
+            self._value = np.concatenate([self._value, np.empty_like(self._value)])
+        self._dt[n] = self.data.datetime[0]
+        self._value[n] = self.strategy.broker.getvalue()
+        self._n = n + 1
+
+    def stop(self):
+        fills = self._fills.arrays()
+        fills['timestamp'] = nums2ms(fills['timestamp'])
+        trades = self._trades.arrays()
+        trades['timestamp'] = nums2ms(trades['timestamp'])
+        self.rets['datas'] = [data._name for data in self.strategy.datas]
+        self.rets['equity'] = {'timestamp': nums2ms(self._dt[:self._n]), 'value': self._value[:self._n].copy()}
+        self.rets['fills'] = fills
+        self.rets['trades'] = trades
+        self.rets['opened'] = self._opened
+
+
+class Progress(bt.Analyzer):
+    """
+    回测进度: 每 every 根 K 线调用一次 callback(bars=, total_bars=, equity=, pnl=, trades=, max_drawdown=, elapsed=, eta=)
+    callback 自行限频（见 core.progress.ProgressPublisher）
+    """
+    params = (
+        ('callback', None),
+        ('every', 100),
+    )
+
+    def start(self):
+        self.total = self.data.buflen()
+        self.bars = 0
+        self.trades = 0
+        self.peak = self.strategy.broker.getvalue()
+        self.max_drawdown = 0.0
+        self.started = time.monotonic()
+
+    def notify_trade(self, trade):
+        if trade.isclosed:
+            self.trades += 1
+
+    def next(self):
+        self.bars += 1
+        value = self.strategy.broker.getvalue()
+        if value > self.peak:
+            self.peak = value
+        elif self.peak > 0:
+            self.max_drawdown = max(self.max_drawdown, 100.0 * (self.peak - value) / self.peak)
+        if self.bars % self.p.every == 0:
+            self.report(value)
+
+    def stop(self):
+        self.report(self.strategy.broker.getvalue())
+
+    def report(self, value):
+        elapsed = time.monotonic() - self.started
+        self.p.callback(
+            bars=self.bars,
+            total_bars=self.total,
+            equity=value,
+            pnl=value - self.strategy.broker.startingcash,
+            trades=self.trades,
+            max_drawdown=self.max_drawdown,
+            elapsed=elapsed,
+            eta=elapsed * (self.total - self.bars) / self.bars if self.bars else None,
+        )
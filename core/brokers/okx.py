@@ -1,9 +1,19 @@
+import os
+import json
 import backtrader as bt
 import ccxt
+import redis
 import time
-from datetime import datetime, timedelta
+import queue
+import threading
+from datetime import datetime, timedelta, timezone
 from collections import deque
 from config.settings import settings
+from core.brokers.okx_ws import OKXStream
+from core.brokers.okx_bus import MarketDataBus
+from core.brokers.okx_account import AccountState
+from core.brokers.okx_orders import OrderTracker, OrderSubmitter
+from core.brokers.okx_limits import SharedRateLimiter, RequestCoalescer, LimitedExchange
 
 class OKXStore(object):
     """
@@ -18,139 +28,370 @@ class OKXStore(object):
         return cls._instance
 
     def __init__(self):
-        self.exchange = ccxt.okx({
+        exchange = ccxt.okx({
             'apiKey': settings.OKX_API_KEY,
             'secret': settings.OKX_SECRET,
             'password': settings.OKX_PASSPHRASE,
-            'enableRateLimit': True,
+            # 共享限频时由 LimitedExchange 按端点类别限速，ccxt 的进程内节流只会额外降低吞吐
+            'enableRateLimit': not settings.OKX_SHARED_RATE_LIMIT,
         })
         
         if settings.OKX_DEMO:
-            self.exchange.set_sandbox_mode(True)
+            exchange.set_sandbox_mode(True)
+        if settings.OKX_SHARED_RATE_LIMIT:
+            client = redis.Redis.from_url(settings.REDIS_URL)
+            exchange = LimitedExchange(exchange, SharedRateLimiter(client, account=settings.OKX_API_KEY),
+                                       RequestCoalescer(client))
+        self.exchange = exchange
+        self._stream = None
+        self._bus = None
+        self._session = None
+        self._lock = threading.Lock()
 
-    def get_broker(self):
-        return OKXBroker(store=self)
+    def markets_cache_path(self):
+        path = settings.OKX_MARKETS_CACHE
+        if settings.OKX_DEMO:
+            root, ext = os.path.splitext(path)
+            path = f"{root}_demo{ext}"
+        return path
+
+    def load_markets(self, reload=False):
+        """
+        加载交易对元数据，优先使用磁盘缓存（OKX_MARKETS_TTL 内有效），
+        避免每个新 worker 进程第一次请求时都要拉取完整的 markets
+        """
+        if self.exchange.markets and not reload:
+            return self.exchange.markets
+        path = self.markets_cache_path()
+        if not reload and os.path.exists(path) and time.time() - os.path.getmtime(path) < settings.OKX_MARKETS_TTL:
+            try:
+                with open(path) as f:
+                    cached = json.load(f)
+                self.exchange.set_markets(cached['markets'], cached.get('currencies'))
+                return self.exchange.markets
+            except (ValueError, KeyError) as e:
+                print(f"Ignoring broken markets cache {path}: {e}")
+
+        markets = self.exchange.load_markets(reload=True)
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump({'markets': markets, 'currencies': self.exchange.currencies}, f)
+        os.replace(tmp_path, path)
+        return markets
+
+    def get_stream(self):
+        """进程内共享的 WebSocket 行情连接"""
+        if self._stream is None:
+            self._stream = OKXStream()
+        return self._stream
+
+    def get_bus(self):
+        """进程内共享的 K 线总线: 每个品种/周期只订阅一次、只补一次数据"""
+        with self._lock:
+            if self._bus is None:
+                self._bus = MarketDataBus(self.exchange, self.get_stream())
+            return self._bus
+
+    def get_session(self):
+        """进程内共享的交易会话: 所有 OKXBroker 共用一份账户缓存、订单跟踪和下单队列"""
+        with self._lock:
+            if self._session is None:
+                self._session = OKXSession(self.exchange)
+            return self._session
+
+    def get_broker(self, **kwargs):
+        return OKXBroker(store=self, **kwargs)
 
     def get_data(self, symbol, timeframe=bt.TimeFrame.Minutes, compression=1, **kwargs):
         return OKXData(store=self, symbol=symbol, timeframe=timeframe, compression=compression, **kwargs)
 
+class OKXSession(object):
+    """
+    OKX 交易会话: 余额缓存、订单状态机、下单队列和一个后台轮询线程
+
+    同一进程内的多个 OKXBroker（多个策略）共用一个会话，交易所请求和限频额度不随策略数增加。
+    按引用计数启停，第一个 broker 启动时刷新余额并启动后台线程，最后一个停止时关闭。
+    """
+    def __init__(self, exchange, ttl=None, batch_window=0.05):
+        self.exchange = exchange
+        self.account = AccountState(exchange)
+        self.orders = OrderTracker(exchange)
+        self.submitter = OrderSubmitter(exchange, self.orders, batch_window=batch_window)
+        self._ttl = ttl or settings.OKX_ACCOUNT_TTL
+        self._stop_event = threading.Event()
+        self._poller = None
+        self._users = 0
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            self._users += 1
+            if self._users > 1:
+                return
+            try:
+                self.account.refresh()
+            except Exception as e:
+                print(f"Error fetching balance: {e}")
+            self._stop_event.clear()
+            self._poller = threading.Thread(target=self._poll, name="okx-account", daemon=True)
+            self._poller.start()
+            self.submitter.start()
+
+    def stop(self):
+        with self._lock:
+            self._users -= 1
+            if self._users > 0:
+                return
+            self.submitter.stop()
+            self._stop_event.set()
+            if self._poller is not None:
+                self._poller.join(timeout=5)
+        print(f"OKX submit->ack latency: {self.submitter.latency.summary()}")
+
+    def _poll(self):
+        while not self._stop_event.wait(self._ttl):
+            try:
+                # 先对账订单再刷新余额，成交事件被 next() 应用时余额通常已包含这些成交
+                self.orders.reconcile()
+                self.account.refresh()
+            except Exception as e:
+                print(f"Error polling OKX account: {e}")
+
+
 class OKXBroker(bt.BrokerBase):
     """
     Custom Broker for OKX via CCXT
+
+    余额由 AccountState 缓存、订单由 OrderTracker 跟踪，二者都在会话的后台线程中按 OKX_ACCOUNT_TTL 轮询刷新；
+    getcash/getvalue/getposition 只读本地状态，成交在 next() 中应用（backtrader 主线程），
+    策略的 next() 不会因为查询账户而阻塞在网络请求上。
+    下单/撤单由 OrderSubmitter 在后台线程发送，同一根 K 线上的订单合并为批量下单。
+    账户缓存、订单跟踪和下单队列属于 store 的 OKXSession，同一进程内的多个 broker 共用，
+    每个 broker 只处理自己订单的事件、只维护自己订单形成的持仓。
     """
+    params = (
+        ('quote', 'USDT'),  # 计价货币
+        ('seed_positions', True),  # 以启动时的账户余额作为初始持仓；多个策略共用账户时应为 False
+    )
+
     def __init__(self, store):
         super().__init__()
         self.store = store
         self.exchange = store.exchange
-        self._cash = 0
-        self._value = 0
+        self.session = store.get_session()
+        self.account = self.session.account
+        self.orders = self.session.orders
+        self.submitter = self.session.submitter
+        self.positions = {}
+        self._initial_balance = {}
+        self.notifs = deque()
+
+    def start(self):
+        super().start()
+        self.session.start()
+        self.startingcash = self.getcash()
+        # 启动时的余额快照作为初始持仓，之后的持仓变化只来自 next() 中应用的成交
+        self._initial_balance = dict(self.account.total) if self.p.seed_positions else {}
+
+    def stop(self):
+        super().stop()
+        self.session.stop()
+        self.orders.release(self)
 
     def getcash(self):
-        # Fetch balance from OKX
-        try:
-            balance = self.exchange.fetch_balance()
-            # Assuming USDT based trading for simplicity in total value calculation
-            self._cash = balance['USDT']['free'] if 'USDT' in balance else 0
-            self._value = balance['total']['USDT'] if 'USDT' in balance.get('total', {}) else 0
-        except Exception as e:
-            print(f"Error fetching balance: {e}")
-        return self._cash
-
-    def getvalue(self):
-        self.getcash() # Update value
-        return self._value
+        return self.account.available(self.p.quote)
+
+    def getvalue(self, datas=None):
+        value = self.account.balance(self.p.quote)
+        for data in datas or self.positions:
+            position = self.positions.get(data)
+            if position is not None and position.size and len(data):
+                value += position.size * data.close[0]
+        return value
 
     def getposition(self, data):
-        # TODO: Implement position fetching
-        # CCXT fetch_positions or fetch_balance depending on spot/futures
-        return super().getposition(data)
+        position = self.positions.get(data)
+        if position is None:
+            # 现货持仓即账户中的基础货币余额
+            size = self._initial_balance.get(self._base(data)) or 0.0
+            price = data.close[0] if size and len(data) else 0.0
+            position = self.positions[data] = bt.Position(size, price)
+        return position
 
-    def submit(self, order):
-        # Place order via CCXT
-        symbol = order.data.dataname
-        side = 'buy' if order.isbuy() else 'sell'
-        order_type = 'market' if order.exectype == bt.Order.Market else 'limit'
-        amount = order.size
-        price = order.price if order_type == 'limit' else None
+    def _base(self, data):
+        return data.symbol.split('/')[0]
+
+    def notify(self, order):
+        self.notifs.append(order.clone())
 
+    def get_notification(self):
         try:
-            print(f"Submitting OKX Order: {side} {amount} {symbol} @ {price or 'Market'}")
-            # CCXT create_order(symbol, type, side, amount, price=None, params={})
-            response = self.exchange.create_order(symbol, order_type, side, amount, price)
-            order.submit(self)
-            order.completed() # In real implementation, we should track status via fetch_order
-            print(f"OKX Order Placed: {response['id']}")
-            return order
-        except Exception as e:
-            print(f"OKX Order Failed: {e}")
-            order.reject(self)
+            return self.notifs.popleft()
+        except IndexError:
             return None
 
+    def buy(self, owner, data, size, price=None, plimit=None,
+            exectype=None, valid=None, tradeid=0, oco=None,
+            trailamount=None, trailpercent=None, **kwargs):
+        order = bt.BuyOrder(owner=owner, data=data, size=size, price=price, pricelimit=plimit,
+                            exectype=exectype, valid=valid, tradeid=tradeid)
+        order.addinfo(**kwargs)
+        order.addcomminfo(self.getcommissioninfo(data))
+        return self.submit(order)
+
+    def sell(self, owner, data, size, price=None, plimit=None,
+             exectype=None, valid=None, tradeid=0, oco=None,
+             trailamount=None, trailpercent=None, **kwargs):
+        order = bt.SellOrder(owner=owner, data=data, size=size, price=price, pricelimit=plimit,
+                             exectype=exectype, valid=valid, tradeid=tradeid)
+        order.addinfo(**kwargs)
+        order.addcomminfo(self.getcommissioninfo(data))
+        return self.submit(order)
+
+    def submit(self, order):
+        # 只入队，由 OrderSubmitter 在后台线程中（批量）下单，确认结果在 next() 中通知
+        order_type = 'market' if order.exectype in (None, bt.Order.Market) else 'limit'
+        request = {
+            'symbol': order.data.symbol,
+            'type': order_type,
+            'side': 'buy' if order.isbuy() else 'sell',
+            'amount': abs(order.size),
+            'price': order.price if order_type == 'limit' else None,
+        }
+        print(f"Submitting OKX Order: {request['side']} {request['amount']} {request['symbol']} "
+              f"@ {request['price'] or 'Market'}")
+        order.submit(self)
+        self.notify(order)
+        self.submitter.submit(order, request)
+        return order
+
+    def cancel(self, order):
+        if order.alive():
+            self.submitter.cancel(order)
+
+    def next(self):
+        for event in self.orders.drain(self):
+            kind, order = event[0], event[1]
+            if kind == 'fill':
+                self._execute(order, *event[2:])
+                continue
+            if not order.alive():
+                continue
+            if kind == 'accepted':
+                order.accept(self)
+            elif kind == 'completed':
+                order.completed()  # 交易所已完结但成交量与下单量不一致（如市价单按金额成交）
+            elif kind == 'canceled':
+                order.cancel()
+            else:
+                order.reject(self)
+            self.notify(order)
+
+    def _execute(self, order, size, price, fee, dt):
+        data = order.data
+        size = size if order.isbuy() else -size
+        position = self.getposition(data)
+        pprice_orig = position.price
+        psize, pprice, opened, closed = position.update(size, price)
+
+        comminfo = self.getcommissioninfo(data)
+        closedvalue = comminfo.getoperationcost(closed, pprice_orig)
+        openedvalue = comminfo.getoperationcost(opened, price)
+        closedcomm = fee if closed else 0.0
+        openedcomm = fee - closedcomm
+        pnl = comminfo.profitandloss(-closed, pprice_orig, price)
+
+        dt = bt.date2num(dt) if dt is not None else data.datetime[0]
+        order.execute(dt, size, price, closed, closedvalue, closedcomm,
+                      opened, openedvalue, openedcomm, 0.0, pnl, psize, pprice)
+        self.notify(order)
+
 class OKXData(bt.feed.DataBase):
     """
-    Polling Data Feed for OKX using CCXT
+    Push-based live Data Feed for OKX
+
+    通过 store 的 MarketDataBus 订阅 OKX WebSocket candle 频道，已收盘的 K 线经由队列交给 backtrader。
+    同一品种/周期的多个数据源共用一次订阅和一次 REST 补数（启动预热与断线重连）；
+    队列为空时 _load 返回 None（实时数据源语义），不会让 backtrader 认为数据已结束。
     """
+    params = (
+        ('backfill', 100),  # 启动时通过 REST 预加载的已收盘 K 线数（用于指标预热）
+        ('qcheck', 0.5),  # 队列为空时最多等待的秒数
+    )
+
+    _STOP = object()
+
     def __init__(self, store, symbol, **kwargs):
         super().__init__(**kwargs)
         self.store = store
         self.symbol = symbol
         self.exchange = store.exchange
-        self.last_dt = None
+        self.last_ts = None
+        self._queue = queue.Queue()
+        self._on_candle = self._queue.put  # 总线回调（取消订阅时按同一对象匹配）
         
         # Set timeframe string for CCXT
         self.tf_map = {
-            bt.TimeFrame.Minutes: '1m',
-            bt.TimeFrame.Days: '1d',
+            (bt.TimeFrame.Minutes, 1): '1m',
+            (bt.TimeFrame.Minutes, 3): '3m',
+            (bt.TimeFrame.Minutes, 5): '5m',
+            (bt.TimeFrame.Minutes, 15): '15m',
+            (bt.TimeFrame.Minutes, 30): '30m',
+            (bt.TimeFrame.Minutes, 60): '1h',
+            (bt.TimeFrame.Minutes, 120): '2h',
+            (bt.TimeFrame.Minutes, 240): '4h',
+            (bt.TimeFrame.Days, 1): '1d',
         }
-        self.ccxt_tf = self.tf_map.get(self.p.timeframe, '1m')
+        key = (self.p.timeframe, self.p.compression)
+        if key not in self.tf_map:
+            raise ValueError(f"Unsupported OKX timeframe: {self.p.compression} {bt.TimeFrame.getname(*key)}")
+        self.ccxt_tf = self.tf_map[key]
+
+    def islive(self):
+        return True
+
+    def haslivedata(self):
+        return not self._queue.empty()
 
     def start(self):
         super().start()
-        # Initial fetch could be done here
+        self.put_notification(self.DELAYED)
+        self.bus = self.store.get_bus()
+        self.bus.subscribe(self.symbol, self.ccxt_tf, self._on_candle, backfill=self.p.backfill)
+        self.put_notification(self.LIVE)
+
+    def stop(self):
+        super().stop()
+        # start() 可能在取得总线之前就失败了
+        bus = getattr(self, 'bus', None)
+        if bus is not None:
+            bus.unsubscribe(self.symbol, self.ccxt_tf, self._on_candle)
+        self._queue.put(self._STOP)
 
     def _load(self):
-        # Poll for new data
-        # In a real live feed, we need to manage time and sleep to avoid rate limits
-        # Backtrader calls _load in a loop.
-        
-        try:
-            # Fetch last few candles
-            ohlcv = self.exchange.fetch_ohlcv(self.symbol, self.ccxt_tf, limit=5)
-            if not ohlcv:
+        while True:
+            try:
+                candle = self._queue.get(timeout=self._qcheck)
+            except queue.Empty:
+                return None  # 暂无新数据，实时数据源继续等待
+            if candle is self._STOP:
                 return False
-            
-            # Get the latest completed candle (usually index -2, or -1 if just closed)
-            # CCXT returns [timestamp, open, high, low, close, volume]
-            # timestamp is ms
-            
-            last_candle = ohlcv[-1]
-            dt = datetime.fromtimestamp(last_candle[0] / 1000.0)
-            
-            if self.last_dt and dt <= self.last_dt:
-                # No new data yet
-                # Return False or create a delay?
-                # Backtrader expects _load to return True if data is loaded
-                # For live feeds, we often need to handle 'no new data' gracefully
-                # A simple trick in polling feeds is to return False but not stop the feed
-                # But bt DataBase stops if False is returned. 
-                # We need to wait here until new data arrives for 'Live' feel or use a Queue
-                time.sleep(5) # Simple polling wait
-                return False # Retry logic needed or better architecture
-            
-            self.last_dt = dt
-            
+
+            # 推送与 REST 补齐可能重复，只接受更新的 K 线
+            if self.last_ts is not None and candle[0] <= self.last_ts:
+                continue
+            self.last_ts = candle[0]
+
+            dt = datetime.fromtimestamp(candle[0] / 1000.0, tz=timezone.utc).replace(tzinfo=None)
             self.lines.datetime[0] = bt.date2num(dt)
-            self.lines.open[0] = last_candle[1]
-            self.lines.high[0] = last_candle[2]
-            self.lines.low[0] = last_candle[3]
-            self.lines.close[0] = last_candle[4]
-            self.lines.volume[0] = last_candle[5]
-            
+            self.lines.open[0] = candle[1]
+            self.lines.high[0] = candle[2]
+            self.lines.low[0] = candle[3]
+            self.lines.close[0] = candle[4]
+            self.lines.volume[0] = candle[5]
+            self.lines.openinterest[0] = 0.0
             return True
-            
-        except Exception as e:
-            print(f"Error fetching OKX data: {e}")
-            return False
 
 
 if __name__ == "__main__":
@@ -161,6 +402,7 @@ if __name__ == "__main__":
     
     okx_store = OKXStore.get_instance()
     okxBroker = okx_store.get_broker()
+    okxBroker.account.refresh()
     print(okxBroker.getcash())
     
     symbol = "BTC/USDT"
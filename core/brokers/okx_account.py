@@ -0,0 +1,47 @@
+import time
+import threading
+
+
+class AccountState(object):
+    """
+    OKX 账户余额缓存
+
+    由 OKXBroker 的后台线程定期 refresh()，getcash/getvalue 等只读取缓存，不访问网络。
+    """
+    def __init__(self, exchange, quote='USDT'):
+        self.exchange = exchange
+        self.quote = quote
+        self.free = {}
+        self.total = {}
+        self.updated = None
+        self._lock = threading.Lock()
+
+    def refresh(self):
+        balance = self.exchange.fetch_balance()
+        with self._lock:
+            self.free = dict(balance.get('free') or {})
+            self.total = dict(balance.get('total') or {})
+            self.updated = time.time()
+
+    @property
+    def cash(self):
+        with self._lock:
+            return self.free.get(self.quote) or 0.0
+
+    @property
+    def equity_cash(self):
+        """计价货币总额（含挂单冻结部分）"""
+        with self._lock:
+            return self.total.get(self.quote) or 0.0
+
+    def available(self, currency):
+        """可用余额（不含挂单冻结部分）"""
+        with self._lock:
+            return self.free.get(currency) or 0.0
+
+    def balance(self, currency):
+        with self._lock:
+            return self.total.get(currency) or 0.0
+
+    def age(self):
+        return time.time() - self.updated if self.updated else None
@@ -0,0 +1,145 @@
+import time
+import threading
+from collections import deque
+from core.brokers.okx_ws import candle_channel, parse_candles
+from core.data.bar_store import timeframe_to_ms
+
+
+class _Topic(object):
+    def __init__(self, symbol, timeframe, history):
+        self.symbol = symbol
+        self.timeframe = timeframe
+        self.channel = candle_channel(timeframe)
+        self.step = timeframe_to_ms(timeframe)
+        self.candles = deque(maxlen=history)  # 最近的已收盘 K 线
+        self.loaded = 0  # 已通过 REST 预加载的根数
+        self.subscribers = []
+        self.lock = threading.RLock()
+        self.callback = None
+        self.catching_up = False  # REST 补数进行中，期间的推送先暂存在 pending
+        self.pending = []
+
+    @property
+    def last_ts(self):
+        return self.candles[-1][0] if self.candles else None
+
+
+class MarketDataBus(object):
+    """
+    进程内共享的 K 线总线
+
+    每个 (symbol, timeframe) 只订阅一次 WebSocket 频道，启动/断线重连时只做一次 REST 补数，
+    已收盘 K 线去重后按时间顺序广播给所有订阅者（如同一品种上多个策略的 OKXData）。
+    重连或推送的 K 线与上一根不连续时通过 REST 补齐缺口，补数期间的推送暂存，与补到的 K 线按时间合并后再广播。
+    最近 history 根 K 线留在内存中，后加入的订阅者直接回放用于指标预热，不再请求交易所。
+    回调在 WebSocket 线程或补数线程中执行，必须是非阻塞的（例如放入 queue）。
+    """
+    def __init__(self, exchange, stream, history=1000):
+        self.exchange = exchange
+        self.stream = stream
+        self.history = history
+        self._topics = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, symbol, timeframe, callback, backfill=100):
+        """订阅 K 线，先回放最近 backfill 根已收盘 K 线，之后推送新 K 线"""
+        key = (symbol, timeframe)
+        with self._lock:
+            topic = self._topics.get(key)
+            first = topic is None
+            if first:
+                topic = self._topics[key] = _Topic(symbol, timeframe, max(self.history, backfill))
+        # REST 请求不持有锁，避免阻塞 WebSocket 线程的广播
+        fetched = self._fetch(topic, limit=backfill) if backfill > topic.loaded else None
+        with topic.lock:
+            if fetched is not None:
+                self._merge(topic, fetched, backfill)
+            replay = list(topic.candles)[-backfill:] if backfill else []
+            for candle in replay:
+                callback(candle)
+            topic.subscribers.append(callback)
+        if first:
+            topic.callback = lambda arg, rows: self._on_push(topic, parse_candles(rows))
+            self.stream.subscribe(topic.channel, symbol, topic.callback, on_reconnect=lambda: self._catch_up(topic))
+
+    def unsubscribe(self, symbol, timeframe, callback):
+        key = (symbol, timeframe)
+        with self._lock:
+            topic = self._topics.get(key)
+            if topic is None:
+                return
+            with topic.lock:
+                topic.subscribers = [cb for cb in topic.subscribers if cb is not callback]
+                if topic.subscribers:
+                    return
+            self._topics.pop(key)
+        self.stream.unsubscribe(topic.channel, symbol, topic.callback)
+
+    def subscribers(self, symbol, timeframe):
+        topic = self._topics.get((symbol, timeframe))
+        return len(topic.subscribers) if topic is not None else 0
+
+    def _fetch(self, topic, since=None, limit=None):
+        try:
+            ohlcv = self.exchange.fetch_ohlcv(topic.symbol, topic.timeframe, since=since, limit=limit or 100)
+        except Exception as e:
+            print(f"Error backfilling OKX data: {e}")
+            return []
+        closed_before = int(time.time() * 1000) // topic.step * topic.step
+        return [candle for candle in ohlcv if candle[0] < closed_before]
+
+    def _merge(self, topic, candles, limit):
+        """预加载的更早 K 线并入历史（已广播过的不再重复推送）"""
+        known = {candle[0] for candle in topic.candles}
+        merged = [c for c in candles if c[0] not in known] + list(topic.candles)
+        merged.sort(key=lambda c: c[0])
+        topic.candles.clear()
+        topic.candles.extend(merged)
+        topic.loaded = max(topic.loaded, limit)
+
+    def _on_push(self, topic, candles):
+        """WebSocket 推送: 补数期间暂存；与上一根之间有缺口（如重连后补数任务还没开始）时先补数"""
+        with topic.lock:
+            if topic.catching_up:
+                topic.pending.extend(candles)
+                return
+            last_ts = topic.last_ts
+            if last_ts is None or not candles or candles[0][0] <= last_ts + topic.step:
+                self._publish(topic, candles)
+                return
+            topic.catching_up = True
+            topic.pending.extend(candles)
+            since = last_ts + topic.step
+        threading.Thread(target=self._fill, args=(topic, since), name="okx-catch-up", daemon=True).start()
+
+    def _catch_up(self, topic):
+        """断线重连后通过 REST 补齐最后一根之后已收盘的 K 线"""
+        with topic.lock:
+            if topic.catching_up or topic.last_ts is None:
+                return
+            topic.catching_up = True
+            since = topic.last_ts + topic.step
+        self._fill(topic, since)
+
+    def _fill(self, topic, since):
+        """REST 补数，与期间暂存的推送按时间合并（同一时间戳以推送为准）后广播"""
+        fetched = self._fetch(topic, since=since)
+        with topic.lock:
+            merged = {candle[0]: candle for candle in fetched}
+            merged.update((candle[0], candle) for candle in topic.pending)
+            topic.pending = []
+            topic.catching_up = False
+            self._publish(topic, [merged[ts] for ts in sorted(merged)])
+
+    def _publish(self, topic, candles):
+        with topic.lock:
+            for candle in candles:
+                # 推送与 REST 补数可能重复，只广播更新的 K 线
+                if topic.last_ts is not None and candle[0] <= topic.last_ts:
+                    continue
+                topic.candles.append(candle)
+                for callback in topic.subscribers:
+                    try:
+                        callback(candle)
+                    except Exception as e:
+                        print(f"Market data subscriber error: {e}")
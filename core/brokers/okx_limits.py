@@ -0,0 +1,298 @@
+import json
+import time
+import uuid
+import hashlib
+import threading
+import redis
+from config.settings import settings
+
+# 端点类别 -> (窗口内请求数, 窗口秒数, 是否按账户计)，取自 OKX 官方限频
+ENDPOINT_CLASSES = {
+    'candles': (20, 2.0, False),    # market/candles、market/history-candles
+    'market': (20, 2.0, False),     # ticker、books、trades
+    'public': (20, 2.0, False),     # public/instruments 等元数据
+    'account': (10, 2.0, True),     # account/balance、positions
+    'query': (60, 2.0, True),       # trade/order、orders-pending、fills
+    'trade': (60, 2.0, True),       # trade/order、cancel-order
+    'batch': (300, 2.0, True),      # trade/batch-orders（按订单数计）
+}
+
+# ccxt 方法 -> 端点类别
+METHOD_CLASSES = {
+    'fetch_ohlcv': 'candles',
+    'fetch_ticker': 'market',
+    'fetch_tickers': 'market',
+    'fetch_order_book': 'market',
+    'fetch_trades': 'market',
+    'load_markets': 'public',
+    'fetch_markets': 'public',
+    'fetch_balance': 'account',
+    'fetch_positions': 'account',
+    'fetch_order': 'query',
+    'fetch_open_orders': 'query',
+    'fetch_closed_orders': 'query',
+    'fetch_my_trades': 'query',
+    'create_order': 'trade',
+    'cancel_order': 'trade',
+    'edit_order': 'trade',
+    'create_orders': 'batch',
+}
+
+# 只读的公共行情请求可以合并（私有接口的结果与下单时序相关，不合并）
+COALESCED_METHODS = ('fetch_ohlcv', 'fetch_ticker', 'fetch_tickers', 'fetch_order_book', 'fetch_trades')
+
+# Redis 出错后这段时间内不再尝试（秒），避免每次请求都等待连接超时
+REDIS_RETRY_AFTER = 30.0
+
+# 原子地补充令牌并尝试取出 cost 个；返回需要等待的毫秒数（0 为已取得）。时间取 Redis 服务器时钟，各主机时钟不一致也没关系
+_ACQUIRE = """
+local rate = tonumber(ARGV[1])
+local capacity = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local t = redis.call('TIME')
+local now = tonumber(t[1]) * 1000 + tonumber(t[2]) / 1000
+local b = redis.call('HMGET', KEYS[1], 'tokens', 'ts', 'paused')
+local tokens = tonumber(b[1]) or capacity
+local ts = tonumber(b[2]) or now
+local paused = tonumber(b[3]) or 0
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate / 1000)
+local wait = 0
+if now < paused then
+    wait = paused - now
+elseif tokens >= cost then
+    tokens = tokens - cost
+else
+    wait = (cost - tokens) * 1000 / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+redis.call('PEXPIRE', KEYS[1], math.ceil(math.max(paused - now, 0) + capacity * 1000 / rate) + 60000)
+return tostring(wait)
+"""
+
+# 收到 429 后所有进程一起暂停 ARGV[1] 毫秒并清空令牌
+_PENALIZE = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) * 1000 + tonumber(t[2]) / 1000
+local paused = math.max(tonumber(redis.call('HGET', KEYS[1], 'paused')) or 0, now + tonumber(ARGV[1]))
+redis.call('HSET', KEYS[1], 'paused', paused, 'tokens', 0, 'ts', now)
+redis.call('PEXPIRE', KEYS[1], math.ceil(paused - now) + 60000)
+return 1
+"""
+
+
+class SharedRateLimiter(object):
+    """
+    跨进程共享的令牌桶限频（Redis，每个端点类别一个桶）
+
+    所有 Celery worker 子进程、实盘引擎和 API 共用 OKX 的限频额度，而不是各自以为独占整个额度。
+    额度按 OKX_RATE_LIMIT_SCALE 打折留出余量；私有接口的桶按 API key 区分。
+    Redis 不可用时（REDIS_RETRY_AFTER 秒内）退化为进程内令牌桶（core.data.history.TokenBucket），不阻断交易所请求。
+    """
+    PREFIX = "okx:ratelimit:"
+
+    def __init__(self, client=None, classes=None, scale=None, account=''):
+        self.client = client or redis.Redis.from_url(settings.REDIS_URL)
+        self.classes = classes or ENDPOINT_CLASSES
+        self.scale = settings.OKX_RATE_LIMIT_SCALE if scale is None else scale
+        self.account = hashlib.sha256(account.encode()).hexdigest()[:12] if account else ''
+        self._acquire = self.client.register_script(_ACQUIRE)
+        self._penalize = self.client.register_script(_PENALIZE)
+        self._local = {}
+        self._down_until = 0.0
+        self._lock = threading.Lock()
+
+    def limits(self, name):
+        """(每秒令牌数, 突发容量)；容量 + 速率 × 窗口 不超过窗口内的请求数，任意窗口内都不会超限"""
+        requests, window, _ = self.classes[name]
+        rate = requests * self.scale / window
+        return rate, max(1.0, requests - rate * window)
+
+    def key(self, name):
+        private = self.classes[name][2]
+        return f"{self.PREFIX}{name}:{self.account}" if private and self.account else self.PREFIX + name
+
+    def acquire(self, name, cost=1):
+        """阻塞直到取得 cost 个令牌（cost 超过突发容量时按容量计）"""
+        rate, capacity = self.limits(name)
+        cost = min(cost, capacity)
+        while True:
+            if time.monotonic() < self._down_until:
+                self._fallback(name).acquire()
+                return
+            try:
+                wait_ms = float(self._acquire(keys=[self.key(name)], args=[rate, capacity, cost]))
+            except redis.RedisError as e:
+                self._unavailable(e)
+                continue
+            if wait_ms <= 0:
+                return
+            time.sleep(wait_ms / 1000.0)
+
+    def penalize(self, name, seconds):
+        if time.monotonic() >= self._down_until:
+            try:
+                self._penalize(keys=[self.key(name)], args=[int(seconds * 1000)])
+                return
+            except redis.RedisError as e:
+                self._unavailable(e)
+        self._fallback(name).penalize(seconds)
+
+    def _unavailable(self, error):
+        print(f"Shared rate limiter unavailable for {REDIS_RETRY_AFTER:.0f}s, using per-process limits: {error}")
+        self._down_until = time.monotonic() + REDIS_RETRY_AFTER
+
+    def _fallback(self, name):
+        with self._lock:
+            bucket = self._local.get(name)
+            if bucket is None:
+                from core.data.history import TokenBucket
+                rate, capacity = self.limits(name)
+                bucket = self._local[name] = TokenBucket(rate, capacity)
+            return bucket
+
+
+class _Flight(object):
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class RequestCoalescer(object):
+    """
+    合并相同的并发请求（同一方法和参数，如 symbol/timeframe/since 相同的 fetch_ohlcv）
+
+    进程内: 后到的线程等待第一个线程的结果；跨进程: 第一个进程用 SET NX 占住请求，结果写入 Redis
+    保留 ttl 秒，其他进程轮询取用。发起请求的进程失败时不写结果，等待者随后自己重新发起。
+    ttl <= 0 时只做进程内合并。
+    """
+    PREFIX = "okx:coalesce:"
+
+    def __init__(self, client=None, ttl=None, timeout=30.0, poll=0.01):
+        self.client = client
+        self.ttl = settings.OKX_COALESCE_TTL if ttl is None else ttl
+        self.timeout = timeout
+        self.poll = poll
+        self._flights = {}
+        self._down_until = 0.0
+        self._lock = threading.Lock()
+        self.calls = 0  # 实际发起的请求数
+        self.shared = 0  # 由其他线程/进程的结果满足的请求数
+
+    @staticmethod
+    def request_key(method, *args, **kwargs):
+        payload = json.dumps([method, args, kwargs], sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode()).hexdigest()[:32]
+
+    def call(self, key, fn):
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+        if not leader:
+            flight.done.wait()
+            self.shared += 1
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        try:
+            # ttl <= 0 时结果不跨进程共享，只做进程内合并，不访问 Redis
+            shared = self.client is not None and self.ttl > 0 and time.monotonic() >= self._down_until
+            flight.result = self._call_shared(key, fn) if shared else self._call(fn)
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                self._flights.pop(key, None)
+            flight.done.set()
+        return flight.result
+
+    def _call(self, fn):
+        self.calls += 1
+        return fn()
+
+    def _unavailable(self, error):
+        print(f"Cross-process request coalescing unavailable for {REDIS_RETRY_AFTER:.0f}s: {error}")
+        self._down_until = time.monotonic() + REDIS_RETRY_AFTER
+
+    def _call_shared(self, key, fn):
+        lock_key, result_key = f"{self.PREFIX}lock:{key}", f"{self.PREFIX}result:{key}"
+        token = uuid.uuid4().hex
+        deadline = time.monotonic() + self.timeout
+        try:
+            while True:
+                raw = self.client.get(result_key)
+                if raw is not None:
+                    self.shared += 1
+                    return json.loads(raw)
+                if self.client.set(lock_key, token, nx=True, px=int(self.timeout * 1000)):
+                    break
+                if time.monotonic() > deadline:
+                    # 发起请求的进程可能已经卡死，不再等待
+                    return self._call(fn)
+                time.sleep(self.poll)
+        except redis.RedisError as e:
+            self._unavailable(e)
+            return self._call(fn)
+
+        try:
+            result = self._call(fn)
+            try:
+                self.client.set(result_key, json.dumps(result, default=str), px=int(self.ttl * 1000))
+            except redis.RedisError as e:
+                # 结果已经取到（令牌也已消耗），只是无法共享给其他进程
+                self._unavailable(e)
+            return result
+        finally:
+            try:
+                if self.client.get(lock_key) == token.encode():
+                    self.client.delete(lock_key)
+            except redis.RedisError:
+                pass
+
+
+class LimitedExchange(object):
+    """
+    ccxt 交易所的代理: METHOD_CLASSES 中的方法先从共享令牌桶取令牌，公共行情请求经 RequestCoalescer 合并；
+    收到 429（RateLimitExceeded/DDoSProtection）时暂停该类别的共享桶后原样抛出，由调用方决定是否重试。
+    其余属性和方法直接转发给原交易所对象。
+    """
+    def __init__(self, exchange, limiter, coalescer=None, penalty=1.0):
+        self.exchange = exchange
+        self.limiter = limiter
+        self.coalescer = coalescer
+        self.penalty = penalty
+        self._methods = {}
+
+    def __getattr__(self, name):
+        attr = getattr(self.exchange, name)
+        endpoint = METHOD_CLASSES.get(name)
+        if endpoint is None or not callable(attr):
+            return attr
+        method = self._methods.get(name)
+        if method is None:
+            method = self._methods[name] = self._wrap(name, attr, endpoint)
+        return method
+
+    def _wrap(self, name, fn, endpoint):
+        import ccxt
+
+        def limited(*args, **kwargs):
+            # 批量下单按订单数消耗令牌
+            self.limiter.acquire(endpoint, len(args[0]) if name == 'create_orders' and args else 1)
+            try:
+                return fn(*args, **kwargs)
+            except (ccxt.RateLimitExceeded, ccxt.DDoSProtection):
+                self.limiter.penalize(endpoint, self.penalty)
+                raise
+
+        if self.coalescer is None or name not in COALESCED_METHODS:
+            return limited
+
+        def coalesced(*args, **kwargs):
+            return self.coalescer.call(self.coalescer.request_key(name, *args, **kwargs),
+                                       lambda: limited(*args, **kwargs))
+        return coalesced
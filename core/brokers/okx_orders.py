@@ -0,0 +1,302 @@
+import time
+import uuid
+import queue
+import bisect
+import threading
+from datetime import datetime, timezone
+
+# ccxt 订单状态 -> 终态事件
+FINAL_STATES = {
+    'closed': 'completed',
+    'canceled': 'canceled',
+    'expired': 'canceled',
+    'rejected': 'rejected',
+}
+
+
+class TrackedOrder(object):
+    def __init__(self, order, exchange_id, symbol):
+        self.order = order
+        self.exchange_id = exchange_id
+        self.symbol = symbol
+        self.filled = 0.0
+        self.cost = 0.0
+        self.fee = 0.0
+
+
+class OrderTracker(object):
+    """
+    OKX 订单状态机: Submitted -> Accepted -> Partial -> Completed / Canceled / Rejected
+
+    reconcile() 在后台线程中执行: 先用一次 fetch_open_orders 批量取回所有挂单，
+    已不在挂单列表中的订单再单独 fetch_order 取最终状态。成交增量和状态变化作为事件放入
+    下单 broker（order.broker）的队列，由该 OKXBroker.next()（其 backtrader 线程）统一应用到订单和持仓上；
+    同一进程内多个策略的 broker 共用一个 tracker，每个 broker 只取到自己订单的事件。
+    """
+    def __init__(self, exchange):
+        self.exchange = exchange
+        self._queues = {}  # broker -> queue.Queue
+        self._live = {}  # exchange_id -> TrackedOrder
+        self._by_ref = {}  # bt order ref -> TrackedOrder
+        self._lock = threading.Lock()
+
+    def track(self, order, exchange_id, symbol):
+        tracked = TrackedOrder(order, exchange_id, symbol)
+        with self._lock:
+            self._live[exchange_id] = tracked
+            self._by_ref[order.ref] = tracked
+        return tracked
+
+    def emit(self, event):
+        """event = (kind, order, ...)，放入该订单所属 broker 的队列"""
+        self._queue(event[1].broker).put(event)
+
+    def _queue(self, broker):
+        with self._lock:
+            q = self._queues.get(broker)
+            if q is None:
+                q = self._queues[broker] = queue.Queue()
+            return q
+
+    def release(self, broker):
+        """broker 停止后丢弃它的事件队列"""
+        with self._lock:
+            self._queues.pop(broker, None)
+
+    def get(self, order):
+        with self._lock:
+            return self._by_ref.get(order.ref)
+
+    def pending(self):
+        with self._lock:
+            return len(self._live)
+
+    def reconcile(self):
+        with self._lock:
+            live = list(self._live.values())
+        if not live:
+            return
+
+        open_orders = {o['id']: o for o in self.exchange.fetch_open_orders()}
+        for tracked in live:
+            info = open_orders.get(tracked.exchange_id)
+            if info is None:
+                info = self.exchange.fetch_order(tracked.exchange_id, tracked.symbol)
+            self.update(tracked, info)
+
+    def update(self, tracked, info):
+        """根据交易所返回的订单信息生成成交增量/终态事件"""
+        filled = info.get('filled') or 0.0
+        cost = info.get('cost')
+        if cost is None:
+            cost = filled * (info.get('average') or info.get('price') or 0.0)
+        fee = info.get('fee') or {}
+        fee = (fee.get('cost') or 0.0) * (
+            # OKX 现货买单手续费以基础货币扣除，统一折算为计价货币
+            cost / filled if filled and fee.get('currency') == tracked.symbol.split('/')[0] else 1.0)
+
+        if filled > tracked.filled:
+            size = filled - tracked.filled
+            price = (cost - tracked.cost) / size
+            ts = info.get('lastTradeTimestamp') or info.get('timestamp')
+            dt = datetime.fromtimestamp(ts / 1000.0, tz=timezone.utc).replace(tzinfo=None) if ts else None
+            self.emit(('fill', tracked.order, size, price, fee - tracked.fee, dt))
+            tracked.filled, tracked.cost, tracked.fee = filled, cost, fee
+
+        final = FINAL_STATES.get(info.get('status'))
+        if final is not None:
+            with self._lock:
+                self._live.pop(tracked.exchange_id, None)
+                self._by_ref.pop(tracked.order.ref, None)
+            self.emit((final, tracked.order))
+
+    def drain(self, broker):
+        events = self._queue(broker)
+        while True:
+            try:
+                yield events.get_nowait()
+            except queue.Empty:
+                return
+
+
+# 下单到交易所确认的耗时分桶上界（毫秒）
+LATENCY_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, float('inf'))
+
+
+class LatencyHistogram(object):
+    """submit -> ack 延迟直方图（固定分桶，线程安全）"""
+    def __init__(self, buckets=LATENCY_BUCKETS_MS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, seconds):
+        ms = seconds * 1000.0
+        with self._lock:
+            self.counts[bisect.bisect_left(self.buckets, ms)] += 1
+            self.count += 1
+            self.total_ms += ms
+            self.max_ms = max(self.max_ms, ms)
+
+    def quantile(self, q):
+        """返回第 q 分位所在分桶的上界"""
+        with self._lock:
+            if not self.count:
+                return None
+            target = q * self.count
+            seen = 0
+            for bound, n in zip(self.buckets, self.counts):
+                seen += n
+                if seen >= target:
+                    return min(bound, self.max_ms)
+            return self.max_ms
+
+    def summary(self):
+        return {
+            'count': self.count,
+            'mean_ms': self.total_ms / self.count if self.count else None,
+            'p50_ms': self.quantile(0.5),
+            'p95_ms': self.quantile(0.95),
+            'p99_ms': self.quantile(0.99),
+            'max_ms': self.max_ms,
+            'buckets': {('+Inf' if b == float('inf') else b): n for b, n in zip(self.buckets, self.counts)},
+        }
+
+
+class OrderSubmitter(object):
+    """
+    异步下单队列
+
+    submit() 只入队，后台线程取出后在 batch_window 内继续收集订单（同一根 K 线上
+    多个策略的调仓），合并为 OKX 批量下单请求（单次最多 BATCH_LIMIT 笔）。
+    确认结果以 ('accepted', order) / ('rejected', order) 事件经 OrderTracker.emit 写入下单 broker 的队列，
+    与成交事件一起由 OKXBroker.next() 按顺序应用。
+    每笔订单带 clientOrderId；整批请求异常（如超时）时部分订单可能已经在交易所生效，
+    先按 clientOrderId 查询确认，查不到的才视为拒绝。latency 只统计成功确认的订单。
+    """
+    BATCH_LIMIT = 20  # OKX /trade/batch-orders 单次上限
+
+    _STOP = object()
+    _CANCEL = object()
+
+    def __init__(self, exchange, tracker, batch_window=0.05):
+        self.exchange = exchange
+        self.tracker = tracker
+        self.batch_window = batch_window
+        self.latency = LatencyHistogram()
+        self._queue = queue.Queue()
+        self._cancels = set()  # 确认前就被撤销的订单 ref
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._thread = threading.Thread(target=self._run, name="okx-orders", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if self._thread is not None:
+            self._queue.put(self._STOP)
+            self._thread.join(timeout=10)
+
+    def submit(self, order, request):
+        """request: ccxt create_orders 的单笔订单 dict（symbol/type/side/amount/price）"""
+        # OKX clOrdId: 1-32 位字母数字
+        request = dict(request, params={'clientOrderId': uuid.uuid4().hex})
+        self._queue.put((order, request, time.perf_counter()))
+
+    def cancel(self, order):
+        """撤单同样在后台线程发送；订单尚未确认时先记下，确认后立即撤单"""
+        with self._lock:
+            tracked = self.tracker.get(order)
+            if tracked is None:
+                self._cancels.add(order.ref)
+                return
+        self._queue.put((self._CANCEL, tracked, None))
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is self._STOP:
+                return
+            if item[0] is self._CANCEL:
+                self._cancel(item[1].exchange_id, item[1].symbol)
+                continue
+            batch = [item]
+            deadline = time.perf_counter() + self.batch_window
+            stopping = False
+            while len(batch) < self.BATCH_LIMIT:
+                try:
+                    item = self._queue.get(timeout=max(0.0, deadline - time.perf_counter()))
+                except queue.Empty:
+                    break
+                if item is self._STOP:
+                    stopping = True
+                    break
+                if item[0] is self._CANCEL:
+                    self._cancel(item[1].exchange_id, item[1].symbol)
+                    continue
+                batch.append(item)
+            self._send(batch)
+            if stopping:
+                return
+
+    def _send(self, batch):
+        requests = [request for _, request, _ in batch]
+        try:
+            if len(batch) == 1:
+                r = requests[0]
+                responses = [self.exchange.create_order(r['symbol'], r['type'], r['side'], r['amount'], r.get('price'),
+                                                        r['params'])]
+            else:
+                responses = self.exchange.create_orders(requests)
+        except Exception as e:
+            print(f"OKX Order Failed: {e}")
+            responses = self._recover(requests)
+
+        acked = time.perf_counter()
+        for (order, request, submitted), response in zip(batch, responses):
+            if not response or not response.get('id') or response.get('status') == 'rejected':
+                print(f"OKX Order Rejected: {request['side']} {request['amount']} {request['symbol']}")
+                self.tracker.emit(('rejected', order))
+                continue
+            self.latency.record(acked - submitted)
+            print(f"OKX Order Placed: {response['id']}")
+            with self._lock:
+                # 先放入确认事件再开始跟踪，保证确认事件排在该订单的成交事件之前
+                self.tracker.emit(('accepted', order))
+                self.tracker.track(order, response['id'], request['symbol'])
+                cancel = order.ref in self._cancels
+                self._cancels.discard(order.ref)
+            if cancel:
+                self._cancel(response['id'], request['symbol'])
+
+    def _recover(self, requests):
+        """下单请求异常后按 clientOrderId 查找已生效的订单: 先查一次挂单列表，不在其中的（如已成交的市价单）再逐笔查询"""
+        try:
+            live = {o.get('clientOrderId'): o for o in self.exchange.fetch_open_orders()}
+        except Exception as e:
+            print(f"OKX open orders check failed: {e}")
+            live = {}
+        responses = []
+        for request in requests:
+            client_id = request['params']['clientOrderId']
+            response = live.get(client_id)
+            if response is None:
+                try:
+                    response = self.exchange.fetch_order(None, request['symbol'], {'clientOrderId': client_id})
+                except Exception:
+                    response = None
+            responses.append(response)
+        return responses
+
+    def _cancel(self, exchange_id, symbol):
+        # 撤单结果（以及撤单前的部分成交）由 OrderTracker.reconcile 确认
+        try:
+            self.exchange.cancel_order(exchange_id, symbol)
+        except Exception as e:
+            print(f"OKX Cancel Failed: {e}")
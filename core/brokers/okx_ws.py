@@ -0,0 +1,176 @@
+import json
+import asyncio
+import threading
+import websockets
+from config.settings import settings
+
+OKX_WS_BUSINESS_URL = "wss://ws.okx.com:8443/ws/v5/business"
+OKX_WS_BUSINESS_DEMO_URL = "wss://wspap.okx.com:8443/ws/v5/business"
+
+# ccxt timeframe -> OKX candle 频道名
+CANDLE_CHANNELS = {
+    '1m': 'candle1m',
+    '3m': 'candle3m',
+    '5m': 'candle5m',
+    '15m': 'candle15m',
+    '30m': 'candle30m',
+    '1h': 'candle1H',
+    '2h': 'candle2H',
+    '4h': 'candle4H',
+    '1d': 'candle1D',
+}
+
+
+def inst_id(symbol):
+    """BTC/USDT -> BTC-USDT"""
+    return symbol.replace('/', '-')
+
+
+def candle_channel(timeframe):
+    if timeframe not in CANDLE_CHANNELS:
+        raise ValueError(f"Unsupported timeframe: {timeframe}")
+    return CANDLE_CHANNELS[timeframe]
+
+
+class OKXStream(object):
+    """
+    OKX WebSocket 行情连接
+
+    在后台线程的 asyncio 事件循环中维持一个连接，断线后指数退避自动重连并重新订阅。
+    同一频道可以有多个订阅者，回调在事件循环线程中执行，必须是非阻塞的（例如放入 queue）；
+    on_reconnect 回调（用于 REST 补齐断线期间的数据）在线程池中执行。
+    """
+    def __init__(self, url=None, ping_interval=25.0, max_backoff=30.0):
+        self.url = url or settings.OKX_WS_URL or (
+            OKX_WS_BUSINESS_DEMO_URL if settings.OKX_DEMO else OKX_WS_BUSINESS_URL)
+        self.ping_interval = ping_interval
+        self.max_backoff = max_backoff
+        self.connected = threading.Event()
+        self._subs = {}  # (channel, instId) -> [(callback, on_reconnect), ...]
+        self._lock = threading.Lock()
+        self._loop = None
+        self._thread = None
+        self._ws = None
+        self._stopping = False
+
+    def start(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stopping = False
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_until_complete, args=(self._run(),),
+                                        name="okx-ws", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stopping = True
+        if self._loop is not None and self._ws is not None:
+            asyncio.run_coroutine_threadsafe(self._ws.close(), self._loop)
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+        self.connected.clear()
+
+    def subscribe(self, channel, symbol, callback, on_reconnect=None):
+        key = (channel, inst_id(symbol))
+        with self._lock:
+            first = key not in self._subs
+            self._subs.setdefault(key, []).append((callback, on_reconnect))
+        if first:
+            self._send_threadsafe("subscribe", [key])
+        self.start()
+
+    def unsubscribe(self, channel, symbol, callback):
+        key = (channel, inst_id(symbol))
+        with self._lock:
+            subs = [s for s in self._subs.get(key, []) if s[0] is not callback]
+            if subs:
+                self._subs[key] = subs
+                return
+            self._subs.pop(key, None)
+        self._send_threadsafe("unsubscribe", [key])
+
+    def _send_threadsafe(self, op, keys):
+        if self._loop is not None and self.connected.is_set():
+            asyncio.run_coroutine_threadsafe(self._send_op(op, keys), self._loop)
+
+    async def _send_op(self, op, keys):
+        if not keys or self._ws is None:
+            return
+        args = [{"channel": channel, "instId": instid} for channel, instid in keys]
+        await self._ws.send(json.dumps({"op": op, "args": args}))
+
+    async def _run(self):
+        backoff = 1.0
+        reconnecting = False
+        while not self._stopping:
+            try:
+                async with websockets.connect(self.url, ping_interval=None) as ws:
+                    self._ws = ws
+                    # 先标记已连接再取订阅列表，期间新增的订阅最多重复发送一次（OKX 会忽略）
+                    self.connected.set()
+                    with self._lock:
+                        keys = list(self._subs)
+                    await self._send_op("subscribe", keys)
+                    backoff = 1.0
+                    if reconnecting:
+                        self._notify_reconnect()
+                    await self._recv_loop(ws)
+            except (OSError, asyncio.TimeoutError, websockets.exceptions.WebSocketException) as e:
+                if not self._stopping:
+                    print(f"OKX WebSocket disconnected: {e}")
+            finally:
+                self._ws = None
+                self.connected.clear()
+            if self._stopping:
+                break
+            reconnecting = True
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, self.max_backoff)
+
+    async def _recv_loop(self, ws):
+        while not self._stopping:
+            try:
+                raw = await asyncio.wait_for(ws.recv(), timeout=self.ping_interval)
+            except asyncio.TimeoutError:
+                # OKX 30 秒无消息会断开连接
+                await ws.send("ping")
+                continue
+            if raw == "pong":
+                continue
+            try:
+                msg = json.loads(raw)
+            except ValueError:
+                continue
+            self._dispatch(msg)
+
+    def _dispatch(self, msg):
+        if msg.get("event") == "error":
+            print(f"OKX WebSocket error: {msg.get('msg')}")
+            return
+        arg = msg.get("arg")
+        if not arg or "data" not in msg:
+            return
+        with self._lock:
+            subs = list(self._subs.get((arg.get("channel"), arg.get("instId")), []))
+        for callback, _ in subs:
+            try:
+                callback(arg, msg["data"])
+            except Exception as e:
+                print(f"OKX WebSocket callback error: {e}")
+
+    def _notify_reconnect(self):
+        with self._lock:
+            hooks = [hook for subs in self._subs.values() for _, hook in subs if hook is not None]
+        for hook in hooks:
+            self._loop.run_in_executor(None, hook)
+
+
+def parse_candles(rows):
+    """
+    OKX candle 推送 -> 已收盘的 ccxt 格式 K 线 [ts, o, h, l, c, v]
+    每行: [ts, o, h, l, c, vol, volCcy, volCcyQuote, confirm]，confirm == "1" 表示已收盘
+    """
+    return [
+        [int(r[0]), float(r[1]), float(r[2]), float(r[3]), float(r[4]), float(r[5])]
+        for r in rows if len(r) > 8 and r[8] == "1"
+    ]
@@ -0,0 +1,55 @@
+import numpy as np
+
+# 回测结果中 K 线图的最大点数，放大查看时通过 /chart 接口按区间取完整数据
+CHART_MAX_POINTS = 2000
+# /chart 接口允许请求的最大点数
+CHART_POINTS_LIMIT = 100000
+
+
+def downsample_ohlc(ts, open_, high, low, close, max_points=CHART_MAX_POINTS):
+    """
+    按桶聚合降采样，保留每个桶内的极值:
+    open 取桶内第一根，close 取最后一根，high/low 取桶内最大/最小，时间取桶内第一根
+    """
+    n = len(ts)
+    if max_points is None or n <= max_points:
+        return ts, open_, high, low, close
+    bucket = -(-n // max_points)
+    starts = np.arange(0, n, bucket)
+    ends = np.minimum(starts + bucket, n) - 1
+    return (
+        ts[starts],
+        open_[starts],
+        np.maximum.reduceat(high, starts),
+        np.minimum.reduceat(low, starts),
+        close[ends],
+    )
+
+
+def chart_rows(ts, open_, high, low, close, max_points=CHART_MAX_POINTS):
+    """
+    生成 ECharts K 线数据 [[epoch_ms, open, close, low, high], ...]
+    """
+    ts, open_, high, low, close = downsample_ohlc(
+        np.asarray(ts, dtype=np.int64), np.asarray(open_), np.asarray(high), np.asarray(low), np.asarray(close),
+        max_points)
+    return [list(row) for row in zip(ts.tolist(), open_.tolist(), close.tolist(), low.tolist(), high.tolist())]
+
+
+def index_to_ms(index):
+    """DatetimeIndex -> 毫秒时间戳数组（与 pandas 内部精度无关）"""
+    return index.values.astype('datetime64[ms]').astype(np.int64)
+
+
+def line_rows(ts, values, max_points=CHART_MAX_POINTS):
+    """
+    折线（如权益曲线）降采样为 [[epoch_ms, value], ...]，每个桶取最后一个点，保留最终值
+    """
+    ts = np.asarray(ts, dtype=np.int64)
+    values = np.asarray(values, dtype=np.float64)
+    n = len(ts)
+    if max_points is not None and n > max_points:
+        bucket = -(-n // max_points)
+        ends = np.minimum(np.arange(0, n, bucket) + bucket, n) - 1
+        ts, values = ts[ends], values[ends]
+    return [list(row) for row in zip(ts.tolist(), values.tolist())]
@@ -0,0 +1,34 @@
+import numpy as np
+
+OHLC = ('open', 'high', 'low', 'close')
+
+
+def align_bars(series):
+    """
+    把多个标的的 K 线（BarStore.read 格式的列数组）对齐到共同时间轴
+
+    时间轴为各标的时间戳的并集，从所有标的都有数据的时刻开始。缺失的 K 线用上一根收盘价补齐
+    （open/high/low/close 都等于该收盘价、volume 为 0），用 searchsorted 一次算出每个标的在时间轴上的位置，
+    不需要逐个 DataFrame reindex。已经与时间轴一致的标的原样返回，不复制。
+    """
+    for bars in series:
+        if len(bars['timestamp']) == 0:
+            raise ValueError("Cannot align an empty bar series")
+    start = max(bars['timestamp'][0] for bars in series)
+    timeline = np.unique(np.concatenate([bars['timestamp'][bars['timestamp'] >= start] for bars in series]))
+
+    aligned = []
+    for bars in series:
+        ts = bars['timestamp']
+        if len(ts) == len(timeline) and np.array_equal(ts, timeline):
+            aligned.append(bars)
+            continue
+        idx = np.searchsorted(ts, timeline, side='right') - 1
+        exact = ts[idx] == timeline
+        close = bars['close'][idx]
+        out = {'timestamp': timeline, 'close': close}
+        for col in OHLC[:3]:
+            out[col] = np.where(exact, bars[col][idx], close)
+        out['volume'] = np.where(exact, bars['volume'][idx], 0.0)
+        aligned.append(out)
+    return aligned
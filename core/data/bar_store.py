@@ -0,0 +1,176 @@
+import os
+import glob
+import hashlib
+from datetime import datetime, timezone
+import numpy as np
+from config.settings import settings
+
+# 列顺序固定，按行存储每一列 => 每列在文件中连续（列式），可直接 mmap
+COLUMNS = ('timestamp', 'open', 'high', 'low', 'close', 'volume')
+
+TIMEFRAME_MS = {
+    '1m': 60 * 1000,
+    '3m': 3 * 60 * 1000,
+    '5m': 5 * 60 * 1000,
+    '15m': 15 * 60 * 1000,
+    '30m': 30 * 60 * 1000,
+    '1h': 60 * 60 * 1000,
+    '2h': 2 * 60 * 60 * 1000,
+    '4h': 4 * 60 * 60 * 1000,
+    '1d': 24 * 60 * 60 * 1000,
+}
+
+DAY_MS = TIMEFRAME_MS['1d']
+
+
+def timeframe_to_ms(timeframe):
+    if timeframe not in TIMEFRAME_MS:
+        raise ValueError(f"Unsupported timeframe: {timeframe}")
+    return TIMEFRAME_MS[timeframe]
+
+
+def to_ms(dt):
+    """naive datetime 视为 UTC"""
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return int(dt.timestamp() * 1000)
+
+
+class BarStore(object):
+    """
+    本地 OHLCV 列式存储
+
+    目录结构: {root}/{symbol}/{timeframe}/{YYYY-MM-DD}.npy
+    每个分区是 shape=(6, n) 的 float64 数组，第 0 行为毫秒时间戳（float64 可精确表示），
+    其余行依次为 open/high/low/close/volume，按时间升序且唯一。
+    """
+    def __init__(self, root=None):
+        self.root = root or settings.BAR_STORE_DIR
+
+    def _series_dir(self, symbol, timeframe):
+        return os.path.join(self.root, symbol.replace('/', '-'), timeframe)
+
+    def _partition_path(self, symbol, timeframe, day):
+        return os.path.join(self._series_dir(symbol, timeframe), f"{day}.npy")
+
+    @staticmethod
+    def _day_of(ts_ms):
+        return datetime.fromtimestamp(ts_ms / 1000.0, tz=timezone.utc).strftime("%Y-%m-%d")
+
+    def list_days(self, symbol, timeframe):
+        paths = glob.glob(os.path.join(self._series_dir(symbol, timeframe), "*.npy"))
+        return sorted(os.path.basename(p)[:-4] for p in paths)
+
+    def read_partition(self, symbol, timeframe, day, mmap=True):
+        path = self._partition_path(symbol, timeframe, day)
+        if not os.path.exists(path):
+            return None
+        return np.load(path, mmap_mode='r' if mmap else None)
+
+    def write(self, symbol, timeframe, ohlcv):
+        """
+        写入 K 线，ohlcv 为 [[ts, o, h, l, c, v], ...]（ccxt 格式）或 shape=(n, 6) 的数组。
+        按天拆分并与已有分区合并去重（新数据覆盖旧数据），返回写入的行数。
+        """
+        rows = np.asarray(ohlcv, dtype=np.float64)
+        if rows.size == 0:
+            return 0
+        rows = rows.reshape(-1, len(COLUMNS)).T  # -> (6, n)
+
+        series_dir = self._series_dir(symbol, timeframe)
+        os.makedirs(series_dir, exist_ok=True)
+
+        day_ids = (rows[0] // DAY_MS).astype(np.int64)
+        for day_id in np.unique(day_ids):
+            chunk = rows[:, day_ids == day_id]
+            day = self._day_of(int(day_id) * DAY_MS)
+            existing = self.read_partition(symbol, timeframe, day, mmap=False)
+            if existing is not None:
+                # 新数据放在前面，unique 取首次出现 => 新值覆盖旧值
+                chunk = np.concatenate([chunk, existing], axis=1)
+            _, idx = np.unique(chunk[0], return_index=True)
+            chunk = np.ascontiguousarray(chunk[:, idx])
+
+            path = self._partition_path(symbol, timeframe, day)
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'wb') as f:
+                np.save(f, chunk)
+            os.replace(tmp_path, path)  # 原子替换，读者不会看到写了一半的分区
+        return rows.shape[1]
+
+    def first_timestamp(self, symbol, timeframe):
+        days = self.list_days(symbol, timeframe)
+        if not days:
+            return None
+        part = self.read_partition(symbol, timeframe, days[0])
+        return int(part[0, 0]) if part.shape[1] else None
+
+    def last_timestamp(self, symbol, timeframe):
+        days = self.list_days(symbol, timeframe)
+        if not days:
+            return None
+        part = self.read_partition(symbol, timeframe, days[-1])
+        return int(part[0, -1]) if part.shape[1] else None
+
+    def read(self, symbol, timeframe, start_ms, end_ms):
+        """
+        读取 [start_ms, end_ms) 区间，返回 {列名: np.ndarray}。
+        单个分区时返回 mmap 切片视图（零拷贝），跨分区时只做一次拼接。
+        """
+        first_day = self._day_of(start_ms)
+        last_day = self._day_of(max(start_ms, end_ms - 1))
+        parts = []
+        for day in self.list_days(symbol, timeframe):
+            if day < first_day or day > last_day:
+                continue
+            part = self.read_partition(symbol, timeframe, day)
+            lo, hi = np.searchsorted(part[0], [start_ms, end_ms])
+            if hi > lo:
+                parts.append(part[:, lo:hi])
+
+        if not parts:
+            block = np.empty((len(COLUMNS), 0), dtype=np.float64)
+        elif len(parts) == 1:
+            block = parts[0]
+        else:
+            block = np.concatenate(parts, axis=1)
+
+        bars = {name: block[i] for i, name in enumerate(COLUMNS)}
+        bars['timestamp'] = block[0].astype(np.int64)
+        return bars
+
+    def find_gaps(self, symbol, timeframe, start_ms, end_ms):
+        """
+        检测 [start_ms, end_ms) 内缺失的 K 线区间，返回 [(gap_start_ms, gap_end_ms), ...]（左闭右开）
+        """
+        step = timeframe_to_ms(timeframe)
+        # 对齐到 K 线边界
+        start_ms = -(-start_ms // step) * step
+        ts = self.read(symbol, timeframe, start_ms, end_ms)['timestamp']
+        if end_ms <= start_ms:
+            return []
+        if len(ts) == 0:
+            return [(start_ms, end_ms)]
+
+        gaps = []
+        if ts[0] > start_ms:
+            gaps.append((start_ms, int(ts[0])))
+        holes = np.nonzero(np.diff(ts) > step)[0]
+        for i in holes:
+            gaps.append((int(ts[i]) + step, int(ts[i + 1])))
+        if ts[-1] + step < end_ms:
+            gaps.append((int(ts[-1]) + step, end_ms))
+        return gaps
+
+    def fingerprint(self, symbol, timeframe, start_ms, end_ms):
+        """
+        数据版本指纹: 由区间内各分区的大小和修改时间计算，分区被重写后指纹随之改变（无需读取数据）
+        """
+        first_day = self._day_of(start_ms)
+        last_day = self._day_of(max(start_ms, end_ms - 1))
+        h = hashlib.sha1(f"{symbol}|{timeframe}|{start_ms}|{end_ms}".encode())
+        for day in self.list_days(symbol, timeframe):
+            if first_day <= day <= last_day:
+                st = os.stat(self._partition_path(symbol, timeframe, day))
+                h.update(f"{day}:{st.st_size}:{st.st_mtime_ns};".encode())
+        return h.hexdigest()
@@ -0,0 +1,69 @@
+import math
+import weakref
+import numpy as np
+import backtrader as bt
+
+DAY_SECONDS = 24 * 3600
+# date(1970, 1, 1).toordinal()
+EPOCH_ORDINAL = 719163
+
+# id(DataFrame) -> (weakref, 各列的 Python float 列表)，DataFrame 释放时自动移除
+_COLUMNS = {}
+
+
+def date2nums(index):
+    """DatetimeIndex -> backtrader 的浮点日期，逐项与 bt.date2num 结果完全一致（同样用 fsum 求和）"""
+    us = index.values.astype('datetime64[us]').astype(np.int64)
+    days, us = np.divmod(us, DAY_SECONDS * 10 ** 6)
+    secs, us = np.divmod(us, 10 ** 6)
+    hours, secs = np.divmod(secs, 3600)
+    minutes, secs = np.divmod(secs, 60)
+    terms = zip((days + EPOCH_ORDINAL).astype(np.float64).tolist(), (hours / 24.0).tolist(),
+                (minutes / 1440.0).tolist(), (secs / 86400.0).tolist(), (us / 86400e6).tolist())
+    return [math.fsum(t) for t in terms]
+
+
+def nums2ms(nums):
+    """backtrader 浮点日期数组 -> 毫秒时间戳（int64），date2nums 的逆运算"""
+    nums = np.asarray(nums, dtype=np.float64)
+    return np.rint((nums - EPOCH_ORDINAL) * (DAY_SECONDS * 1000)).astype(np.int64)
+
+
+def frame_columns(df, columns):
+    """DataFrame 转为 backtrader 逐根读取用的列表（同一个 DataFrame 只转换一次）"""
+    key = (id(df), tuple(sorted(columns.items())))
+    cached = _COLUMNS.get(key)
+    if cached is not None and cached[0]() is df:
+        return cached[1]
+    values = {'datetime': date2nums(df.index)}
+    for name, col in columns.items():
+        values[name] = df.iloc[:, col].to_numpy(dtype=np.float64).tolist()
+    _COLUMNS[key] = (weakref.ref(df), values)
+    weakref.finalize(df, _COLUMNS.pop, key, None)
+    return values
+
+
+class FrameData(bt.feeds.PandasData):
+    """
+    与 PandasData 相同，但按列一次性转换后逐根读取列表，不再逐个单元格 iloc（参数寻优时整体回测耗时的大头）
+    时间取自 DatetimeIndex；datetime 在普通列中时退回 PandasData 的读取方式
+    """
+    def start(self):
+        super(FrameData, self).start()
+        self._rows = None
+        if self._colmapping['datetime'] is not None:
+            return
+        columns = {k: v for k, v in self._colmapping.items() if k != 'datetime' and v is not None}
+        values = frame_columns(self.p.dataname, columns)
+        self._rows = [(getattr(self.lines, name), values[name]) for name in ['datetime'] + list(columns)]
+        self._size = len(self.p.dataname)
+
+    def _load(self):
+        if self._rows is None:
+            return super(FrameData, self)._load()
+        self._idx += 1
+        if self._idx >= self._size:
+            return False
+        for line, values in self._rows:
+            line[0] = values[self._idx]
+        return True
@@ -0,0 +1,148 @@
+import os
+import json
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from config.settings import settings
+from core.data.bar_store import BarStore, timeframe_to_ms
+
+# OKX 历史 K 线接口单次最多返回 100 条
+PAGE_LIMIT = 100
+
+
+class TokenBucket(object):
+    """
+    线程安全的令牌桶，触发交易所限流时可整体暂停 (penalize)
+    只在进程内有效；OKX 请求默认经 core.brokers.okx_limits.SharedRateLimiter 跨进程共享额度
+    """
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity or max(1.0, rate))
+        self._tokens = self.capacity
+        self._last = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+                self._last = now
+                if now >= self._paused_until and self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = max(self._paused_until - now, (1 - self._tokens) / self.rate)
+            time.sleep(wait)
+
+    def penalize(self, seconds):
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+            self._tokens = 0
+
+
+class HistoricalFetcher(object):
+    """
+    分页并发下载历史 K 线
+
+    把 [start, end) 按 since 切成若干页，在令牌桶限速下并发拉取，结果按时间戳去重后写入 BarStore。
+    已完成的页记录在 checkpoint 文件中，中断后重新调用会跳过这些页。
+    """
+    def __init__(self, store=None, exchange=None, max_workers=None, limit=PAGE_LIMIT, rate=None, max_retries=5):
+        self.store = store or BarStore()
+        if exchange is None:
+            from core.brokers.okx import OKXStore  # ccxt 较重，只在真正需要下载时导入
+            exchange = OKXStore.get_instance().exchange
+        self.exchange = exchange
+        self.max_workers = max_workers or settings.HISTORY_FETCH_WORKERS
+        self.limit = limit
+        # ccxt 的 rateLimit 是两次请求之间的毫秒数；交易所已经过共享限频（LimitedExchange）时不再叠加进程内令牌桶，
+        # 429 时由共享桶让所有进程一起退避
+        if rate is None and getattr(self.exchange, 'limiter', None) is not None:
+            self.bucket = None
+        else:
+            self.bucket = TokenBucket(rate or 1000.0 / getattr(self.exchange, 'rateLimit', 100))
+        self.max_retries = max_retries
+        self._write_lock = threading.Lock()
+
+    def pages(self, timeframe, start_ms, end_ms):
+        step = timeframe_to_ms(timeframe)
+        span = self.limit * step
+        start_ms = start_ms // step * step
+        return [(since, min(since + span, end_ms)) for since in range(start_ms, end_ms, span)]
+
+    def _checkpoint_path(self, symbol, timeframe, start_ms, end_ms):
+        return os.path.join(self.store._series_dir(symbol, timeframe), '.fetch', f"{start_ms}-{end_ms}.json")
+
+    def _load_checkpoint(self, path):
+        if not os.path.exists(path):
+            return set()
+        with open(path) as f:
+            return set(json.load(f).get('done', []))
+
+    def _save_checkpoint(self, path, done):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump({'done': sorted(done)}, f)
+        os.replace(tmp_path, path)
+
+    def _fetch_page(self, symbol, timeframe, since, until):
+        import ccxt
+        delay = 1.0
+        for attempt in range(self.max_retries + 1):
+            if self.bucket is not None:
+                self.bucket.acquire()
+            try:
+                page = self.exchange.fetch_ohlcv(symbol, timeframe, since=since, limit=self.limit)
+                # 相邻页可能重叠，只保留本页区间
+                return [c for c in page if since <= c[0] < until]
+            except (ccxt.RateLimitExceeded, ccxt.DDoSProtection):
+                # 429: 所有线程一起退避
+                if self.bucket is not None:
+                    self.bucket.penalize(delay)
+                else:
+                    self.exchange.limiter.penalize('candles', delay)
+            except ccxt.NetworkError:
+                if attempt == self.max_retries:
+                    raise
+                time.sleep(delay)
+            delay = min(delay * 2, 30.0)
+        raise ccxt.RateLimitExceeded(f"Rate limited fetching {symbol} {timeframe} since {since}")
+
+    def download(self, symbol, timeframe, start_ms, end_ms):
+        """下载 [start_ms, end_ms) 并写入本地库，返回写入的 K 线数"""
+        step = timeframe_to_ms(timeframe)
+        checkpoint = self._checkpoint_path(symbol, timeframe, start_ms, end_ms)
+        done = self._load_checkpoint(checkpoint)
+        todo = [p for p in self.pages(timeframe, start_ms, end_ms) if p[0] not in done]
+        if not todo:
+            return 0
+
+        written = 0
+        closed_before = int(time.time() * 1000) // step * step
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            futures = {pool.submit(self._fetch_page, symbol, timeframe, since, until): (since, until)
+                       for since, until in todo}
+            try:
+                for future in as_completed(futures):
+                    since, until = futures[future]
+                    candles = future.result()
+                    with self._write_lock:
+                        written += self.store.write(symbol, timeframe, candles)
+                        # 尚未收盘的页不记为完成，下次继续拉取
+                        if until <= closed_before:
+                            done.add(since)
+                            self._save_checkpoint(checkpoint, done)
+            except BaseException:
+                # 失败或中断时不再发起新的请求，已完成的页保留在 checkpoint 中
+                pool.shutdown(wait=True, cancel_futures=True)
+                raise
+        return written
+
+    def fill_gaps(self, symbol, timeframe, start_ms, end_ms):
+        """只下载本地库中 [start_ms, end_ms) 缺失的部分"""
+        written = 0
+        for gap_start, gap_end in self.store.find_gaps(symbol, timeframe, start_ms, end_ms):
+            written += self.download(symbol, timeframe, gap_start, gap_end)
+        return written
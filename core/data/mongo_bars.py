@@ -0,0 +1,145 @@
+import os
+import uuid
+import hashlib
+from datetime import datetime, timezone
+import numpy as np
+import bson
+import pymongo
+from config.settings import settings
+
+COLUMNS = ('open', 'high', 'low', 'close', 'volume')
+PROJECTION = {'_id': 0, 'datetime': 1, **{c: 1 for c in COLUMNS}}
+
+# BSON 元素类型 -> 定长 numpy dtype（只有这些类型的文档可以按固定布局直接解码）
+BSON_DTYPES = {
+    0x01: '<f8',  # double
+    0x09: '<i8',  # UTC datetime (ms)
+    0x10: '<i4',  # int32
+    0x12: '<i8',  # int64
+}
+
+
+def record_layout(raw):
+    """
+    解析一条 BSON 文档的布局，返回 (文档长度, 结构化 dtype, 固定字节的位置)；
+    含变长字段时返回 None。固定字节为长度前缀、各元素的类型+字段名以及结尾的 0。
+    """
+    length = int.from_bytes(raw[:4], 'little')
+    names, formats, offsets = [], [], []
+    fixed = list(range(4))
+    pos = 4
+    while raw[pos] != 0:
+        dtype = BSON_DTYPES.get(raw[pos])
+        if dtype is None:
+            return None
+        name_end = raw.index(b'\0', pos + 1)
+        fixed.extend(range(pos, name_end + 1))
+        names.append(raw[pos + 1:name_end].decode())
+        formats.append(dtype)
+        offsets.append(name_end + 1)
+        pos = name_end + 1 + np.dtype(dtype).itemsize
+    fixed.append(pos)
+    if pos + 1 != length:
+        return None
+    return length, np.dtype({'names': names, 'formats': formats, 'offsets': offsets, 'itemsize': length}), \
+        np.array(fixed)
+
+
+def decode_raw_batch(batch):
+    """
+    一批原始 BSON（find_raw_batches 返回的多条文档拼接）-> {字段: numpy 数组}
+
+    所有文档字段顺序和类型相同时（导入脚本写入的 K 线都是如此），整批按结构化 dtype 零拷贝解析，
+    不为每条文档创建 Python 对象；否则退回逐条解码。
+    """
+    if not batch:
+        return {}
+    layout = record_layout(batch)
+    if layout is not None:
+        length, dtype, fixed = layout
+        if len(batch) % length == 0:
+            rows = np.frombuffer(batch, dtype=np.uint8).reshape(-1, length)
+            if (rows[:, fixed] == rows[0, fixed]).all():
+                records = np.frombuffer(batch, dtype=dtype)
+                return {name: records[name] for name in dtype.names}
+
+    docs = bson.decode_all(batch)
+    columns = {'datetime': np.empty(len(docs), dtype=np.int64)}
+    columns.update({c: np.empty(len(docs)) for c in COLUMNS})
+    for i, doc in enumerate(docs):
+        dt = doc['datetime']
+        if dt.tzinfo is None:
+            dt = dt.replace(tzinfo=timezone.utc)
+        columns['datetime'][i] = int(dt.timestamp() * 1000)
+        for c in COLUMNS:
+            columns[c][i] = doc[c]
+    return columns
+
+
+class MongoBarRepository(object):
+    """
+    MongoDB K 线仓库，集合为 bars_{symbol}_{timeframe}（scripts/import_mock_data.py 写入），
+    文档 {datetime, open, high, low, close, volume}。
+    写入方每次导入后调用 mark_updated()，在 bar_imports 集合中记录新的导入 id，数据指纹随之改变。
+
+    按 datetime 区间查询时只投影需要的字段、用大批量 find_raw_batches 拉取原始 BSON，
+    直接解码为列数组，返回格式与 BarStore.read 相同。
+    """
+    BATCH_SIZE = 100000
+    IMPORTS = "bar_imports"  # 集合名 -> {import_id, updated_at}
+
+    _clients = {}  # pid -> MongoClient，fork 后的子进程不复用父进程的连接
+
+    def __init__(self, db=None):
+        self.db = db if db is not None else self.get_client()[settings.MONGO_DB_NAME]
+
+    @classmethod
+    def get_client(cls):
+        pid = os.getpid()
+        if pid not in cls._clients:
+            cls._clients[pid] = pymongo.MongoClient(settings.MONGO_URL)
+        return cls._clients[pid]
+
+    def collection(self, symbol, timeframe):
+        return self.db[f"bars_{symbol}_{timeframe}"]
+
+    def ensure_index(self, symbol, timeframe):
+        self.collection(symbol, timeframe).create_index([('datetime', pymongo.ASCENDING)], unique=True)
+
+    def mark_updated(self, symbol, timeframe):
+        """集合内容变化后更新导入 id（覆盖写入同样条数和首尾时间的数据时，指纹也会改变）"""
+        self.db[self.IMPORTS].update_one(
+            {'_id': self.collection(symbol, timeframe).name},
+            {'$set': {'import_id': uuid.uuid4().hex, 'updated_at': datetime.now(timezone.utc)}}, upsert=True)
+
+    def _range_filter(self, start_ms, end_ms):
+        return {'datetime': {
+            '$gte': datetime.fromtimestamp(start_ms / 1000.0, tz=timezone.utc),
+            '$lt': datetime.fromtimestamp(end_ms / 1000.0, tz=timezone.utc),
+        }}
+
+    def read(self, symbol, timeframe, start_ms, end_ms):
+        """读取 [start_ms, end_ms) 的 K 线，返回 {timestamp, open, high, low, close, volume} 数组"""
+        cursor = self.collection(symbol, timeframe).find_raw_batches(
+            self._range_filter(start_ms, end_ms), PROJECTION,
+            sort=[('datetime', pymongo.ASCENDING)], batch_size=self.BATCH_SIZE)
+
+        chunks = [decode_raw_batch(batch) for batch in cursor]
+        chunks = [c for c in chunks if c]
+        result = {'timestamp': np.concatenate([c['datetime'] for c in chunks]).astype(np.int64, copy=False)
+                  if chunks else np.empty(0, dtype=np.int64)}
+        for c in COLUMNS:
+            result[c] = np.concatenate([chunk[c] for chunk in chunks]).astype(np.float64, copy=False) \
+                if chunks else np.empty(0)
+        return result
+
+    def fingerprint(self, symbol, timeframe, start_ms, end_ms):
+        """数据版本指纹: 集合的导入 id，加上区间内的条数和首尾时间（都走 datetime 索引）"""
+        collection = self.collection(symbol, timeframe)
+        meta = self.db[self.IMPORTS].find_one({'_id': collection.name}, {'import_id': 1})
+        query = self._range_filter(start_ms, end_ms)
+        first = collection.find_one(query, {'_id': 0, 'datetime': 1}, sort=[('datetime', 1)])
+        last = collection.find_one(query, {'_id': 0, 'datetime': 1}, sort=[('datetime', -1)])
+        count = collection.count_documents(query)
+        key = f"{meta and meta['import_id']}:{count}:{first and first['datetime']}:{last and last['datetime']}"
+        return "mongo:" + hashlib.sha1(key.encode()).hexdigest()
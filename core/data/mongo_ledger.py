@@ -0,0 +1,74 @@
+import numpy as np
+import pymongo
+from bson import Binary
+from config.settings import settings
+from core.data.mongo_bars import MongoBarRepository
+
+
+class LedgerRepository(object):
+    """
+    回测流水的 MongoDB 存储，每次回测结束后一次批量写入
+
+    backtest_fills: 每笔成交一个文档 {run_id, timestamp, symbol, size, price, value, commission}
+    backtest_equity: 权益按 EQUITY_CHUNK 根分块，每块一个文档，timestamp/value 为原始 int64/float64 字节
+    backtest_ledger_links: 命中结果缓存的回测没有自己的流水，{_id: run_id, source: 首次运行的 run_id}
+    """
+    FILLS = "backtest_fills"
+    EQUITY = "backtest_equity"
+    LINKS = "backtest_ledger_links"
+    EQUITY_CHUNK = 100000
+
+    def __init__(self, db=None):
+        if db is None:
+            db = MongoBarRepository.get_client()[settings.MONGO_DB_NAME]
+        self.db = db
+
+    def ensure_indexes(self):
+        self.db[self.FILLS].create_index([('run_id', pymongo.ASCENDING), ('timestamp', pymongo.ASCENDING)])
+        self.db[self.EQUITY].create_index([('run_id', pymongo.ASCENDING), ('seq', pymongo.ASCENDING)], unique=True)
+
+    def save(self, run_id, ledger, symbol=None):
+        """symbol: 单标的回测的数据源没有名称时使用的标的名"""
+        self.ensure_indexes()
+        fills = ledger['fills']
+        names = [name or symbol for name in ledger['datas']]
+        docs = [
+            {'run_id': run_id, 'timestamp': ts, 'symbol': names[data], 'size': size, 'price': price,
+             'value': value, 'commission': commission}
+            for ts, data, size, price, value, commission in zip(
+                fills['timestamp'].tolist(), fills['data'].tolist(), fills['size'].tolist(),
+                fills['price'].tolist(), fills['value'].tolist(), fills['commission'].tolist())
+        ]
+        if docs:
+            self.db[self.FILLS].insert_many(docs, ordered=False)
+        ts = np.ascontiguousarray(ledger['equity']['timestamp'], dtype=np.int64)
+        value = np.ascontiguousarray(ledger['equity']['value'], dtype=np.float64)
+        chunks = [
+            {'run_id': run_id, 'seq': seq, 'start': int(ts[i]), 'end': int(ts[min(i + self.EQUITY_CHUNK, len(ts)) - 1]),
+             'timestamp': Binary(ts[i:i + self.EQUITY_CHUNK].tobytes()),
+             'value': Binary(value[i:i + self.EQUITY_CHUNK].tobytes())}
+            for seq, i in enumerate(range(0, len(ts), self.EQUITY_CHUNK))
+        ]
+        if chunks:
+            self.db[self.EQUITY].insert_many(chunks, ordered=False)
+        return len(docs), len(ts)
+
+    def link(self, run_id, source_run_id):
+        """run_id 的流水与 source_run_id 相同，只记录指向，不复制数据"""
+        self.db[self.LINKS].replace_one({'_id': run_id}, {'_id': run_id, 'source': source_run_id}, upsert=True)
+
+    def resolve(self, run_id):
+        link = self.db[self.LINKS].find_one({'_id': run_id})
+        return link['source'] if link is not None else run_id
+
+    def load_fills(self, run_id):
+        run_id = self.resolve(run_id)
+        return list(self.db[self.FILLS].find({'run_id': run_id}, {'_id': 0, 'run_id': 0}).sort('timestamp', 1))
+
+    def load_equity(self, run_id):
+        run_id = self.resolve(run_id)
+        chunks = list(self.db[self.EQUITY].find({'run_id': run_id}).sort('seq', 1))
+        return {
+            'timestamp': np.concatenate([np.frombuffer(c['timestamp'], dtype=np.int64) for c in chunks] or [np.empty(0, np.int64)]),
+            'value': np.concatenate([np.frombuffer(c['value'], dtype=np.float64) for c in chunks] or [np.empty(0)]),
+        }
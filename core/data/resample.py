@@ -0,0 +1,87 @@
+import os
+import numpy as np
+from config.settings import settings
+from core.data.bar_store import BarStore, timeframe_to_ms, DAY_MS
+
+
+def resample_ohlcv(block, step_ms):
+    """
+    把 shape=(6, n) 的 K 线按 step_ms 聚合（时间戳为周期起点），返回 shape=(6, m) 的新数组
+    open 取首根、high/low 取极值、close 取末根、volume 求和，全部由 reduceat 向量化完成
+    """
+    n = block.shape[1]
+    if n == 0:
+        return np.empty((6, 0), dtype=np.float64)
+    bucket = block[0] // step_ms * step_ms
+    starts = np.flatnonzero(np.concatenate([[True], bucket[1:] != bucket[:-1]]))
+    ends = np.concatenate([starts[1:], [n]]) - 1
+
+    out = np.empty((6, len(starts)), dtype=np.float64)
+    out[0] = bucket[starts]
+    out[1] = block[1][starts]
+    out[2] = np.maximum.reduceat(block[2], starts)
+    out[3] = np.minimum.reduceat(block[3], starts)
+    out[4] = block[4][ends]
+    out[5] = np.add.reduceat(block[5], starts)
+    return out
+
+
+class Resampler(object):
+    """
+    由基础周期（settings.BASE_TIMEFRAME，默认 1m）K 线派生 5m/15m/1h/4h/1d 等周期
+
+    只有基础周期从交易所下载并保存在 BarStore 中；派生周期按天分区缓存在 "{tf}@{base}" 序列下。
+    派生分区的修改时间早于对应的基础分区时（即基础数据有更新）才重新聚合这一天，
+    新 K 线到达时只有最后一天需要重算。提供与 BarStore 相同的 read()/fingerprint() 接口。
+    """
+    def __init__(self, store=None, base=None):
+        self.store = store or BarStore()
+        self.base = base or settings.BASE_TIMEFRAME
+        self.base_ms = timeframe_to_ms(self.base)
+
+    def derived_key(self, timeframe):
+        return f"{timeframe}@{self.base}"
+
+    def check_timeframe(self, timeframe):
+        step = timeframe_to_ms(timeframe)
+        # 派生周期必须是基础周期的整数倍，且整除一天（聚合不会跨越日分区）
+        if step % self.base_ms or DAY_MS % step:
+            raise ValueError(f"Cannot derive {timeframe} from {self.base}")
+        return step
+
+    def refresh(self, symbol, timeframe, start_ms, end_ms):
+        """重新聚合 [start_ms, end_ms) 内基础数据有更新的日分区，返回重算的天数"""
+        step = self.check_timeframe(timeframe)
+        key = self.derived_key(timeframe)
+        first_day = self.store._day_of(start_ms)
+        last_day = self.store._day_of(max(start_ms, end_ms - 1))
+        refreshed = 0
+        for day in self.store.list_days(symbol, self.base):
+            if day < first_day or day > last_day:
+                continue
+            base_path = self.store._partition_path(symbol, self.base, day)
+            derived_path = self.store._partition_path(symbol, key, day)
+            if os.path.exists(derived_path) and \
+                    os.stat(derived_path).st_mtime_ns >= os.stat(base_path).st_mtime_ns:
+                continue
+            self._write_partition(derived_path, resample_ohlcv(self.store.read_partition(symbol, self.base, day), step))
+            refreshed += 1
+        return refreshed
+
+    @staticmethod
+    def _write_partition(path, block):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            np.save(f, block)
+        os.replace(tmp_path, path)
+
+    def read(self, symbol, timeframe, start_ms, end_ms):
+        if timeframe == self.base:
+            return self.store.read(symbol, timeframe, start_ms, end_ms)
+        self.refresh(symbol, timeframe, start_ms, end_ms)
+        return self.store.read(symbol, self.derived_key(timeframe), start_ms, end_ms)
+
+    def fingerprint(self, symbol, timeframe, start_ms, end_ms):
+        # 派生数据完全由基础数据决定
+        return self.store.fingerprint(symbol, self.base, start_ms, end_ms)
@@ -0,0 +1,48 @@
+import time
+from core.data.bar_store import BarStore, timeframe_to_ms
+from core.data.history import HistoricalFetcher, PAGE_LIMIT
+
+
+def sync_bars(symbol, timeframe='1h', since=None, store=None, exchange=None):
+    """
+    增量同步: 只拉取本地最后一根 K 线之后的数据，并检测/回补缺口。
+    本地为空时从 since 开始拉取；since 早于本地第一根 K 线时向前补齐。
+    """
+    store = store or BarStore()
+    fetcher = HistoricalFetcher(store=store, exchange=exchange)
+    step = timeframe_to_ms(timeframe)
+
+    now_ms = int(time.time() * 1000)
+    # 只保存已收盘的 K 线
+    until = now_ms // step * step
+
+    last_ts = store.last_timestamp(symbol, timeframe)
+    if last_ts is not None:
+        start = last_ts + step
+    elif since is not None:
+        start = since
+    else:
+        start = until - PAGE_LIMIT * step
+
+    fetched = 0
+    first_ts = store.first_timestamp(symbol, timeframe)
+    if since is not None and first_ts is not None and since < first_ts:
+        fetched += fetcher.download(symbol, timeframe, since, first_ts)
+
+    if start < until:
+        fetched += fetcher.download(symbol, timeframe, start, until)
+
+    # 缺口检测: 本次同步区间内的缺口回补一次，交易所本身缺失的 K 线会保留在 gaps 中
+    first_ts = store.first_timestamp(symbol, timeframe)
+    gaps = []
+    if first_ts is not None:
+        fetched += fetcher.fill_gaps(symbol, timeframe, max(first_ts, start - step), until)
+        gaps = store.find_gaps(symbol, timeframe, first_ts, until)
+
+    return {
+        "symbol": symbol,
+        "timeframe": timeframe,
+        "fetched": fetched,
+        "last_timestamp": store.last_timestamp(symbol, timeframe),
+        "gaps": gaps,
+    }
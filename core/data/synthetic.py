@@ -0,0 +1,67 @@
+import numpy as np
+import pandas as pd
+
+
+def random_walk_ohlcv(n, seed=0, base_price=1.1000, start_ms=0, step_ms=3600 * 1000):
+    """
+    确定性随机游走 K 线（scripts/import_mock_data.py 中逐条生成逻辑的向量化版本）
+    在对数空间中游走（每根 ±0.25%），任意长度下价格都为正
+    返回 shape=(n, 6) 的 [ts, open, high, low, close, volume]，可直接写入 BarStore
+    """
+    rng = np.random.default_rng(seed)
+    log_ret = (rng.random(n) - 0.5) * 0.005
+    close = base_price * np.exp(np.cumsum(log_ret))
+    open_ = np.empty(n)
+    open_[0] = base_price
+    open_[1:] = close[:-1]
+    high = np.maximum(open_, close) * (1.0 + rng.random(n) * 0.001)
+    low = np.minimum(open_, close) * (1.0 - rng.random(n) * 0.001)
+    assert n == 0 or low.min() > 0
+    volume = np.floor(rng.random(n) * 1000)
+    ts = start_ms + np.arange(n, dtype=np.float64) * step_ms
+    return np.column_stack([ts, open_, high, low, close, volume])
+
+
+def random_walk(n, seed=0, base_price=1.1000, start="2023-01-01", freq="h"):
+    """同上，返回以时间为索引的 DataFrame（可直接交给 BacktestEngine.set_data）"""
+    index = pd.date_range(start, periods=n, freq=freq)
+    ohlcv = random_walk_ohlcv(n, seed, base_price)
+    return pd.DataFrame({
+        'open': ohlcv[:, 1],
+        'high': ohlcv[:, 2],
+        'low': ohlcv[:, 3],
+        'close': ohlcv[:, 4],
+        'volume': ohlcv[:, 5],
+    }, index=index)
+
+
+YEAR_MS = 365 * 24 * 3600 * 1000
+
+
+def gbm_ohlcv(n, rng, start_price=100.0, start_ms=0, step_ms=3600 * 1000, mu=0.0, sigma=0.6,
+              jump_intensity=0.0, jump_mean=0.0, jump_std=0.05, volume_mean=1000.0):
+    """
+    几何布朗运动（jump_intensity > 0 时为 Merton 跳跃扩散）K 线，返回 shape=(n, 6) 的数组
+
+    mu/sigma 为年化漂移和波动率，jump_intensity 为每年的平均跳跃次数，跳跃幅度为对数正态。
+    rng 为 numpy Generator，分批调用时传入上一批最后的收盘价和时间即可无缝衔接。
+    """
+    dt = step_ms / YEAR_MS
+    bar_sigma = sigma * np.sqrt(dt)
+    log_ret = (mu - 0.5 * sigma ** 2) * dt + bar_sigma * rng.standard_normal(n)
+    if jump_intensity > 0:
+        jumps = rng.poisson(jump_intensity * dt, n)
+        hit = jumps > 0
+        log_ret[hit] += rng.normal(jump_mean * jumps[hit], jump_std * np.sqrt(jumps[hit]))
+
+    close = start_price * np.exp(np.cumsum(log_ret))
+    open_ = np.empty(n)
+    open_[0] = start_price
+    open_[1:] = close[:-1]
+    # 影线长度按单根 K 线波动率的半正态分布近似
+    high = np.maximum(open_, close) * np.exp(np.abs(rng.standard_normal(n)) * bar_sigma * 0.5)
+    low = np.minimum(open_, close) * np.exp(-np.abs(rng.standard_normal(n)) * bar_sigma * 0.5)
+    # 成交量与波动幅度正相关
+    volume = volume_mean * rng.lognormal(0.0, 0.5, n) * (1.0 + np.abs(log_ret) / bar_sigma)
+    ts = start_ms + np.arange(n, dtype=np.float64) * step_ms
+    return np.column_stack([ts, open_, high, low, close, volume])
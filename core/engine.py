@@ -1,17 +1,130 @@
-import matplotlib
-matplotlib.use('Agg')  # Prevent GUI backend issues
 import backtrader as bt
 # import datetime
-from datetime import datetime
+from datetime import datetime, timedelta
+import time
 import numpy as np
 import pandas as pd
 import json
+import re
+import multiprocessing
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait, FIRST_COMPLETED
 from core.strategy.base import SmaCross  # 暂时硬编码，后续做动态加载
-from core.brokers.okx import OKXStore
+from core.data.bar_store import BarStore, timeframe_to_ms, to_ms
+from core.data.history import HistoricalFetcher
+from core.data.resample import Resampler
+from core.data.align import align_bars
+from core.data.frame_feed import FrameData
+from core.analyzers import SymbolStats, Ledger, Progress
+from core.ledger import fill_markers, vector_ledger
+from core.metrics import compute_metrics, resolve_metrics
+from core.vector import simulate, daily_sharpe, max_drawdown
+from core.result_cache import ResultCache, strategy_version
+from core.charting import chart_rows, line_rows, index_to_ms, CHART_MAX_POINTS
+from config.settings import settings
+
+STRATEGIES = {
+    "SmaCross": SmaCross,
+}
+
+
+def get_strategy_class(strategy_name):
+    # 这里应该根据 strategy_name 动态加载
+    # 暂时只支持 SmaCross
+    if strategy_name not in STRATEGIES:
+        raise ValueError(f"Unknown strategy: {strategy_name}")
+    return STRATEGIES[strategy_name]
+
+
+def bar_range(start_date, end_date, timeframe='1h'):
+    """回测区间对应的 [start_ms, end_ms)，结束日期包含当天，且只取已收盘的 K 线"""
+    step = timeframe_to_ms(timeframe)
+    start_ms = to_ms(start_date)
+    end_ms = min(to_ms(end_date + timedelta(days=1)), int(time.time() * 1000) // step * step)
+    return start_ms, end_ms
+
+
+def ensure_bars(symbol, start_date, end_date, timeframe='1h', store=None):
+    """只分页并发下载回测区间内缺失的部分，返回区间"""
+    store = store or BarStore()
+    start_ms, end_ms = bar_range(start_date, end_date, timeframe)
+    fill_missing(store, symbol, timeframe, start_ms, end_ms)
+    return start_ms, end_ms
+
+
+def fill_missing(store, symbol, timeframe, start_ms, end_ms):
+    # 数据齐全时不创建交易所客户端
+    if store.find_gaps(symbol, timeframe, start_ms, end_ms):
+        HistoricalFetcher(store=store).fill_gaps(symbol, timeframe, start_ms, end_ms)
+
+
+def get_bar_source():
+    """
+    按 settings.BAR_SOURCE 选择 K 线数据源，都提供 read()/fingerprint()
+    本地库在设置了 BASE_TIMEFRAME 时只保存基础周期，其余周期由 Resampler 聚合派生
+    """
+    if settings.BAR_SOURCE == 'mongo':
+        from core.data.mongo_bars import MongoBarRepository
+        return MongoBarRepository()
+    store = BarStore()
+    return Resampler(store) if settings.BASE_TIMEFRAME else store
+
+
+def prepare_bars(symbol, start_date, end_date, timeframe='1h', source=None):
+    """返回 (数据源, start_ms, end_ms)；本地 K 线库缺数据时先下载（派生周期只下载基础周期），MongoDB 数据源只读"""
+    source = source or get_bar_source()
+    start_ms, end_ms = bar_range(start_date, end_date, timeframe)
+    if isinstance(source, Resampler):
+        if timeframe != source.base:
+            source.check_timeframe(timeframe)
+        fill_missing(source.store, symbol, source.base, start_ms, end_ms)
+    elif isinstance(source, BarStore):
+        fill_missing(source, symbol, timeframe, start_ms, end_ms)
+    return source, start_ms, end_ms
+
+
+def read_bars(symbol, start_date, end_date, timeframe='1h', source=None):
+    """读取 [start_date, end_date] 的 K 线列数组（BarStore.read 格式）"""
+    source, start_ms, end_ms = prepare_bars(symbol, start_date, end_date, timeframe, source)
+    return source.read(symbol, timeframe, start_ms, end_ms)
+
+
+def bars_frame(bars):
+    return pd.DataFrame({
+        'open': bars['open'],
+        'high': bars['high'],
+        'low': bars['low'],
+        'close': bars['close'],
+        'volume': bars['volume'],
+    }, index=pd.to_datetime(bars['timestamp'], unit='ms'))
+
+
+def load_bars(symbol, start_date, end_date, timeframe='1h', source=None):
+    """
+    读取 [start_date, end_date] 的 K 线为 DataFrame
+    默认读取本地列式 K 线库，缺数据时才下载；BAR_SOURCE=mongo 时从 MongoDB 读取
+    """
+    return bars_frame(read_bars(symbol, start_date, end_date, timeframe, source))
+
+
+def bt_timeframe(timeframe):
+    """ccxt 周期 -> (backtrader TimeFrame, compression)"""
+    minutes = timeframe_to_ms(timeframe) // 60000
+    if minutes % 1440 == 0:
+        return bt.TimeFrame.Days, minutes // 1440
+    return bt.TimeFrame.Minutes, minutes
+
+
+def build_chart_data(df, max_points=CHART_MAX_POINTS):
+    # 降采样时保留每个桶内的最高/最低价，避免尖峰在图上消失
+    return chart_rows(index_to_ms(df.index), df['open'].to_numpy(), df['high'].to_numpy(),
+                      df['low'].to_numpy(), df['close'].to_numpy(), max_points)
+
 
 class BacktestEngine:
     def __init__(self, start_date, end_date, initial_cash=100000.0):
-        self.cerebro = bt.Cerebro()
+        # 不添加默认 observer（只用于 cerebro.plot，结果全部来自 analyzer）
+        self.cerebro = bt.Cerebro(stdstats=False)
         self.start_date = start_date
         self.end_date = end_date
         self.initial_cash = initial_cash
@@ -19,157 +132,492 @@ class BacktestEngine:
         # 设置单笔交易资金
         self.cerebro.addsizer(bt.sizers.PercentSizer, percents=1)
         self.data = None # Store dataframe for plotting later
+        self.symbols = []
         
-    def load_data(self, symbol="EURUSD", timeframe=bt.TimeFrame.Minutes):
-        # TODO: Replace with MongoDB fetch
-        # Mocking data for now using simple generated data or file
-        # For demonstration, let's create a dummy dataframe
-        
-        # 模拟生成更真实的随机游走数据
-        # dates = pd.date_range(start=self.start_date, end=self.end_date, freq='1H')
-        
-        # 初始价格
-        # price = 1.1000
-        dates = []
-        prices = []
-        opens = []
-        highs = []
-        lows = []
-        closes = []
-        volumes = []
-        
-        # for _ in range(len(dates)):
-        #     # 增加波动率，模拟更真实的行情
-        #     change = 0.005 - np.random.normal(0, 0.01) # 0.2% 的标准差波动
-        #     open_p = price
-        #     close_p = price * (1 + change)
-            
-        #     # 生成 High/Low
-        #     high_p = max(open_p, close_p) * (1 + abs(np.random.normal(0, 0.01)))
-        #     low_p = min(open_p, close_p) * (1 - abs(np.random.normal(0, 0.01)))
-            
-        #     opens.append(open_p)
-        #     highs.append(high_p)
-        #     lows.append(lows)
-        #     closes.append(close_p)
-            
-        #     # 更新下一次的基础价格
-        #     price = close_p
-        
-        # 使用okx_sotre
-        okx_store = OKXStore.get_instance()
-        ohlcv = okx_store.exchange.fetch_ohlcv(symbol, '1h', limit=200)
-        
-        for candle in ohlcv:  # 显示最后3条
-            timestamp, open_price, high, low, close, volume = candle
-            dt = datetime.fromtimestamp(timestamp / 1000.0)
-            dates.append(dt)
-            opens.append(open_price)
-            highs.append(high)
-            lows.append(low)
-            closes.append(close)
-            volumes.append(volume)
-            
-        self.data = pd.DataFrame({
-            'open': opens,
-            'high': highs,
-            'low': lows,
-            'close': closes,
-            'volume': volumes,
-        }, index=dates)
-        
-        feed = bt.feeds.PandasData(dataname=self.data)
-        self.cerebro.adddata(feed)
+    def load_data(self, symbol="EURUSD", timeframe='1h', extra_timeframes=()):
+        """
+        加载主周期数据；extra_timeframes 中的更大周期作为附加数据源（self.datas[1:]，
+        名称为周期字符串，可用 getdatabyname('4h') 获取），由同一份基础周期数据聚合，不额外下载
+        """
+        source = get_bar_source()
+        self.set_data(load_bars(symbol, self.start_date, self.end_date, timeframe, source))
+        for tf in extra_timeframes:
+            self.add_timeframe(load_bars(symbol, self.start_date, self.end_date, tf, source), tf, timeframe)
+
+    def set_data(self, df, name=None):
+        """直接使用已加载的 DataFrame（参数寻优时多次回测共用一份数据）"""
+        if self.data is None:
+            self.data = df
+        feed = FrameData(dataname=df)
+        self.cerebro.adddata(feed, name=name)
+        if name is not None:
+            self.symbols.append(name)
+
+    def load_portfolio(self, symbols, timeframe='1h'):
+        """
+        组合回测: 并发加载多个标的，对齐到共同时间轴后各作为一个数据源（名称为标的），共享同一账户资金
+        """
+        source = get_bar_source()
+        workers = max(1, min(len(symbols), settings.HISTORY_FETCH_WORKERS))
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            series = list(pool.map(
+                lambda symbol: read_bars(symbol, self.start_date, self.end_date, timeframe, source), symbols))
+        for symbol, bars in zip(symbols, series):
+            if len(bars['timestamp']) == 0:
+                raise ValueError(f"No data for {symbol}")
+        for symbol, bars in zip(symbols, align_bars(series)):
+            self.set_data(bars_frame(bars), name=symbol)
+
+    def add_timeframe(self, df, timeframe, base_timeframe='1h'):
+        """
+        添加更大周期的数据源。K 线时间戳是周期起点，而 backtrader 在某根主周期 K 线的时间点
+        才能看到它的收盘，所以大周期 K 线要标记在其最后一根主周期 K 线上，避免提前看到收盘价
+        """
+        shift = timeframe_to_ms(timeframe) - timeframe_to_ms(base_timeframe)
+        df = df.set_axis(df.index + pd.Timedelta(milliseconds=shift), axis=0)
+        bt_tf, compression = bt_timeframe(timeframe)
+        feed = FrameData(dataname=df, timeframe=bt_tf, compression=compression)
+        feed.auxiliary = True  # 只作参考，策略不在其上下单
+        self.cerebro.adddata(feed, name=timeframe)
+
     def add_strategy(self, strategy_class, **kwargs):
         self.cerebro.addstrategy(strategy_class, **kwargs)
 
-    def add_analyzers(self):
-        # 夏普率需要足够的样本数和正确的 timeframe 参数
-        # timeframe=bt.TimeFrame.Minutes, compression=60 (如果是小时线)
-        # riskfreerate 默认是 0.01 (1%)
-        self.cerebro.addanalyzer(bt.analyzers.SharpeRatio, _name='sharpe', timeframe=bt.TimeFrame.Days, compression=1, riskfreerate=0.0)
-        self.cerebro.addanalyzer(bt.analyzers.DrawDown, _name='drawdown')
-        self.cerebro.addanalyzer(bt.analyzers.TradeAnalyzer, _name='trades')
-        self.cerebro.addanalyzer(bt.analyzers.Returns, _name='returns')
-        # Add transactions analyzer to get trade details
-        self.cerebro.addanalyzer(bt.analyzers.Transactions, _name='transactions')
-
-    def run(self):
-        self.add_analyzers()
+    def add_analyzers(self, progress=None):
+        # 指标（core.metrics）、买卖点和权益曲线全部在回测结束后由 Ledger 的数组计算，
+        # 不再叠加 SharpeRatio/DrawDown/TradeAnalyzer/Transactions 等分析器；参数寻优时只有 Ledger
+        self.cerebro.addanalyzer(Ledger, _name='ledger')
+        if len(self.symbols) > 1:
+            self.cerebro.addanalyzer(SymbolStats, _name='symbols')
+        if progress is not None:
+            self.cerebro.addanalyzer(Progress, _name='progress', callback=progress)
+
+    def run(self, include_chart=True, include_equity=False, progress=None, metrics='core'):
+        """
+        include_equity=True 时结果中附带逐根 K 线的权益 equity_curve: {'timestamp', 'value'}（numpy 数组）
+        progress: 进度回调，参数见 core.analyzers.Progress
+        metrics: 指标集合名（core/risk/trades/full）或指标名列表，见 core.metrics
+        运行后 self.ledger 为完整的成交流水和权益数组（格式见 core.analyzers.Ledger）
+        """
+        self.add_analyzers(progress)
         results = self.cerebro.run()
         strat = results[0]
         
-        return self._parse_results(strat)
-
-    def _parse_results(self, strat):
-        # Extract analyzer results
-        sharpe = strat.analyzers.sharpe.get_analysis()
-        drawdown = strat.analyzers.drawdown.get_analysis()
-        trades = strat.analyzers.trades.get_analysis()
-        returns = strat.analyzers.returns.get_analysis()
+        result = self._parse_results(strat, include_chart=include_chart, metrics=metrics)
+        if include_equity:
+            result["equity_curve"] = self.ledger['equity']
+        return result
+
+    def _parse_results(self, strat, include_chart=True, metrics='core'):
+        self.ledger = strat.analyzers.ledger.get_analysis()
         
         # Extract chart data (OHLC)
         chart_data = []
-        if self.data is not None:
-            chart_data = []
-            # Resample if too many points to avoid browser lag
-            df_chart = self.data.copy()
-            if len(df_chart) > 2000:
-               df_chart = df_chart.iloc[::max(1, len(df_chart)//1000)] # Simple thinning
-            
-            for index, row in df_chart.iterrows():
-                chart_data.append([
-                    index.strftime("%Y-%m-%d %H:%M"),
-                    row['open'],
-                    row['close'],
-                    row['low'],
-                    row['high']
-                ])
+        if include_chart and self.data is not None:
+            chart_data = build_chart_data(self.data)
         
-        # Extract Trade Signals (Buy/Sell points) from observers or analyze trades
-        # Using transactions analyzer
-        transactions = strat.analyzers.transactions.get_analysis()
-        trade_markers = []
-        for dt, txn_info in transactions.items():
-            # txn_info is a list of [amount, price, sid, symbol, value]
-            # We only care about the first one for simplicity or iterate
-            # amount > 0 is buy, < 0 is sell
-            amount = txn_info[0][0]
-            price = txn_info[0][1]
-            trade_markers.append({
-                "date": dt.strftime("%Y-%m-%d %H:%M"),
-                "type": "buy" if amount > 0 else "sell",
-                "price": price,
-                "amount": abs(amount)
-            })
+        # 买卖点: 每笔成交一个（同一根 K 线上的多笔成交都保留），组合回测时带标的名
+        portfolio = len(self.symbols) > 1
+        trade_markers = fill_markers(self.ledger, with_symbol=portfolio) if include_chart else []
 
-        return {
-            "final_value": self.cerebro.broker.getvalue(),
-            "pnl": self.cerebro.broker.getvalue() - self.initial_cash,
-            # SharpeRatio may return None if insufficient data or no trades
-            "sharpe_ratio": sharpe.get('sharperatio', 0.0) if sharpe.get('sharperatio') is not None else 0.0,
-            "max_drawdown": float(drawdown.get('max', {}).get('drawdown', 0.0)),
-            "total_trades": trades.get('total', {}).get('total', 0),
-            "win_rate": trades.get('won', {}).get('total', 0) / max(1, trades.get('total', {}).get('total', 1)),
-            "chart_data": chart_data, # OHLC data for charts
-            "trade_markers": trade_markers # Buy/Sell points
-        }
-def run_backtest_task(strategy_name: str, symbol: str, params: dict, start_date: str, end_date: str):
+        result = compute_metrics(self.ledger, self.initial_cash, metrics)
+        result["chart_data"] = chart_data # OHLC data for charts
+        result["trade_markers"] = trade_markers # Buy/Sell points
+        if portfolio:
+            # 按标的拆分的统计，chart_data 为第一个标的
+            result["symbols"] = dict(strat.analyzers.symbols.get_analysis())
+        return result
+
+
+class VectorBacktestEngine:
+    """
+    NumPy 向量化回测，用于参数筛选；策略需实现 signals(bars, **params) 返回 (entries, exits)。
+    撮合规则与 BacktestEngine 一致（下一根开盘成交、PercentSizer），最终验证仍使用 backtrader。
+    """
+    def __init__(self, start_date, end_date, initial_cash=100000.0):
+        self.start_date = start_date
+        self.end_date = end_date
+        self.initial_cash = initial_cash
+        # 与 BacktestEngine 的 PercentSizer 保持一致
+        self.percents = 1
+        self.data = None
+        self.strategy_class = None
+        self.params = {}
+
+    def load_data(self, symbol="EURUSD", timeframe='1h', extra_timeframes=()):
+        if extra_timeframes:
+            raise ValueError("vector mode does not support extra timeframes")
+        self.set_data(load_bars(symbol, self.start_date, self.end_date, timeframe))
+
+    def set_data(self, df):
+        self.data = df
+
+    def load_portfolio(self, symbols, timeframe='1h'):
+        raise ValueError("vector mode does not support portfolio backtests")
+
+    def add_strategy(self, strategy_class, **kwargs):
+        if not hasattr(strategy_class, 'signals'):
+            raise ValueError(f"{strategy_class.__name__} does not support vector mode")
+        self.strategy_class = strategy_class
+        self.params = kwargs
+
+    def run(self, include_chart=True, include_equity=False, progress=None, metrics='core'):
+        df = self.data
+        bars = {col: df[col].to_numpy(dtype=np.float64) for col in ('open', 'high', 'low', 'close', 'volume')}
+        bars['timestamp'] = index_to_ms(df.index)
+
+        entries, exits = self.strategy_class.signals(bars, **self.params)
+        sim = simulate(bars['open'], bars['close'], np.asarray(entries, dtype=bool), np.asarray(exits, dtype=bool),
+                       self.initial_cash, self.percents)
+        self.ledger = vector_ledger(bars['timestamp'], sim['equity'], sim)
+        result = compute_metrics(self.ledger, self.initial_cash, metrics)
+        result["chart_data"] = build_chart_data(df) if include_chart else []
+        result["trade_markers"] = fill_markers(self.ledger) if include_chart else []
+        if include_equity:
+            result["equity_curve"] = self.ledger['equity']
+        if progress is not None:
+            # 向量化回测一次完成，只报告最终状态
+            bars_count = len(sim['equity'])
+            progress(bars=bars_count, total_bars=bars_count, equity=result["final_value"], pnl=result["pnl"],
+                     trades=result["total_trades"], max_drawdown=result["max_drawdown"], elapsed=None, eta=0.0)
+        return result
+
+
+ENGINES = {
+    "backtrader": BacktestEngine,
+    "vector": VectorBacktestEngine,
+}
+
+
+def get_engine_class(mode):
+    if mode not in ENGINES:
+        raise ValueError(f"Unknown engine mode: {mode}")
+    return ENGINES[mode]
+
+
+def run_backtest_task(strategy_name: str, symbol: str, params: dict, start_date: str, end_date: str, mode: str = "backtrader",
+                      use_cache: bool = True, timeframe: str = '1h', extra_timeframes: list = None,
+                      symbols: list = None, initial_cash: float = 100000.0, progress=None, ledger_id: str = None,
+                      metrics='core'):
+    """
+    symbols 有多个标的时为组合回测（共享资金，对齐时间轴），此时忽略 symbol
+    progress: 进度回调（如 ProgressPublisher.update），命中结果缓存时不调用
+    ledger_id: 不为空且 LEDGER_STORE_ENABLED 时，回测结束后把完整成交流水和权益曲线批量写入 MongoDB，
+        结果中的 ledger_id 为流水所在的 run_id；命中结果缓存时不重新回测，ledger_id 链接到首次运行的流水
+    metrics: 返回的指标集合（见 core.metrics.METRIC_SETS）或指标名列表
+    """
     # 解析日期
     start = datetime.strptime(start_date, "%Y-%m-%d")
     end = datetime.strptime(end_date, "%Y-%m-%d")
+    strategy_class = get_strategy_class(strategy_name)
+    engine_class = get_engine_class(mode)
+    extra_timeframes = list(extra_timeframes or [])
+    symbols = list(symbols or [symbol])
+    metrics = resolve_metrics(metrics)
+    if len(symbols) > 1 and extra_timeframes:
+        raise ValueError("extra_timeframes is not supported for portfolio backtests")
+
+    # 相同策略版本/参数/区间/数据版本的结果直接从缓存返回，不再运行回测
+    cache = ResultCache() if use_cache and settings.RESULT_CACHE_ENABLED else None
+    if cache:
+        data_versions = []
+        for sym in symbols:
+            source, start_ms, end_ms = prepare_bars(sym, start, end, timeframe)
+            data_versions.append(source.fingerprint(sym, timeframe, start_ms, end_ms))
+        cache_key = cache.make_key(
+            strategy_name=strategy_name,
+            strategy_version=strategy_version(strategy_class),
+            params=params,
+            symbol=symbols[0] if len(symbols) == 1 else symbols,
+            start_date=start_date,
+            end_date=end_date,
+            timeframe=timeframe,
+            extra_timeframes=extra_timeframes,
+            initial_cash=initial_cash,
+            data_version=data_versions[0] if len(symbols) == 1 else data_versions,
+            mode=mode,
+            metrics=metrics,
+        )
+        cached = cache.get(cache_key)
+        if cached is not None:
+            if ledger_id and settings.LEDGER_STORE_ENABLED and cached.get('ledger_id'):
+                link_ledger(ledger_id, cached['ledger_id'])
+            return cached
     
-    engine = BacktestEngine(start, end)
-    engine.load_data(symbol=symbol) # Mock data
-    
-    # 这里应该根据 strategy_name 动态加载
-    # 暂时只支持 SmaCross
-    if strategy_name == "SmaCross":
-        engine.add_strategy(SmaCross, **params)
+    engine = engine_class(start, end, initial_cash)
+    if len(symbols) > 1:
+        engine.load_portfolio(symbols, timeframe=timeframe)
     else:
-        raise ValueError(f"Unknown strategy: {strategy_name}")
+        engine.load_data(symbol=symbols[0], timeframe=timeframe, extra_timeframes=extra_timeframes)
+    engine.add_strategy(strategy_class, **params)
         
-    result = engine.run()
+    result = engine.run(progress=progress, metrics=metrics)
+    if ledger_id and settings.LEDGER_STORE_ENABLED and save_ledger(ledger_id, engine.ledger, symbols[0]):
+        result["ledger_id"] = ledger_id
+    if cache:
+        cache.set(cache_key, result)
     return result
 
 
+def save_ledger(run_id, ledger, symbol=None):
+    """流水写入失败只打印错误，不影响回测结果；返回是否写入成功"""
+    from core.data.mongo_ledger import LedgerRepository
+    try:
+        LedgerRepository().save(run_id, ledger, symbol)
+        return True
+    except Exception as e:
+        print(f"Error saving ledger {run_id}: {e}")
+        return False
+
+
+def link_ledger(run_id, source_run_id):
+    from core.data.mongo_ledger import LedgerRepository
+    try:
+        LedgerRepository().link(run_id, source_run_id)
+    except Exception as e:
+        print(f"Error linking ledger {run_id}: {e}")
+
+
+# 前推窗口长度单位（毫秒）
+WINDOW_UNITS = {'m': 60 * 1000, 'h': 3600 * 1000, 'd': 24 * 3600 * 1000, 'w': 7 * 24 * 3600 * 1000}
+
+
+def parse_window(spec):
+    """窗口长度: 整数为 K 线根数，字符串如 "90d"/"12h"/"4w" 为时间长度；返回 ('bars', n) 或 ('ms', n)"""
+    if isinstance(spec, int) or (isinstance(spec, str) and spec.strip().isdigit()):
+        n = int(spec)
+        kind = 'bars'
+    else:
+        match = re.fullmatch(r'(\d+)([mhdw])', str(spec).strip())
+        if not match:
+            raise ValueError(f"Invalid window: {spec}")
+        n = int(match.group(1)) * WINDOW_UNITS[match.group(2)]
+        kind = 'ms'
+    if n <= 0:
+        raise ValueError(f"Window must be positive: {spec}")
+    return kind, n
+
+
+def walk_forward_windows(timestamps, train, test, step=None, anchored=False):
+    """
+    按训练/测试窗口切分 K 线，返回 [(train_start, test_start, test_end), ...] 行下标，
+    训练段为 [train_start, test_start)，测试段为 [test_start, test_end)。
+    step 为窗口前移距离（默认等于 test，测试段首尾相接；小于 test 时测试段重叠，大于 test 时相邻测试段之间有间隔）；
+    anchored=True 时训练段起点固定在第一根。
+    最后一个测试段可能不足 test 长度。
+    """
+    timestamps = np.asarray(timestamps, dtype=np.int64)
+    n = len(timestamps)
+    train, test = parse_window(train), parse_window(test)
+    step = parse_window(step) if step is not None else test
+
+    def advance(idx, window):
+        kind, size = window
+        if kind == 'bars':
+            return idx + size
+        if idx >= n:
+            return n
+        return max(idx + 1, int(np.searchsorted(timestamps, timestamps[idx] + size)))
+
+    windows = []
+    start = 0
+    test_start = advance(0, train)
+    while test_start < n:
+        test_end = min(advance(test_start, test), n)
+        windows.append((0 if anchored else start, test_start, test_end))
+        if test_end >= n:
+            break
+        start = advance(start, step)
+        test_start = advance(test_start, step)
+    return windows
+
+
+def warmup_bars_for(params):
+    """样本外验证的默认预热长度: 最大的整数参数 + 1（如 SMA 周期，保证测试段第一根就有有效信号）"""
+    periods = [v for v in params.values() if isinstance(v, int) and not isinstance(v, bool)]
+    return max(periods) + 1 if periods else 0
+
+
+@contextmanager
+def _walk_forward_pool(max_workers, data):
+    """
+    前推优化的执行器: 一般为进程池；在 daemon 进程中（如 Celery prefork 子进程，不允许再创建子进程）
+    改用线程池，所有线程共享本进程的同一份数据，结束后释放
+    """
+    from core.optimize import _init_worker
+    if not multiprocessing.current_process().daemon:
+        with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker, initargs=(data,)) as pool:
+            yield pool
+        return
+    _init_worker(data)
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            yield pool
+    finally:
+        _init_worker(None)
+
+
+class WalkForwardEngine:
+    """
+    前推优化: 每个窗口先在训练段上做参数寻优，再用最优参数在紧随其后的测试段上验证，
+    各测试段的权益按收益率首尾相接得到样本外权益曲线（每个测试段从空仓开始）。
+
+    数据只加载一次，通过进程池 initializer 下发到每个 worker，任务只携带窗口的行下标，
+    worker 对本地同一份 DataFrame 做 iloc 行切片（视图，不复制）。所有窗口的寻优分片一次性提交，
+    某个窗口的分片全部完成后立即提交它的验证任务，窗口之间没有同步点，耗时随进程数线性下降。
+    在 Celery worker 中运行时改用线程池（见 _walk_forward_pool）。
+    """
+    def __init__(self, start_date, end_date, initial_cash=100000.0):
+        self.start_date = start_date
+        self.end_date = end_date
+        self.initial_cash = initial_cash
+        self.data = None
+
+    def load_data(self, symbol="EURUSD", timeframe='1h'):
+        self.set_data(load_bars(symbol, self.start_date, self.end_date, timeframe))
+
+    def set_data(self, df):
+        self.data = df
+
+    def windows(self, train, test, step=None, anchored=False):
+        return walk_forward_windows(index_to_ms(self.data.index), train, test, step, anchored)
+
+    def run(self, strategy_name, param_grid, train, test, step=None, anchored=False, sort_by='sharpe_ratio',
+            mode='vector', oos_mode='backtrader', warmup_bars=None, max_workers=None, chunk_size=20, progress=None):
+        """
+        mode: 训练段寻优使用的引擎（默认向量化）；oos_mode: 测试段验证使用的引擎（默认 backtrader）
+        warmup_bars: 测试段之前额外带入的预热 K 线数，默认由 warmup_bars_for(最优参数) 决定
+        progress: 进度回调，每个窗口寻优完成时调用 progress(windows=, total_windows=, elapsed=, eta=)
+        """
+        from core.optimize import expand_grid, rank_results, chunked, _run_slice_chunk, _validate_slice
+
+        get_strategy_class(strategy_name)
+        get_engine_class(mode)
+        get_engine_class(oos_mode)
+        combos = expand_grid(param_grid)
+        windows = self.windows(train, test, step, anchored)
+        if not windows:
+            raise ValueError("Not enough data for a single train/test window")
+
+        rows = {w: [] for w in range(len(windows))}
+        pending = {w: 0 for w in range(len(windows))}
+        best = {}
+        validations = {}
+        started = time.monotonic()
+        with _walk_forward_pool(max_workers, self.data) as pool:
+            sweeps = {}
+            for w, (train_start, test_start, _) in enumerate(windows):
+                for chunk in chunked(combos, chunk_size):
+                    future = pool.submit(_run_slice_chunk, strategy_name, train_start, test_start, chunk,
+                                         self.initial_cash, mode)
+                    sweeps[future] = w
+                    pending[w] += 1
+
+            remaining = set(sweeps)
+            while remaining:
+                done, remaining = wait(remaining, return_when=FIRST_COMPLETED)
+                for future in done:
+                    w = sweeps[future]
+                    rows[w].extend(future.result())
+                    pending[w] -= 1
+                    if pending[w]:
+                        continue
+                    if progress is not None:
+                        done_windows = sum(1 for n in pending.values() if n == 0)
+                        elapsed = time.monotonic() - started
+                        progress(windows=done_windows, total_windows=len(windows), elapsed=elapsed,
+                                 eta=elapsed * (len(windows) - done_windows) / done_windows)
+                    ranked = rank_results(rows[w], sort_by, top_n=1)
+                    if not ranked or 'error' in ranked[0]:
+                        continue
+                    best[w] = ranked[0]
+                    _, test_start, test_end = windows[w]
+                    warmup = warmup_bars_for(best[w]['params']) if warmup_bars is None else warmup_bars
+                    lo = max(0, test_start - warmup)
+                    validations[w] = (lo, pool.submit(_validate_slice, strategy_name, lo, test_end,
+                                                      best[w]['params'], self.initial_cash, oos_mode))
+            validations = {w: (lo, future.result()) for w, (lo, future) in validations.items()}
+
+        return self._stitch(windows, best, validations, rows)
+
+    def _stitch(self, windows, best, validations, rows):
+        """
+        拼接样本外权益: 每个测试段只取之前的测试段没有覆盖的部分（step < test 时相邻测试段重叠，重叠部分只计一次），
+        按收益率首尾相接；step > test 时测试段之间没有样本外数据，曲线直接跳过这些 K 线，并在 gaps 中列出
+        """
+        timestamps = index_to_ms(self.data.index)
+        value = self.initial_cash
+        trades = won = 0
+        results = []
+        gaps = []
+        parts = []
+        covered = windows[0][1]  # 已拼接到的行下标（不含）
+        for w, (train_start, test_start, test_end) in enumerate(windows):
+            window = {
+                "train_start": int(timestamps[train_start]),
+                "test_start": int(timestamps[test_start]),
+                "test_end": int(timestamps[test_end - 1]),
+                "train_bars": test_start - train_start,
+                "test_bars": test_end - test_start,
+            }
+            if test_start > covered:
+                gaps.append({"start": int(timestamps[covered]), "end": int(timestamps[test_start - 1]),
+                             "bars": test_start - covered})
+            seg_start = max(test_start, covered)
+            if w not in validations:
+                # 训练段所有参数组合都失败: 该测试段空仓
+                errors = [r['error'] for r in rows[w] if 'error' in r]
+                window["error"] = errors[0] if errors else "no valid parameters"
+                segment = np.full(max(0, test_end - seg_start), value)
+            else:
+                lo, oos = validations[w]
+                curve = oos.pop('equity')
+                k = test_start - lo
+                base = curve[k - 1] if k > 0 else self.initial_cash
+                oos_ts = timestamps[test_start:test_end]
+                window.update({
+                    "params": best[w]['params'],
+                    "in_sample": {key: v for key, v in best[w].items() if key != 'params'},
+                    "out_of_sample": {
+                        "return": float(curve[-1] / base - 1.0),
+                        "sharpe_ratio": daily_sharpe(oos_ts, curve[k:], base),
+                        "max_drawdown": max_drawdown(curve[k:]),
+                        "total_trades": oos['total_trades'],
+                        "win_rate": oos['win_rate'],
+                    },
+                })
+                trades += oos['total_trades']
+                won += oos['win_rate'] * oos['total_trades']
+                k = seg_start - lo
+                base = curve[k - 1] if k > 0 else self.initial_cash
+                segment = value * curve[k:] / base
+            if len(segment):
+                parts.append((seg_start, test_end, segment))
+                value = float(segment[-1])
+            covered = max(covered, test_end)
+            results.append(window)
+
+        oos_ts = np.concatenate([timestamps[a:b] for a, b, _ in parts])
+        equity = np.concatenate([segment for _, _, segment in parts])
+        return {
+            "final_value": value,
+            "pnl": value - self.initial_cash,
+            "sharpe_ratio": daily_sharpe(oos_ts, equity, self.initial_cash),
+            "max_drawdown": max_drawdown(equity),
+            "total_trades": trades,
+            "win_rate": won / max(1, trades),
+            "windows": results,
+            "gaps": gaps,
+            "oos_equity": line_rows(oos_ts, equity),
+        }
+
+def run_walk_forward_task(strategy_name: str, symbol: str, param_grid: dict, start_date: str, end_date: str,
+                          train='90d', test='30d', step=None, anchored: bool = False, timeframe: str = '1h',
+                          initial_cash: float = 100000.0, sort_by: str = 'sharpe_ratio', mode: str = 'vector',
+                          oos_mode: str = 'backtrader', warmup_bars: int = None, progress=None):
+    engine = WalkForwardEngine(datetime.strptime(start_date, "%Y-%m-%d"),
+                               datetime.strptime(end_date, "%Y-%m-%d"), initial_cash)
+    engine.load_data(symbol, timeframe)
+    return engine.run(strategy_name, param_grid, train, test, step, anchored, sort_by, mode, oos_mode,
+                      warmup_bars, max_workers=settings.WALK_FORWARD_WORKERS or None,
+                      chunk_size=settings.SWEEP_CHUNK_SIZE, progress=progress)
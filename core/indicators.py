@@ -0,0 +1,158 @@
+import hashlib
+import threading
+from array import array
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+import backtrader as bt
+from core.vector import sma, ema, atr, crossover
+from config.settings import settings
+
+
+def _sma_cross(get, fast, slow):
+    return crossover(get('sma', period=fast), get('sma', period=slow)).astype(np.float64)
+
+
+# name -> (输入列, 计算函数, 最小周期, backtrader 等价指标)
+# 计算函数的第一个参数 get 用来取同一份数据上的其他缓存指标，其余为输入列和指标参数
+INDICATORS = {
+    'sma': (
+        ('close',),
+        lambda get, close, period: sma(close, period),
+        lambda period: period,
+        lambda data, period: bt.ind.SMA(data, period=period),
+    ),
+    'ema': (
+        ('close',),
+        lambda get, close, period: ema(close, period),
+        lambda period: period,
+        lambda data, period: bt.ind.EMA(data, period=period),
+    ),
+    'atr': (
+        ('high', 'low', 'close'),
+        lambda get, high, low, close, period: atr(high, low, close, period),
+        lambda period: period + 1,
+        lambda data, period: bt.ind.ATR(data, period=period),
+    ),
+    'sma_cross': (
+        ('close',),
+        lambda get, close, fast, slow: _sma_cross(get, fast, slow),
+        lambda fast, slow: max(fast, slow) + 1,
+        lambda data, fast, slow: bt.ind.CrossOver(bt.ind.SMA(data, period=fast), bt.ind.SMA(data, period=slow)),
+    ),
+}
+
+
+def column_key(values):
+    """列内容的哈希，作为数据版本（同一份数据切片/重新加载后仍然命中）"""
+    values = np.ascontiguousarray(values, dtype=np.float64)
+    return hashlib.blake2b(values, digest_size=16).hexdigest()
+
+
+class IndicatorCache(object):
+    """
+    进程内指标缓存: 同一份数据上的同一指标只计算一次，参数寻优时各组合共用
+
+    key 为 (指标名, 参数, 输入列内容哈希)，按最近使用顺序淘汰，总内存不超过 max_bytes。
+    """
+    def __init__(self, max_bytes=None):
+        self.max_bytes = settings.INDICATOR_CACHE_MB * 1024 * 1024 if max_bytes is None else max_bytes
+        self.entries = OrderedDict()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.RLock()
+
+    def get(self, bars, name, **params):
+        """
+        bars 为含 open/high/low/close 列的 dict 或 DataFrame，返回与之等长的指标数组（只读，勿修改）
+        """
+        keys = {}
+
+        def column(col):
+            values = np.asarray(bars[col], dtype=np.float64)
+            if col not in keys:
+                keys[col] = column_key(values)
+            return values
+
+        def get(name, **params):
+            if name not in INDICATORS:
+                raise ValueError(f"Unknown indicator: {name}")
+            inputs, compute, _, _ = INDICATORS[name]
+            columns = [column(col) for col in inputs]
+            key = (name, tuple(sorted(params.items())), tuple(keys[col] for col in inputs))
+            with self.lock:
+                values = self.entries.get(key)
+                if values is not None:
+                    self.entries.move_to_end(key)
+                    self.hits += 1
+                    return values
+                self.misses += 1
+            values = compute(get, *columns, **params)
+            values.flags.writeable = False
+            self._put(key, values)
+            return values
+
+        return get(name, **params)
+
+    def _put(self, key, values):
+        with self.lock:
+            if key in self.entries or values.nbytes > self.max_bytes:
+                return
+            self.entries[key] = values
+            self.nbytes += values.nbytes
+            while self.nbytes > self.max_bytes:
+                _, evicted = self.entries.popitem(last=False)
+                self.nbytes -= evicted.nbytes
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.nbytes = 0
+
+    def stats(self):
+        return {'entries': len(self.entries), 'bytes': self.nbytes, 'hits': self.hits, 'misses': self.misses}
+
+
+# 每个进程一个（Celery worker / 寻优进程池 worker 各自缓存本进程的数据）
+indicator_cache = IndicatorCache()
+
+
+class Precomputed(bt.Indicator):
+    """把整列预计算好的指标数组作为 backtrader 指标线，runonce 时整段拷贝，不再逐根计算"""
+    lines = ('value',)
+    params = (
+        ('values', None),
+        ('period', 1),
+    )
+    plotinfo = dict(plot=False)
+
+    def __init__(self):
+        self.addminperiod(self.p.period)
+
+    def next(self):
+        self.lines.value[0] = self.p.values[len(self) - 1]
+
+    def once(self, start, end):
+        self.lines.value.array[start:end] = array('d', self.p.values[start:end].tobytes())
+
+
+def feed_frame(data):
+    """数据源背后的 DataFrame；实盘推送等非 DataFrame 数据源返回 None"""
+    if isinstance(data, bt.feeds.PandasData) and isinstance(data.p.dataname, pd.DataFrame):
+        return data.p.dataname
+    return None
+
+
+def indicator_line(data, name, **params):
+    """
+    数据源的指标线: DataFrame 数据源从 indicator_cache 取预计算结果，其他数据源退回等价的 bt.ind 指标
+    """
+    if name not in INDICATORS:
+        raise ValueError(f"Unknown indicator: {name}")
+    _, _, minperiod, fallback = INDICATORS[name]
+    frame = feed_frame(data)
+    if frame is None:
+        return fallback(data, **params)
+    values = indicator_cache.get(frame, name, **params)
+    return Precomputed(data, values=values, period=minperiod(**params))
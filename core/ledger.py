@@ -0,0 +1,47 @@
+import numpy as np
+
+
+def fill_markers(ledger, with_symbol=False):
+    """每笔成交一个买卖点 {date, type, price, amount[, symbol]}（同一根 K 线上的多笔成交都保留）"""
+    fills = ledger['fills']
+    names = ledger['datas']
+    markers = []
+    for ts, data, size, price in zip(fills['timestamp'].tolist(), fills['data'].tolist(),
+                                     fills['size'].tolist(), fills['price'].tolist()):
+        marker = {"date": ts, "type": "buy" if size > 0 else "sell", "price": price, "amount": abs(size)}
+        if with_symbol:
+            marker["symbol"] = names[data]
+        markers.append(marker)
+    return markers
+
+
+def vector_ledger(timestamps, equity, sim, name=''):
+    """向量化回测（core.vector.simulate 的结果）转为与 Ledger 分析器相同格式的流水"""
+    entry_idx = np.asarray(sim['entry_idx'], dtype=np.int64)
+    exit_idx = np.asarray(sim['exit_idx'], dtype=np.int64)
+    closed = len(exit_idx)
+    idx = np.concatenate([entry_idx, exit_idx])
+    size = np.concatenate([sim['size'], -sim['size'][:closed]])
+    price = np.concatenate([sim['entry_price'], sim['exit_price']])
+    # 同一根 K 线上先平仓后开仓
+    order = np.lexsort((size > 0, idx))
+    pnl = (sim['exit_price'] - sim['entry_price'][:closed]) * sim['size'][:closed]
+    return {
+        'datas': [name],
+        'equity': {'timestamp': timestamps, 'value': equity},
+        'fills': {
+            'timestamp': timestamps[idx[order]],
+            'data': np.zeros(len(idx), dtype=np.int32),
+            'size': size[order],
+            'price': price[order],
+            'value': (np.abs(size) * price)[order],
+            'commission': np.zeros(len(idx)),
+        },
+        'trades': {
+            'timestamp': timestamps[exit_idx],
+            'data': np.zeros(closed, dtype=np.int32),
+            'pnl': pnl,
+            'pnlcomm': pnl,
+        },
+        'opened': len(entry_idx),
+    }
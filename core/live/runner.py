@@ -0,0 +1,105 @@
+import threading
+import backtrader as bt
+from core.strategy.base import SmaCross
+from core.brokers.okx import OKXStore
+from core.engine import bt_timeframe
+
+
+class LiveSlot(object):
+    def __init__(self, name, strategy_class, params, symbol, timeframe):
+        self.name = name
+        self.strategy_class = strategy_class
+        self.params = params
+        self.symbol = symbol
+        self.timeframe = timeframe
+        self.cerebro = None
+        self.thread = None
+        self.result = None
+        self.error = None
+
+
+class LiveRunner:
+    """
+    单进程多策略实盘（OKX）
+
+    每个策略实例仍是独立的 cerebro（各自的持仓、订单和 next 循环，运行在各自的线程中），
+    但同一品种/周期的行情只订阅一次、只补一次数据（OKXStore 的 MarketDataBus 广播给所有数据源），
+    所有 broker 共用一个交易会话（OKXSession: 一个交易所连接、一个账户轮询线程、一个批量下单队列）。
+    增加策略只增加线程和 K 线缓冲，不增加交易所连接和限频消耗。
+
+    各策略的持仓从空仓开始，只由自己的订单形成；账户余额（getcash）是所有策略共用的。
+    """
+    def __init__(self, broker_type: str = "okx"):
+        if broker_type.lower() != "okx":
+            raise ValueError(f"LiveRunner does not support broker type: {broker_type}")
+        self.store = OKXStore.get_instance()
+        self.slots = []
+
+    def add(self, strategy_class, params: dict, symbol: str, timeframe: str = "1m", name: str = None):
+        name = name or f"{strategy_class.__name__}:{symbol}:{timeframe}"
+        if any(slot.name == name for slot in self.slots):
+            raise ValueError(f"Duplicate live strategy name: {name}")
+        slot = LiveSlot(name, strategy_class, params, symbol, timeframe)
+        self.slots.append(slot)
+        return slot
+
+    def setup(self):
+        for slot in self.slots:
+            cerebro = bt.Cerebro()
+            cerebro.setbroker(self.store.get_broker(seed_positions=False))
+            bt_tf, compression = bt_timeframe(slot.timeframe)
+            cerebro.adddata(self.store.get_data(slot.symbol, timeframe=bt_tf, compression=compression))
+            cerebro.addstrategy(slot.strategy_class, **slot.params)
+            slot.cerebro = cerebro
+        print(f"Setup {len(self.slots)} OKX live strategies on "
+              f"{len({(s.symbol, s.timeframe) for s in self.slots})} market data streams")
+
+    def _run_slot(self, slot):
+        try:
+            slot.result = slot.cerebro.run()
+        except Exception as e:
+            slot.error = e
+            print(f"Live strategy {slot.name} failed: {e}")
+
+    def start(self):
+        if any(slot.cerebro is None for slot in self.slots):
+            self.setup()
+        for slot in self.slots:
+            slot.thread = threading.Thread(target=self._run_slot, args=(slot,), name=f"live-{slot.name}", daemon=True)
+            slot.thread.start()
+
+    def stop(self, timeout=10):
+        for slot in self.slots:
+            if slot.cerebro is not None:
+                slot.cerebro.runstop()
+        self.join(timeout)
+
+    def join(self, timeout=None):
+        for slot in self.slots:
+            if slot.thread is not None:
+                slot.thread.join(timeout)
+
+    def run(self):
+        """启动所有策略并阻塞到全部结束（Ctrl+C 停止所有策略），返回 {name: 策略结果或异常}"""
+        print("Starting Live Trading Runner...")
+        self.start()
+        try:
+            while any(slot.thread.is_alive() for slot in self.slots):
+                self.join(timeout=1.0)
+        except KeyboardInterrupt:
+            print("Live Trading Stopped by User")
+            self.stop()
+        return {slot.name: slot.error or slot.result for slot in self.slots}
+
+
+if __name__ == "__main__":
+    # Test Run (requires valid config)
+    try:
+        runner = LiveRunner()
+        for symbol in ("BTC/USDT", "ETH/USDT"):
+            for pfast, pslow in ((5, 20), (10, 30)):
+                runner.add(SmaCross, {'pfast': pfast, 'pslow': pslow}, symbol,
+                           name=f"SmaCross({pfast},{pslow}):{symbol}")
+        runner.run()
+    except Exception as e:
+        print(f"Cannot run live runner test: {e}")
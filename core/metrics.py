@@ -0,0 +1,201 @@
+import math
+from functools import cached_property
+import numpy as np
+from core.data.bar_store import DAY_MS
+from core.vector import daily_sharpe, max_drawdown
+
+YEAR_MS = 365 * DAY_MS
+
+# 可选的指标集合；core 为回测结果/参数寻优默认返回的指标
+METRIC_SETS = {
+    'core': ('final_value', 'pnl', 'sharpe_ratio', 'max_drawdown', 'total_trades', 'win_rate'),
+    'risk': ('total_return', 'annual_return', 'volatility', 'sortino_ratio', 'calmar_ratio',
+             'max_drawdown', 'max_drawdown_bars'),
+    'trades': ('total_trades', 'closed_trades', 'win_rate', 'profit_factor', 'avg_trade_pnl', 'avg_win', 'avg_loss',
+               'best_trade', 'worst_trade', 'exposure', 'turnover'),
+}
+METRIC_SETS['full'] = tuple(dict.fromkeys(name for names in METRIC_SETS.values() for name in names))
+
+# 这些指标越小越好（参数寻优排序用）
+ASCENDING_METRICS = ('max_drawdown', 'max_drawdown_bars', 'volatility')
+
+
+def resolve_metrics(metrics='core'):
+    """指标集合名（core/risk/trades/full）、逗号分隔的名称或名称列表 -> 指标名元组"""
+    if isinstance(metrics, str):
+        if metrics in METRIC_SETS:
+            return METRIC_SETS[metrics]
+        metrics = [m.strip() for m in metrics.split(',') if m.strip()]
+    names = []
+    for name in metrics:
+        for metric in METRIC_SETS.get(name, (name,)):
+            if metric not in METRICS:
+                raise ValueError(f"Unknown metric: {metric}")
+            if metric not in names:
+                names.append(metric)
+    return tuple(names)
+
+
+def bar_size_ms(timestamps):
+    """数据的实际 K 线周期（相邻时间戳间隔的中位数，不受缺口影响），不足两根时按 1 天"""
+    if len(timestamps) < 2:
+        return DAY_MS
+    return int(np.median(np.diff(timestamps)))
+
+
+class _Context(object):
+    """一次回测的成交流水/权益数组，各中间量只计算一次"""
+    def __init__(self, ledger, initial_cash):
+        self.ledger = ledger
+        self.initial_cash = initial_cash
+        self.ts = np.asarray(ledger['equity']['timestamp'], dtype=np.int64)
+        self.equity = np.asarray(ledger['equity']['value'], dtype=np.float64)
+        self.trade_pnl = np.asarray(ledger['trades']['pnlcomm'], dtype=np.float64)
+
+    @cached_property
+    def bar_ms(self):
+        return bar_size_ms(self.ts)
+
+    @cached_property
+    def elapsed_ms(self):
+        """数据覆盖的实际时长（首尾时间差加一根 K 线），周末/休市缺口不计入 K 线数"""
+        return int(self.ts[-1] - self.ts[0]) + self.bar_ms if len(self.ts) else self.bar_ms
+
+    @cached_property
+    def periods_per_year(self):
+        """每年的 K 线数，按实际时长换算（对 24/7 数据即 YEAR_MS / bar_ms）"""
+        return len(self.ts) * YEAR_MS / self.elapsed_ms if len(self.ts) else YEAR_MS / self.bar_ms
+
+    @cached_property
+    def final_value(self):
+        return float(self.equity[-1]) if len(self.equity) else self.initial_cash
+
+    @cached_property
+    def returns(self):
+        """逐根 K 线收益（第一根相对初始资金）"""
+        if len(self.equity) == 0:
+            return np.empty(0)
+        prev = np.concatenate([[self.initial_cash], self.equity[:-1]])
+        return self.equity / prev - 1.0
+
+    @cached_property
+    def total_return(self):
+        return self.final_value / self.initial_cash - 1.0
+
+    @cached_property
+    def annual_return(self):
+        if len(self.equity) == 0:
+            return 0.0
+        if self.final_value <= 0:
+            return -1.0
+        return (self.final_value / self.initial_cash) ** (YEAR_MS / self.elapsed_ms) - 1.0
+
+    @cached_property
+    def max_drawdown(self):
+        return max_drawdown(self.equity)
+
+    @cached_property
+    def position(self):
+        """逐根 K 线是否有持仓（任一数据源）"""
+        fills = self.ledger['fills']
+        held = np.zeros(len(self.ts), dtype=bool)
+        if len(fills['size']) == 0:
+            return held
+        # 成交所在 K 线起（含）持仓为累计成交量
+        bar = np.searchsorted(self.ts, fills['timestamp'], side='left')
+        for data in np.unique(fills['data']):
+            mask = fills['data'] == data
+            change = np.zeros(len(self.ts) + 1)
+            np.add.at(change, bar[mask], fills['size'][mask])
+            size = np.cumsum(change[:-1])
+            # 浮点累加误差
+            held |= np.abs(size) > 1e-9 * max(1.0, np.abs(fills['size'][mask]).max())
+        return held
+
+
+def _sharpe_ratio(ctx):
+    # 按天（或大于 1 天的实际 K 线周期）分组的收益夏普，与之前 bt.analyzers.SharpeRatio(Days) 的结果一致
+    return daily_sharpe(ctx.ts, ctx.equity, ctx.initial_cash, period_ms=max(DAY_MS, ctx.bar_ms))
+
+
+def _volatility(ctx):
+    return float(ctx.returns.std() * math.sqrt(ctx.periods_per_year)) if len(ctx.returns) else 0.0
+
+
+def _sortino_ratio(ctx):
+    r = ctx.returns
+    if len(r) == 0:
+        return 0.0
+    downside = math.sqrt(float(np.mean(np.minimum(r, 0.0) ** 2)))
+    return float(r.mean() / downside * math.sqrt(ctx.periods_per_year)) if downside > 0 else 0.0
+
+
+def _calmar_ratio(ctx):
+    return ctx.annual_return / (ctx.max_drawdown / 100.0) if ctx.max_drawdown > 0 else 0.0
+
+
+def _max_drawdown_bars(ctx):
+    """最长的低于前高的连续 K 线数"""
+    if len(ctx.equity) == 0:
+        return 0
+    underwater = ctx.equity < np.maximum.accumulate(ctx.equity)
+    if not underwater.any():
+        return 0
+    # 每段水下区间的长度 = 区间结束位置 - 区间开始位置
+    edges = np.diff(np.concatenate([[0], underwater.astype(np.int8), [0]]))
+    return int((np.nonzero(edges == -1)[0] - np.nonzero(edges == 1)[0]).max())
+
+
+def _profit_factor(ctx):
+    """没有亏损交易时无定义（None），没有盈利时为 0"""
+    pnl = ctx.trade_pnl
+    loss = -pnl[pnl < 0].sum()
+    return float(pnl[pnl > 0].sum() / loss) if loss > 0 else None
+
+
+def _mean(values):
+    return float(values.mean()) if len(values) else 0.0
+
+
+def _turnover(ctx):
+    """成交额 / 平均权益"""
+    traded = float(ctx.ledger['fills']['value'].sum())
+    mean_equity = _mean(ctx.equity) or ctx.initial_cash
+    return traded / mean_equity
+
+
+METRICS = {
+    'final_value': lambda ctx: ctx.final_value,
+    'pnl': lambda ctx: ctx.final_value - ctx.initial_cash,
+    'sharpe_ratio': _sharpe_ratio,
+    'max_drawdown': lambda ctx: ctx.max_drawdown,
+    # 与 bt.analyzers.TradeAnalyzer 一致: 含未平仓交易，盈亏为 0 算盈利
+    'total_trades': lambda ctx: ctx.ledger['opened'],
+    'closed_trades': lambda ctx: len(ctx.trade_pnl),
+    'win_rate': lambda ctx: int(np.count_nonzero(ctx.trade_pnl >= 0.0)) / max(1, ctx.ledger['opened']),
+    'total_return': lambda ctx: ctx.total_return,
+    'annual_return': lambda ctx: ctx.annual_return,
+    'volatility': _volatility,
+    'sortino_ratio': _sortino_ratio,
+    'calmar_ratio': _calmar_ratio,
+    'max_drawdown_bars': _max_drawdown_bars,
+    'profit_factor': _profit_factor,
+    'avg_trade_pnl': lambda ctx: _mean(ctx.trade_pnl),
+    'avg_win': lambda ctx: _mean(ctx.trade_pnl[ctx.trade_pnl > 0]),
+    'avg_loss': lambda ctx: _mean(ctx.trade_pnl[ctx.trade_pnl < 0]),
+    'best_trade': lambda ctx: float(ctx.trade_pnl.max()) if len(ctx.trade_pnl) else 0.0,
+    'worst_trade': lambda ctx: float(ctx.trade_pnl.min()) if len(ctx.trade_pnl) else 0.0,
+    # 有持仓的 K 线占比
+    'exposure': lambda ctx: _mean(ctx.position),
+    'turnover': _turnover,
+}
+
+
+def compute_metrics(ledger, initial_cash, metrics='core'):
+    """
+    回测结束后由成交流水和权益数组（格式见 core.analyzers.Ledger）向量化计算指标
+    年化指标（annual_return/volatility/sortino_ratio/calmar_ratio）按数据覆盖的实际时长换算，
+    不假设数据 7×24 连续（外汇、贵金属的周末缺口不会放大年化值）
+    """
+    ctx = _Context(ledger, initial_cash)
+    return {name: METRICS[name](ctx) for name in resolve_metrics(metrics)}
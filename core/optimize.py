@@ -0,0 +1,144 @@
+import itertools
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+import numpy as np
+from core.engine import get_engine_class, get_strategy_class, load_bars
+from core.metrics import METRIC_SETS, ASCENDING_METRICS
+
+# 结果表中保留的指标（参数寻优只计算这些）
+METRIC_KEYS = METRIC_SETS['core']
+
+# 每个进程缓存最近加载的数据，同一 worker 上的多个分片任务只加载一次
+_DATA_CACHE = {}
+_DATA_CACHE_SIZE = 2
+
+# 进程池 worker 中共享的数据（由 initializer 注入，每个进程只反序列化一次）
+_worker_data = None
+
+
+def expand_grid(param_grid):
+    """
+    展开参数网格，取值可以是列表，或 {"start", "stop", "step"} 区间（包含 stop）
+    例如 {"pfast": [5, 10], "pslow": {"start": 20, "stop": 60, "step": 10}}
+    """
+    names = []
+    values = []
+    for name, spec in param_grid.items():
+        if isinstance(spec, dict):
+            start, stop, step = spec['start'], spec['stop'], spec.get('step', 1)
+            if step <= 0:
+                raise ValueError(f"step of '{name}' must be positive")
+            grid = np.arange(start, stop + step / 2.0, step).tolist()
+            if all(isinstance(v, int) for v in (start, stop, step)):
+                grid = [int(v) for v in grid]
+        elif isinstance(spec, (list, tuple)):
+            grid = list(spec)
+        else:
+            grid = [spec]
+        names.append(name)
+        values.append(grid)
+    return [dict(zip(names, combo)) for combo in itertools.product(*values)]
+
+
+def get_cached_bars(symbol, start_date, end_date, timeframe='1h'):
+    key = (symbol, start_date, end_date, timeframe)
+    if key not in _DATA_CACHE:
+        if len(_DATA_CACHE) >= _DATA_CACHE_SIZE:
+            _DATA_CACHE.pop(next(iter(_DATA_CACHE)))
+        _DATA_CACHE[key] = load_bars(symbol, start_date, end_date, timeframe)
+    return _DATA_CACHE[key]
+
+
+def run_combo(strategy_name, data, params, initial_cash, mode='backtrader'):
+    """用已加载的数据跑一组参数，只返回指标"""
+    engine = get_engine_class(mode)(None, None, initial_cash)
+    engine.set_data(data)
+    engine.add_strategy(get_strategy_class(strategy_name), **{'printlog': False, **params})
+    result = engine.run(include_chart=False, metrics=METRIC_KEYS)
+    row = {'params': params}
+    row.update({k: result[k] for k in METRIC_KEYS})
+    return row
+
+
+def run_combos(strategy_name, data, combos, initial_cash, mode='backtrader', memory_check=None):
+    """
+    memory_check: 每个组合之前调用（如 tasks.scheduler.check_memory），抛出异常时剩余组合不再运行，记为失败
+    """
+    rows = []
+    for i, params in enumerate(combos):
+        if memory_check is not None:
+            try:
+                memory_check()
+            except Exception as e:
+                rows.extend({'params': p, 'error': str(e)} for p in combos[i:])
+                break
+        try:
+            rows.append(run_combo(strategy_name, data, params, initial_cash, mode))
+        except Exception as e:
+            rows.append({'params': params, 'error': str(e)})
+    return rows
+
+
+def rank_results(rows, sort_by='sharpe_ratio', top_n=None):
+    """按指标排序，失败的组合排在最后"""
+    if sort_by not in METRIC_KEYS:
+        raise ValueError(f"Unknown metric: {sort_by}")
+    ok = [r for r in rows if 'error' not in r]
+    failed = [r for r in rows if 'error' in r]
+    ok.sort(key=lambda r: r[sort_by], reverse=sort_by not in ASCENDING_METRICS)
+    ranked = ok + failed
+    return ranked[:top_n] if top_n else ranked
+
+
+def _init_worker(data):
+    global _worker_data
+    _worker_data = data
+
+
+def _run_chunk(strategy_name, combos, initial_cash, mode):
+    return run_combos(strategy_name, _worker_data, combos, initial_cash, mode)
+
+
+def _run_slice_chunk(strategy_name, start, end, combos, initial_cash, mode):
+    """在 worker 共享数据的 [start, end) 行上跑一个分片（iloc 行切片是视图，不复制数据）"""
+    return run_combos(strategy_name, _worker_data.iloc[start:end], combos, initial_cash, mode)
+
+
+def _validate_slice(strategy_name, start, end, params, initial_cash, mode):
+    """用选定参数在 [start, end) 上回测，返回指标和逐根 K 线权益（前推优化的样本外验证）"""
+    engine = get_engine_class(mode)(None, None, initial_cash)
+    engine.set_data(_worker_data.iloc[start:end])
+    engine.add_strategy(get_strategy_class(strategy_name), **{'printlog': False, **params})
+    result = engine.run(include_chart=False, include_equity=True, metrics=METRIC_KEYS)
+    row = {'params': params, 'equity': result['equity_curve']['value']}
+    row.update({k: result[k] for k in METRIC_KEYS})
+    return row
+
+
+def chunked(items, size):
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+def run_sweep(strategy_name, symbol, param_grid, start_date, end_date, initial_cash=100000.0,
+              max_workers=None, chunk_size=20, sort_by='sharpe_ratio', top_n=None, mode='vector'):
+    """
+    本地进程池参数寻优: 数据只加载一次，通过 initializer 下发到每个 worker
+    默认使用向量化引擎筛选，最终结果再用 backtrader 验证
+    """
+    get_strategy_class(strategy_name)
+    get_engine_class(mode)
+    start = datetime.strptime(start_date, "%Y-%m-%d")
+    end = datetime.strptime(end_date, "%Y-%m-%d")
+    data = load_bars(symbol, start, end)
+    combos = expand_grid(param_grid)
+
+    rows = []
+    with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker, initargs=(data,)) as pool:
+        futures = [pool.submit(_run_chunk, strategy_name, chunk, initial_cash, mode)
+                   for chunk in chunked(combos, chunk_size)]
+        for future in futures:
+            rows.extend(future.result())
+    return {
+        "total": len(combos),
+        "results": rank_results(rows, sort_by, top_n),
+    }
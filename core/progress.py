@@ -0,0 +1,121 @@
+import json
+import time
+import asyncio
+import redis
+import redis.asyncio as aioredis
+from config.settings import settings
+
+CHANNEL_PREFIX = "backtest:progress:"
+# 最近一条消息，订阅之前错过的进度/结果由此补发
+LAST_KEY_PREFIX = "backtest:progress:last:"
+
+
+def channel_name(task_id):
+    return CHANNEL_PREFIX + task_id
+
+
+class ProgressPublisher(object):
+    """
+    任务进度发布（worker 端）: 通过 Redis pub/sub 推送给 API 的流式接口
+
+    update() 至少间隔 interval 秒才真正发布一次，回测循环中可以每根 K 线都调用。
+    每条消息同时写入 LAST_KEY（带 TTL），之后才订阅的客户端也能立即拿到当前状态。
+    Redis 不可用时只打印一次警告，不影响回测。
+    """
+    def __init__(self, task_id, client=None, interval=None, ttl=None):
+        self.task_id = task_id
+        self.client = client or redis.Redis.from_url(settings.REDIS_URL)
+        self.interval = settings.PROGRESS_INTERVAL if interval is None else interval
+        self.ttl = ttl or settings.PROGRESS_TTL
+        self._last = 0.0
+        self._failed = False
+
+    def update(self, **progress):
+        now = time.monotonic()
+        if now - self._last < self.interval:
+            return
+        self._last = now
+        self.publish("progress", dict(progress, state="PROGRESS"))
+
+    def done(self, payload):
+        """任务结束: payload 为任务返回值（{"status": "success"/"failed", ...}），与 /status 的结果相同"""
+        if isinstance(payload, dict) and payload.get("status") == "failed":
+            message = {"state": "FAILURE", "error": payload.get("error")}
+        else:
+            message = {"state": "SUCCESS", "result": payload}
+        self.publish("done", message)
+
+    def publish(self, event, data):
+        raw = json.dumps({"event": event, "task_id": self.task_id, "data": data}, default=str)
+        try:
+            pipe = self.client.pipeline(transaction=False)
+            pipe.set(LAST_KEY_PREFIX + self.task_id, raw, ex=self.ttl)
+            pipe.publish(channel_name(self.task_id), raw)
+            pipe.execute()
+        except redis.RedisError as e:
+            if not self._failed:
+                print(f"Progress channel unavailable: {e}")
+                self._failed = True
+
+
+class ProgressHub(object):
+    """
+    API 进程内共享的进度订阅（异步）
+
+    整个进程只用一个 Redis pub/sub 连接，按需订阅/退订各任务的频道，由一个后台协程读取消息
+    并分发给该任务的所有流式连接（asyncio.Queue），同时在线的任务再多也不会占用更多 Redis 连接。
+    """
+    def __init__(self, url=None):
+        self.url = url or settings.REDIS_URL
+        self.client = None
+        self.pubsub = None
+        self._queues = {}  # task_id -> set(asyncio.Queue)
+        self._reader = None
+        self._lock = asyncio.Lock()
+
+    async def _ensure(self):
+        if self.client is None:
+            self.client = aioredis.Redis.from_url(self.url)
+            self.pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+        if self._reader is None or self._reader.done():
+            self._reader = asyncio.ensure_future(self._read())
+
+    async def subscribe(self, task_id):
+        """返回 (queue, 最近一条消息或 None)；先订阅再读最近消息，两者之间的消息不会丢失（可能重复）"""
+        queue = asyncio.Queue()
+        async with self._lock:
+            await self._ensure()
+            first = task_id not in self._queues
+            self._queues.setdefault(task_id, set()).add(queue)
+            if first:
+                await self.pubsub.subscribe(channel_name(task_id))
+        last = await self.client.get(LAST_KEY_PREFIX + task_id)
+        return queue, (json.loads(last) if last else None)
+
+    async def unsubscribe(self, task_id, queue):
+        async with self._lock:
+            queues = self._queues.get(task_id)
+            if queues is None:
+                return
+            queues.discard(queue)
+            if not queues:
+                del self._queues[task_id]
+                await self.pubsub.unsubscribe(channel_name(task_id))
+
+    async def _read(self):
+        while True:
+            if not self.pubsub.subscribed:
+                await asyncio.sleep(0.1)
+                continue
+            try:
+                msg = await self.pubsub.get_message(timeout=1.0)
+            except (redis.RedisError, OSError) as e:
+                print(f"Progress hub read error: {e}")
+                await asyncio.sleep(1.0)
+                continue
+            if msg is None or msg.get("type") != "message":
+                continue
+            channel = msg["channel"].decode() if isinstance(msg["channel"], bytes) else msg["channel"]
+            message = json.loads(msg["data"])
+            for queue in list(self._queues.get(channel[len(CHANNEL_PREFIX):], ())):
+                queue.put_nowait(message)
@@ -0,0 +1,83 @@
+import json
+import hashlib
+import inspect
+import zipfile
+import redis
+from pymongo.errors import PyMongoError
+from config.settings import settings
+from core.result_store import ResultStore
+
+_VERSION_CACHE = {}
+
+# 按未命中处理的错误: 缓存/结果存储不可用，或句柄、结果文件损坏（截断的 npz 为 BadZipFile，无效 JSON 为 ValueError）
+CACHE_ERRORS = (redis.RedisError, PyMongoError, OSError, zipfile.BadZipFile, ValueError, KeyError)
+
+
+def strategy_version(strategy_class):
+    """策略源码版本: 对策略类及其项目内父类的源码做哈希，改动策略代码后缓存自动失效"""
+    if strategy_class not in _VERSION_CACHE:
+        h = hashlib.sha1()
+        for cls in strategy_class.__mro__:
+            if cls.__module__.startswith('core.'):
+                h.update(inspect.getsource(cls).encode())
+        _VERSION_CACHE[strategy_class] = h.hexdigest()
+    return _VERSION_CACHE[strategy_class]
+
+
+class ResultCache(object):
+    """
+    回测结果缓存（内容寻址）
+
+    key 为策略名、策略源码版本、参数、品种、区间和数据版本的哈希。
+    Redis 中只保存结果句柄 {"result_id": ...}，完整结果（K 线、成交点）以列式二进制存放在 ResultStore 中。
+    每个条目带 TTL，命中时刷新 TTL；缓存放在单独的 Redis 实例（RESULT_CACHE_REDIS_URL，allkeys-lru），
+    内存不足时淘汰最久未用的条目，不影响 Celery 队列和调度记录。
+    句柄对应的结果已过期时按未命中处理。
+    命中/未命中次数记录在 STATS_KEY 中。
+    """
+    KEY_PREFIX = "backtest:result:"
+    STATS_KEY = "backtest:cache:stats"
+    # 回测结果格式变化时递增，使旧格式的缓存失效
+    FORMAT_VERSION = 3
+
+    def __init__(self, client=None, ttl=None, store=None):
+        self.client = client or redis.Redis.from_url(settings.RESULT_CACHE_REDIS_URL or settings.REDIS_URL)
+        self.ttl = ttl or settings.RESULT_CACHE_TTL
+        self.store = store or ResultStore()
+
+    @classmethod
+    def make_key(cls, **fields):
+        payload = json.dumps(dict(fields, format_version=cls.FORMAT_VERSION), sort_keys=True, default=str)
+        return cls.KEY_PREFIX + hashlib.sha256(payload.encode()).hexdigest()
+
+    def get(self, key):
+        try:
+            raw = self.client.getex(key, ex=self.ttl)
+            result = self.store.load(json.loads(raw)["result_id"]) if raw is not None else None
+            self.client.hincrby(self.STATS_KEY, 'hits' if result is not None else 'misses', 1)
+        except CACHE_ERRORS as e:
+            # 缓存不可用或条目损坏时按未命中处理，不影响回测
+            print(f"Result cache unavailable: {e}")
+            return None
+        return result
+
+    def set(self, key, result):
+        """保存结果并返回 result_id（任务可直接用作返回的句柄）"""
+        try:
+            result_id = self.store.save(result)
+            self.client.set(key, json.dumps({"result_id": result_id}), ex=self.ttl)
+            return result_id
+        except (redis.RedisError, PyMongoError, OSError) as e:
+            print(f"Result cache unavailable: {e}")
+            return None
+
+    def stats(self):
+        raw = self.client.hgetall(self.STATS_KEY)
+        hits = int(raw.get(b'hits', 0))
+        misses = int(raw.get(b'misses', 0))
+        return {
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": hits / (hits + misses) if hits + misses else 0.0,
+            "ttl": self.ttl,
+        }
@@ -0,0 +1,229 @@
+import io
+import os
+import json
+import time
+import hashlib
+from datetime import datetime, timedelta, timezone
+import numpy as np
+from config.settings import settings
+
+# 记录表中作为时间轴的列（按时间区间切片时使用）；行表以第一列为时间轴
+TIME_FIELDS = ('date', 'timestamp')
+
+# 编码格式变化时递增
+FORMAT_VERSION = 1
+
+
+def _scalar(value):
+    return isinstance(value, (int, float, str)) and not isinstance(value, bool)
+
+
+def _column(values):
+    """一列 Python 值 -> numpy 数组；只接受全部为数值或全部为字符串的列"""
+    if all(isinstance(v, str) for v in values):
+        return np.array(values, dtype=str)
+    if not all(_scalar(v) and not isinstance(v, str) for v in values):
+        return None
+    if all(isinstance(v, int) for v in values):
+        return np.array(values, dtype=np.int64)
+    return np.array(values, dtype=np.float64)
+
+
+def _table(value):
+    """
+    列表 -> (layout, {列名: 数组})，不能按列存储时返回 None
+    rows: 等长数值行 [[ts, o, c, l, h], ...]；records: 同键的扁平 dict [{'date':..., 'type':...}, ...]
+    """
+    if not isinstance(value, list) or not value:
+        return None
+    first = value[0]
+    if isinstance(first, list):
+        width = len(first)
+        if not all(isinstance(row, list) and len(row) == width for row in value):
+            return None
+        columns = [str(i) for i in range(width)]
+        arrays = {c: _column([row[i] for row in value]) for i, c in enumerate(columns)}
+        layout = {'kind': 'rows', 'columns': columns, 'time': '0'}
+    elif isinstance(first, dict):
+        columns = list(first)
+        if not all(isinstance(row, dict) and list(row) == columns for row in value):
+            return None
+        arrays = {c: _column([row[c] for row in value]) for c in columns}
+        layout = {'kind': 'records', 'columns': columns,
+                  'time': next((c for c in TIME_FIELDS if c in columns), None)}
+    else:
+        return None
+    if any(a is None for a in arrays.values()):
+        return None
+    if layout['time'] is not None and arrays[layout['time']].dtype != np.int64:
+        layout['time'] = None
+    return layout, arrays
+
+
+def encode_result(result):
+    """
+    回测结果 -> 二进制（numpy npz，压缩）
+
+    chart_data / trade_markers 等行表、记录表按列存为 int64 / float64 / 定长字符串数组，
+    其余字段（指标、嵌套结构）存为 JSON 头。解码时不需要 pickle。
+    """
+    meta = {}
+    layouts = {}
+    arrays = {}
+    for key, value in result.items():
+        table = _table(value)
+        if table is None:
+            meta[key] = value
+            continue
+        layouts[key], columns = table
+        for col, array in columns.items():
+            arrays[f"{key}/{col}"] = array
+    header = json.dumps({'format': FORMAT_VERSION, 'order': list(result), 'meta': meta, 'layouts': layouts},
+                        default=str)
+    buf = io.BytesIO()
+    np.savez_compressed(buf, __header__=np.frombuffer(header.encode(), dtype=np.uint8), **arrays)
+    return buf.getvalue()
+
+
+def decode_result(raw, fields=None, start=None, end=None):
+    """
+    二进制 -> 回测结果；fields 只取部分字段（只解压用到的列），start/end（毫秒，含两端）按时间切片行表/记录表
+    """
+    with np.load(io.BytesIO(raw), allow_pickle=False) as npz:
+        header = json.loads(npz['__header__'].tobytes().decode())
+        result = {k: v for k, v in header['meta'].items() if fields is None or k in fields}
+        for key, layout in header['layouts'].items():
+            if fields is not None and key not in fields:
+                continue
+            columns = {col: npz[f"{key}/{col}"] for col in layout['columns']}
+            if layout['time'] is not None and (start is not None or end is not None):
+                ts = columns[layout['time']]
+                mask = np.ones(len(ts), dtype=bool)
+                if start is not None:
+                    mask &= ts >= start
+                if end is not None:
+                    mask &= ts <= end
+                columns = {col: array[mask] for col, array in columns.items()}
+            lists = [columns[col].tolist() for col in layout['columns']]
+            if layout['kind'] == 'rows':
+                result[key] = [list(row) for row in zip(*lists)]
+            else:
+                result[key] = [dict(zip(layout['columns'], row)) for row in zip(*lists)]
+    return {key: result[key] for key in header['order'] if key in result}
+
+
+def result_metrics(result):
+    """结果中的标量指标（final_value、pnl、sharpe_ratio ...），随任务句柄一起保存在 Redis 中"""
+    return {k: v for k, v in result.items() if v is None or _scalar(v) or isinstance(v, bool)}
+
+
+class ResultStore(object):
+    """
+    回测结果的二进制存储（磁盘或 MongoDB），Redis 中只保存 result_id
+
+    result_id 为编码后内容的哈希，相同结果只保存一份，重复保存只刷新过期时间。
+    RESULT_STORE=disk 时为 RESULT_STORE_DIR 下的文件，按修改时间过期、写入时顺带清理；
+    RESULT_STORE=mongo 时为 backtest_results 集合，由 expire_at 上的 TTL 索引清理。
+    """
+    COLLECTION = "backtest_results"
+    # 磁盘模式下两次清理过期文件的最小间隔（秒）
+    PURGE_INTERVAL = 600
+
+    _last_purge = 0.0
+    _indexed = set()  # 已建过 TTL 索引的 (pid, 数据库名)
+
+    def __init__(self, backend=None, root=None, ttl=None, db=None):
+        self.backend = backend or settings.RESULT_STORE
+        if self.backend not in ('disk', 'mongo'):
+            raise ValueError(f"Unknown result store: {self.backend}")
+        self.root = root or settings.RESULT_STORE_DIR
+        self.ttl = ttl or settings.RESULT_STORE_TTL
+        self.db = db
+
+    def save(self, result):
+        raw = encode_result(result)
+        result_id = hashlib.sha256(raw).hexdigest()[:32]
+        if self.backend == 'mongo':
+            self._collection().update_one(
+                {'_id': result_id},
+                {'$set': {'expire_at': datetime.now(timezone.utc) + timedelta(seconds=self.ttl)},
+                 '$setOnInsert': {'data': raw, 'size': len(raw)}},
+                upsert=True)
+        else:
+            path = self._path(result_id)
+            if os.path.exists(path):
+                os.utime(path)
+            else:
+                os.makedirs(self.root, exist_ok=True)
+                tmp_path = f"{path}.{os.getpid()}.tmp"
+                with open(tmp_path, 'wb') as f:
+                    f.write(raw)
+                os.replace(tmp_path, path)
+            self._maybe_purge()
+        return result_id
+
+    def load_raw(self, result_id):
+        """返回二进制结果，不存在或已过期时返回 None"""
+        if self.backend == 'mongo':
+            doc = self._collection().find_one({'_id': result_id}, {'data': 1, 'expire_at': 1})
+            # TTL 索引每分钟才清理一次
+            if doc is None or doc['expire_at'].replace(tzinfo=timezone.utc) < datetime.now(timezone.utc):
+                return None
+            return bytes(doc['data'])
+        path = self._path(result_id)
+        try:
+            if time.time() - os.path.getmtime(path) > self.ttl:
+                return None
+            with open(path, 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def load(self, result_id, fields=None, start=None, end=None):
+        raw = self.load_raw(result_id)
+        return decode_result(raw, fields, start, end) if raw is not None else None
+
+    def exists(self, result_id):
+        if self.backend == 'mongo':
+            return self._collection().count_documents(
+                {'_id': result_id, 'expire_at': {'$gte': datetime.now(timezone.utc)}}, limit=1) > 0
+        path = self._path(result_id)
+        return os.path.exists(path) and time.time() - os.path.getmtime(path) <= self.ttl
+
+    def purge(self):
+        """删除过期的结果文件（磁盘模式），返回删除数量"""
+        removed = 0
+        if not os.path.isdir(self.root):
+            return removed
+        cutoff = time.time() - self.ttl
+        for name in os.listdir(self.root):
+            path = os.path.join(self.root, name)
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+                    removed += 1
+            except FileNotFoundError:
+                pass
+        return removed
+
+    def _maybe_purge(self):
+        now = time.time()
+        if now - ResultStore._last_purge >= self.PURGE_INTERVAL:
+            ResultStore._last_purge = now
+            self.purge()
+
+    def _path(self, result_id):
+        if not result_id.isalnum():
+            raise ValueError(f"Invalid result id: {result_id}")
+        return os.path.join(self.root, f"{result_id}.npz")
+
+    def _collection(self):
+        if self.db is None:
+            from core.data.mongo_bars import MongoBarRepository
+            self.db = MongoBarRepository.get_client()[settings.MONGO_DB_NAME]
+        collection = self.db[self.COLLECTION]
+        key = (os.getpid(), self.db.name)
+        if key not in ResultStore._indexed:
+            collection.create_index('expire_at', expireAfterSeconds=0)
+            ResultStore._indexed.add(key)
+        return collection
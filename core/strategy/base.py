@@ -1,21 +1,47 @@
 import backtrader as bt
 import datetime
+from config.settings import settings
+from core.indicators import indicator_cache, indicator_line
+from core.strategy.eventlog import StrategyLogger, get_sink, INFO
 
 class BaseStrategy(bt.Strategy):
     """
     基础策略类，所有自定义策略应继承此类
+
+    事件日志通过 self.logger（见 core.strategy.eventlog.StrategyLogger）记录，默认按 STRATEGY_LOG_SINK 关闭；
+    printlog=True 时输出到 stdout，loglevel 覆盖 STRATEGY_LOG_LEVEL
     """
     params = (
-        ('printlog', True),
+        ('printlog', False),
+        ('loglevel', None),
     )
 
-    def log(self, txt, dt=None):
-        """Logging function for this strategy"""
-        if self.params.printlog:
-            dt = dt or self.datas[0].datetime.date(0)
-            print('%s, %s' % (dt.isoformat(), txt))
+    def log(self, txt, dt=None, level=INFO):
+        """兼容旧接口的文本日志（时间取当前 K 线，dt 参数已忽略）；新代码请用 self.logger 记录结构化事件"""
+        self.logger.log(level, 'message', text=txt)
+
+    def _log_clock(self):
+        data = self.datas[0]
+        return data.datetime[0] if len(data) else None
+
+    def trading_datas(self):
+        """参与交易的数据源：组合回测时每个标的一个，不含 extra_timeframes 附加的大周期数据"""
+        return [d for d in self.datas if not getattr(d, 'auxiliary', False)]
+
+    def indicator(self, data, name, **params):
+        """
+        常用指标（sma/ema/atr/sma_cross）：回测时整列预计算并在同一份数据的多次回测间共用，
+        实盘数据源退回等价的 bt.ind 指标
+        """
+        return indicator_line(data, name, **params)
 
     def __init__(self):
+        sink = 'stdout' if self.params.printlog else settings.STRATEGY_LOG_SINK
+        # 实盘数据源的事件逐条交给后台线程，不在缓冲中等到凑满一批（可能要几个小时）或 stop()
+        live = any(data.islive() for data in self.datas)
+        self.logger = StrategyLogger(type(self).__name__, self._log_clock,
+                                     level=self.params.loglevel or settings.STRATEGY_LOG_LEVEL,
+                                     sink=get_sink(sink) if sink else None, batch_size=1 if live else None)
         # Keep a reference to the "close" line in the data[0] dataseries
         self.dataclose = self.datas[0].close
         self.order = None
@@ -27,23 +53,18 @@ class BaseStrategy(bt.Strategy):
             return
 
         if order.status in [order.Completed]:
+            self.logger.info('order', data=order.data._name, side='buy' if order.isbuy() else 'sell',
+                             size=order.executed.size, price=order.executed.price,
+                             value=order.executed.value, commission=order.executed.comm)
             if order.isbuy():
-                self.log('BUY EXECUTED, Price: %.2f, Cost: %.2f, Comm %.2f' %
-                         (order.executed.price,
-                          order.executed.value,
-                          order.executed.comm))
                 self.buyprice = order.executed.price
                 self.buycomm = order.executed.comm
-            elif order.issell():
-                self.log('SELL EXECUTED, Price: %.2f, Cost: %.2f, Comm %.2f' %
-                         (order.executed.price,
-                          order.executed.value,
-                          order.executed.comm))
 
             self.bar_executed = len(self)
 
         elif order.status in [order.Canceled, order.Margin, order.Rejected]:
-            self.log('Order Canceled/Margin/Rejected')
+            self.logger.warning('order_failed', data=order.data._name, side='buy' if order.isbuy() else 'sell',
+                                status=order.getstatusname())
 
         self.order = None
 
@@ -51,12 +72,15 @@ class BaseStrategy(bt.Strategy):
         if not trade.isclosed:
             return
 
-        self.log('OPERATION PROFIT, GROSS %.2f, NET %.2f' %
-                 (trade.pnl, trade.pnlcomm))
+        self.logger.info('trade', data=trade.data._name, pnl=trade.pnl, pnlcomm=trade.pnlcomm)
+
+    def stop(self):
+        self.logger.close()
 
     def next(self):
         # Simplified demo logic
-        self.log('Close, %.2f' % self.dataclose[0])
+        if self.logger.debug_enabled:
+            self.logger.debug('bar', close=self.dataclose[0])
 
         if self.order:
             return
@@ -65,11 +89,11 @@ class BaseStrategy(bt.Strategy):
             if self.dataclose[0] < self.dataclose[-1]:
                 # current close less than previous close
                 if self.dataclose[-1] < self.dataclose[-2]:
-                    self.log('BUY CREATE, %.2f' % self.dataclose[0])
+                    self.logger.info('signal', side='buy', close=self.dataclose[0])
                     self.order = self.buy()
         else:
             if len(self) >= (self.bar_executed + 5):
-                self.log('SELL CREATE, %.2f' % self.dataclose[0])
+                self.logger.info('signal', side='sell', close=self.dataclose[0])
                 self.order = self.sell()
 
 class SmaCross(BaseStrategy):
@@ -80,14 +104,27 @@ class SmaCross(BaseStrategy):
     
     def __init__(self):
         super().__init__()
-        self.sma1 = bt.ind.SMA(period=self.params.pfast)
-        self.sma2 = bt.ind.SMA(period=self.params.pslow)
-        self.crossover = bt.ind.CrossOver(self.sma1, self.sma2)
+        # 组合回测时每个标的独立计算均线交叉
+        self.crossovers = {}
+        for data in self.trading_datas():
+            self.crossovers[data] = self.indicator(data, 'sma_cross', fast=self.params.pfast, slow=self.params.pslow)
+        self.crossover = self.crossovers[self.datas[0]]
 
     def next(self):
-        if not self.position:
-            if self.crossover > 0:
-                self.buy()
-        elif self.crossover < 0:
-            self.close()
+        for data, crossover in self.crossovers.items():
+            if not self.getposition(data):
+                if crossover > 0:
+                    self.buy(data=data)
+            elif crossover < 0:
+                self.close(data=data)
+
+    @classmethod
+    def signals(cls, bars, **kwargs):
+        """
+        向量化信号（供 VectorBacktestEngine 使用），返回 (entries, exits) 布尔数组
+        """
+        p = dict(cls.params._getpairs())
+        p.update(kwargs)
+        cross = indicator_cache.get(bars, 'sma_cross', fast=p['pfast'], slow=p['pslow'])
+        return cross > 0, cross < 0
 
@@ -0,0 +1,214 @@
+import os
+import json
+import queue
+import atexit
+import threading
+from datetime import timezone
+import backtrader as bt
+from config.settings import settings
+
+DEBUG = 10
+INFO = 20
+WARNING = 30
+ERROR = 40
+OFF = 100
+
+LEVELS = {'DEBUG': DEBUG, 'INFO': INFO, 'WARNING': WARNING, 'ERROR': ERROR, 'OFF': OFF}
+LEVEL_NAMES = {v: k for k, v in LEVELS.items()}
+
+
+def parse_level(level):
+    if isinstance(level, int):
+        return level
+    try:
+        return LEVELS[str(level).upper()]
+    except KeyError:
+        raise ValueError(f"Unknown log level: {level}")
+
+
+def _to_iso(num):
+    return bt.num2date(num).replace(tzinfo=timezone.utc).isoformat() if num else None
+
+
+class LogSink(object):
+    """
+    后台写出的日志目的地: 策略线程只把一批记录放进队列，由后台线程格式化并写出
+    队列满时丢弃整批并计数（dropped），不阻塞回测；子类实现 write(records)
+    """
+    def __init__(self, max_batches=1000):
+        self._queue = queue.Queue(maxsize=max_batches)
+        self.dropped = 0
+        self._thread = threading.Thread(target=self._run, name=f"{type(self).__name__}-writer", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+
+    def submit(self, records):
+        try:
+            self._queue.put_nowait(records)
+        except queue.Full:
+            self.dropped += len(records)
+
+    def _run(self):
+        while True:
+            records = self._queue.get()
+            try:
+                if records is None:
+                    return
+                self.write(records)
+            except Exception as e:
+                print(f"Strategy log sink error: {e}")
+            finally:
+                self._queue.task_done()
+
+    def flush(self):
+        """等待已提交的记录全部写出"""
+        if self._thread.is_alive():
+            self._queue.join()
+
+    def close(self):
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+
+    def write(self, records):
+        raise NotImplementedError
+
+    @staticmethod
+    def to_dict(record):
+        """(bar 时间, level, strategy, event, fields) -> 可序列化的 dict（只在后台线程中调用）"""
+        dt, level, strategy, event, fields = record
+        return {'time': _to_iso(dt), 'level': LEVEL_NAMES.get(level, level), 'strategy': strategy, 'event': event, **fields}
+
+
+class StdoutSink(LogSink):
+    """兼容原来的 printlog 输出: 每条一行 "日期, 事件 字段=值 ..." """
+    def write(self, records):
+        lines = []
+        for dt, level, strategy, event, fields in records:
+            text = fields.get('text') if list(fields) == ['text'] else \
+                ' '.join([event] + [f"{k}={v:.2f}" if isinstance(v, float) else f"{k}={v}"
+                                    for k, v in fields.items() if v not in ('', None)])
+            lines.append(f"{_to_iso(dt)[:10] if dt else '-'}, {text}")
+        print('\n'.join(lines), flush=True)
+
+
+class FileSink(LogSink):
+    """JSON Lines 文件"""
+    def __init__(self, path, **kwargs):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        super(FileSink, self).__init__(**kwargs)
+
+    def write(self, records):
+        with open(self.path, 'a') as f:
+            f.write(''.join(json.dumps(self.to_dict(r), default=str) + '\n' for r in records))
+
+
+class MongoSink(LogSink):
+    """MongoDB strategy_logs 集合，每批一次 insert_many"""
+    COLLECTION = "strategy_logs"
+
+    def __init__(self, db=None, **kwargs):
+        self.db = db
+        super(MongoSink, self).__init__(**kwargs)
+
+    def write(self, records):
+        if self.db is None:
+            from core.data.mongo_bars import MongoBarRepository
+            self.db = MongoBarRepository.get_client()[settings.MONGO_DB_NAME]
+        self.db[self.COLLECTION].insert_many([self.to_dict(r) for r in records], ordered=False)
+
+
+class RedisStreamSink(LogSink):
+    """Redis Stream（XADD，近似裁剪到 maxlen 条），每批一次 pipeline"""
+    KEY = "strategy:logs"
+
+    def __init__(self, client=None, key=None, maxlen=100000, **kwargs):
+        import redis
+        self.client = client or redis.Redis.from_url(settings.REDIS_URL)
+        self.key = key or self.KEY
+        self.maxlen = maxlen
+        super(RedisStreamSink, self).__init__(**kwargs)
+
+    def write(self, records):
+        pipe = self.client.pipeline(transaction=False)
+        for record in records:
+            pipe.xadd(self.key, {'data': json.dumps(self.to_dict(record), default=str)},
+                      maxlen=self.maxlen, approximate=True)
+        pipe.execute()
+
+
+SINKS = {
+    'stdout': StdoutSink,
+    'file': lambda: FileSink(settings.STRATEGY_LOG_FILE),
+    'mongo': MongoSink,
+    'redis': RedisStreamSink,
+}
+
+# (pid, sink 名) -> LogSink；同一进程内的所有策略共用一个后台写线程
+_sinks = {}
+_sinks_lock = threading.Lock()
+
+
+def get_sink(name):
+    key = (os.getpid(), name)
+    with _sinks_lock:
+        if key not in _sinks:
+            if name not in SINKS:
+                raise ValueError(f"Unknown log sink: {name}")
+            _sinks[key] = SINKS[name]()
+        return _sinks[key]
+
+
+class StrategyLogger(object):
+    """
+    策略的分级结构化事件日志
+
+    logger.info('order', side='buy', price=...) 只把 (bar 时间, 级别, 事件, 字段) 追加到内存缓冲，
+    不做任何字符串格式化；缓冲满 batch_size 条或 flush() 时整批交给 sink 的后台线程写出
+    （实盘策略 batch_size=1，每条事件立即提交）。
+    低于 level 的调用在第一行比较后直接返回；每根 K 线都调用的位置可先判断 logger.debug_enabled。
+    sink 为 None（默认，见 STRATEGY_LOG_SINK）时所有级别都关闭。
+    """
+    def __init__(self, name, clock, level=INFO, sink=None, batch_size=None):
+        self.name = name
+        self.clock = clock
+        self.sink = sink
+        self.level = parse_level(level) if sink is not None else OFF
+        self.batch_size = batch_size or settings.STRATEGY_LOG_BATCH
+        self.debug_enabled = self.level <= DEBUG
+        self._buffer = []
+
+    def log(self, level, event, **fields):
+        if level >= self.level:
+            self._append(level, event, fields)
+
+    def debug(self, event, **fields):
+        if DEBUG >= self.level:
+            self._append(DEBUG, event, fields)
+
+    def info(self, event, **fields):
+        if INFO >= self.level:
+            self._append(INFO, event, fields)
+
+    def warning(self, event, **fields):
+        if WARNING >= self.level:
+            self._append(WARNING, event, fields)
+
+    def error(self, event, **fields):
+        if ERROR >= self.level:
+            self._append(ERROR, event, fields)
+
+    def _append(self, level, event, fields):
+        self._buffer.append((self.clock(), level, self.name, event, fields))
+        if len(self._buffer) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if self._buffer:
+            self.sink.submit(self._buffer)
+            self._buffer = []
+
+    def close(self):
+        """回测结束: 交出剩余记录（不等待写出，进程退出前由 atexit 等待）"""
+        self.flush()
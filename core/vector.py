@@ -0,0 +1,163 @@
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+from core.data.bar_store import DAY_MS
+
+
+def sma(values, period):
+    """简单移动平均，前 period-1 个值为 NaN（与 bt.ind.SMA 对齐）"""
+    values = np.asarray(values, dtype=np.float64)
+    out = np.full(len(values), np.nan)
+    if 0 < period <= len(values):
+        out[period - 1:] = sliding_window_view(values, period).sum(axis=1) / period
+    return out
+
+
+def _recursive_average(values, period, alpha):
+    """
+    指数平滑，第一个完整窗口的简单平均作为种子（与 bt.ind.EMA / SmoothedMovingAverage 对齐），
+    输入开头的 NaN（如 true_range 的第一个值）顺延种子位置
+    """
+    values = np.asarray(values, dtype=np.float64)
+    out = np.full(len(values), np.nan)
+    valid = np.nonzero(~np.isnan(values))[0]
+    if period <= 0 or len(valid) == 0 or valid[0] + period > len(values):
+        return out
+    seed = valid[0] + period - 1
+    prev = values[valid[0]:seed + 1].sum() / period
+    out[seed] = prev
+    # 递推本身无法向量化，逐个元素在 Python float 上计算比 numpy 标量快一个数量级
+    decay = 1.0 - alpha
+    rest = out[seed + 1:]
+    for i, x in enumerate(values[seed + 1:].tolist()):
+        prev = prev * decay + x * alpha
+        rest[i] = prev
+    return out
+
+
+def ema(values, period):
+    """指数移动平均，alpha = 2 / (period + 1)，前 period-1 个值为 NaN（与 bt.ind.EMA 对齐）"""
+    return _recursive_average(values, period, 2.0 / (period + 1))
+
+
+def smma(values, period):
+    """Wilder 平滑均线，alpha = 1 / period（与 bt.ind.SmoothedMovingAverage 对齐）"""
+    return _recursive_average(values, period, 1.0 / period)
+
+
+def true_range(high, low, close):
+    """真实波幅 max(high, 前收) - min(low, 前收)，第一个值为 NaN（与 bt.ind.TrueRange 对齐）"""
+    high = np.asarray(high, dtype=np.float64)
+    low = np.asarray(low, dtype=np.float64)
+    close = np.asarray(close, dtype=np.float64)
+    out = np.full(len(close), np.nan)
+    out[1:] = np.maximum(high[1:], close[:-1]) - np.minimum(low[1:], close[:-1])
+    return out
+
+
+def atr(high, low, close, period):
+    """平均真实波幅，前 period 个值为 NaN（与 bt.ind.ATR 对齐）"""
+    return smma(true_range(high, low, close), period)
+
+
+def crossover(fast, slow):
+    """
+    与 bt.ind.CrossOver 相同: 上一个非零差值 < 0 且当前 fast > slow 为 1，反之为 -1
+    """
+    diff = fast - slow
+    valid = ~np.isnan(diff)
+    nzd = np.where(diff != 0, diff, np.nan)
+    if valid.any():
+        # NonZeroDifference 的第一个值直接取差值（即使为 0）
+        first = np.argmax(valid)
+        nzd[first] = diff[first]
+    # 前向填充最近一个非零差值
+    idx = np.where(np.isnan(nzd), 0, np.arange(len(nzd)))
+    np.maximum.accumulate(idx, out=idx)
+    nzd = nzd[idx]
+
+    prev = np.empty_like(nzd)
+    prev[0] = np.nan
+    prev[1:] = nzd[:-1]
+    cross = np.zeros(len(diff), dtype=np.int8)
+    with np.errstate(invalid='ignore'):
+        cross[(prev < 0) & (fast > slow)] = 1
+        cross[(prev > 0) & (fast < slow)] = -1
+    return cross
+
+
+def simulate(open_, close, entries, exits, initial_cash, percents):
+    """
+    单品种多头信号回测，与 backtrader 默认撮合一致:
+    第 i 根 K 线收盘产生的信号在第 i+1 根开盘成交，开仓数量 = 现金 * percents% / close[i]，平仓全部卖出。
+
+    返回每根 K 线的权益以及每笔交易的开/平仓位置、价格和数量
+    """
+    n = len(close)
+    f = percents / 100.0
+
+    # 信号状态: 1 持仓 / 0 空仓，同一根 K 线既有开又有平时保持不变
+    state = np.full(n, np.nan)
+    state[entries & ~exits] = 1.0
+    state[exits & ~entries] = 0.0
+    idx = np.where(np.isnan(state), 0, np.arange(n))
+    np.maximum.accumulate(idx, out=idx)
+    state = np.nan_to_num(state[idx], nan=0.0)
+
+    # 持仓在下一根 K 线开盘生效
+    held = np.zeros(n, dtype=np.int8)
+    held[1:] = state[:-1] == 1.0
+    changes = np.diff(held, prepend=np.int8(0))
+    entry_idx = np.nonzero(changes == 1)[0]
+    exit_idx = np.nonzero(changes == -1)[0]
+    signal_idx = entry_idx - 1
+
+    entry_price = open_[entry_idx]
+    exit_price = open_[exit_idx]
+    closed = len(exit_idx)
+
+    # 每笔交易结束后现金的增长倍数，开仓现金为之前所有已平仓交易的累乘
+    growth = 1.0 + f * (exit_price - entry_price[:closed]) / close[signal_idx[:closed]]
+    cum_growth = np.concatenate([[1.0], np.cumprod(growth)])
+    cash_before = initial_cash * cum_growth[:len(entry_idx)]
+    size = cash_before * f / close[signal_idx]
+
+    # 每根 K 线的权益
+    trade_no = np.cumsum(changes == 1) - 1
+    closed_no = np.cumsum(changes == -1)
+    equity = initial_cash * cum_growth[closed_no]
+    in_pos = held == 1
+    k = trade_no[in_pos]
+    equity[in_pos] = cash_before[k] + size[k] * (close[in_pos] - entry_price[k])
+
+    return {
+        'equity': equity,
+        'entry_idx': entry_idx,
+        'exit_idx': exit_idx,
+        'entry_price': entry_price,
+        'exit_price': exit_price,
+        'size': size,
+    }
+
+
+def daily_sharpe(timestamps, equity, initial_cash, period_ms=DAY_MS):
+    """
+    与 bt.analyzers.SharpeRatio(timeframe=Days, riskfreerate=0) 相同的日收益夏普（不年化）
+    period_ms: 收益的统计周期，K 线周期大于 1 天时传入 K 线周期
+    """
+    if len(equity) == 0:
+        return 0.0
+    day = timestamps // period_ms
+    last_of_day = np.nonzero(np.diff(day) != 0)[0]
+    day_values = equity[np.append(last_of_day, len(equity) - 1)]
+    prev = np.concatenate([[initial_cash], day_values[:-1]])
+    rets = day_values / prev - 1.0
+    std = rets.std()
+    return float(rets.mean() / std) if std > 0 else 0.0
+
+
+def max_drawdown(equity):
+    """最大回撤（百分比），与 bt.analyzers.DrawDown 的 max.drawdown 相同"""
+    if len(equity) == 0:
+        return 0.0
+    peak = np.maximum.accumulate(equity)
+    return float((100.0 * (peak - equity) / peak).max())
@@ -0,0 +1,167 @@
+"""
+回测性能基准
+
+按不同数据量生成确定性的随机游走 1m K 线（core.data.synthetic），写入临时 K 线库，
+再端到端运行 BacktestEngine + SmaCross（不访问 OKX / Redis）。每个数据量在独立子进程中运行，
+分别统计数据加载、cerebro.run、结果解析耗时、bars/sec 与峰值 RSS，输出 JSON 便于跨提交对比。
+
+    python scripts/bench_backtest.py                           # 10k, 100k
+    python scripts/bench_backtest.py --sizes 10k,100k,1m,10m --output bench.json
+    python scripts/bench_backtest.py --compare bench.json      # 与基线对比
+    python scripts/bench_backtest.py --engine vector --sizes 1m,10m
+"""
+import sys
+import os
+import json
+import time
+import resource
+import argparse
+import platform
+import subprocess
+import tempfile
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SYMBOL = "BENCH/USDT"
+TIMEFRAME = "1m"
+START = datetime(2000, 1, 1)
+PARAMS = {"pfast": 10, "pslow": 30}
+
+
+def parse_size(text):
+    text = text.strip().lower()
+    scale = {"k": 1000, "m": 1000 * 1000}.get(text[-1])
+    return int(float(text[:-1]) * scale) if scale else int(text)
+
+
+def peak_rss_mb():
+    # Linux 上 ru_maxrss 单位为 KB，macOS 上为字节
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+
+
+def child(bars, engine_name, seed):
+    """在子进程中运行单个数据量，打印一行 JSON"""
+    sys.path.insert(0, ROOT)
+    from core.engine import get_engine_class, load_bars
+    from core.data.bar_store import BarStore, to_ms
+    from core.data.synthetic import random_walk_ohlcv
+    from core.strategy.base import SmaCross
+
+    # 按整天生成，保证回测区间内没有缺口（否则 load_bars 会尝试从交易所补数据）
+    days = -(-bars // 1440)
+    t = time.perf_counter()
+    BarStore().write(SYMBOL, TIMEFRAME, random_walk_ohlcv(days * 1440, seed, start_ms=to_ms(START), step_ms=60 * 1000))
+    generate_s = time.perf_counter() - t
+
+    end = START + timedelta(days=days - 1)
+    engine = get_engine_class(engine_name)(START, end)
+    t = time.perf_counter()
+    engine.set_data(load_bars(SYMBOL, START, end, TIMEFRAME).iloc[:bars])
+    load_s = time.perf_counter() - t
+    engine.add_strategy(SmaCross, printlog=False, **PARAMS)
+
+    if engine_name == "backtrader":
+        engine.add_analyzers()
+        t = time.perf_counter()
+        strat = engine.cerebro.run()[0]
+        run_s = time.perf_counter() - t
+        t = time.perf_counter()
+        result = engine._parse_results(strat)
+        parse_s = time.perf_counter() - t
+    else:
+        # 向量化引擎的运行与解析不可分，全部计入 run_s
+        t = time.perf_counter()
+        result = engine.run()
+        run_s = time.perf_counter() - t
+        parse_s = 0.0
+
+    print(json.dumps({
+        "bars": len(engine.data),
+        "engine": engine_name,
+        "generate_s": generate_s,
+        "load_s": load_s,
+        "run_s": run_s,
+        "parse_s": parse_s,
+        "total_s": load_s + run_s + parse_s,
+        "bars_per_sec": len(engine.data) / run_s if run_s else None,
+        "peak_rss_mb": peak_rss_mb(),
+        "final_value": result["final_value"],
+        "total_trades": result["total_trades"],
+    }))
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(report, baseline):
+    base = {(r["engine"], r["bars"]): r for r in baseline["results"]}
+    print(f"\nvs baseline {baseline.get('commit')}:")
+    for r in report["results"]:
+        b = base.get((r["engine"], r["bars"]))
+        if b is None:
+            continue
+        speedup = r["bars_per_sec"] / b["bars_per_sec"] if b["bars_per_sec"] else float("nan")
+        print(f"  {r['engine']:<10} {r['bars']:>10} bars  bars/sec x{speedup:.2f}  "
+              f"load {r['load_s'] - b['load_s']:+.3f}s  parse {r['parse_s'] - b['parse_s']:+.3f}s  "
+              f"rss {r['peak_rss_mb'] - b['peak_rss_mb']:+.0f}MB"
+              + ("" if r["final_value"] == b["final_value"] else "  RESULT CHANGED"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default="10k,100k", help="逗号分隔的 K 线数量，如 10k,100k,1m,10m")
+    parser.add_argument("--engine", default="backtrader", choices=("backtrader", "vector"))
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="把结果写入 JSON 文件")
+    parser.add_argument("--compare", help="与之前输出的 JSON 基线对比")
+    parser.add_argument("--child", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.child, args.engine, args.seed)
+        return
+
+    results = []
+    for bars in (parse_size(s) for s in args.sizes.split(",")):
+        with tempfile.TemporaryDirectory() as tmp:
+            env = dict(os.environ, BAR_STORE_DIR=tmp, RESULT_CACHE_ENABLED="false")
+            out = subprocess.run([sys.executable, os.path.abspath(__file__), "--child", str(bars),
+                                  "--engine", args.engine, "--seed", str(args.seed)],
+                                 cwd=ROOT, env=env, capture_output=True, text=True)
+        if out.returncode != 0:
+            print(out.stderr)
+            sys.exit(out.returncode)
+        r = json.loads(out.stdout.strip().splitlines()[-1])
+        results.append(r)
+        print(f"{r['engine']:<10} {r['bars']:>10} bars  load={r['load_s']:.3f}s run={r['run_s']:.3f}s "
+              f"parse={r['parse_s']:.3f}s  {r['bars_per_sec']:,.0f} bars/s  peak_rss={r['peak_rss_mb']:.0f}MB")
+
+    report = {
+        "commit": git_commit(),
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "params": PARAMS,
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(report, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
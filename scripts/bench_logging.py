@@ -0,0 +1,187 @@
+"""
+策略事件日志开销基准
+
+1. 单次调用: logger.info(...) 在关闭 / 开启（只写缓冲，不含后台写出）时的耗时，与原来的 '%' 格式化 + print 对比
+2. 端到端: BaseStrategy 示例策略（每根 K 线一个 DEBUG 事件，信号/成交/平仓为 INFO）在随机游走 K 线上回测，
+   每种日志模式在独立子进程中运行（sink 按进程共享），统计 cerebro.run 耗时（多次运行取最快）
+
+    python scripts/bench_logging.py                    # 100k K 线
+    python scripts/bench_logging.py --bars 1m --repeat 5 --output bench_logging.json
+
+模式: off（默认配置）、file-info、file-debug（JSON Lines 文件，后台线程写出）、
+legacy（改动前的 printlog=True 行为: 每个事件同步格式化并 print，输出到 /dev/null）
+"""
+import sys
+import os
+import json
+import time
+import timeit
+import argparse
+import platform
+import subprocess
+import tempfile
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MODES = {
+    "off": {"STRATEGY_LOG_SINK": ""},
+    "file-info": {"STRATEGY_LOG_SINK": "file", "STRATEGY_LOG_LEVEL": "INFO"},
+    "file-debug": {"STRATEGY_LOG_SINK": "file", "STRATEGY_LOG_LEVEL": "DEBUG"},
+    "legacy": {"STRATEGY_LOG_SINK": ""},
+}
+
+
+def parse_size(text):
+    text = text.strip().lower()
+    scale = {"k": 1000, "m": 1000 * 1000}.get(text[-1])
+    return int(float(text[:-1]) * scale) if scale else int(text)
+
+
+def micro(number):
+    """单次调用耗时（纳秒）"""
+    sys.path.insert(0, ROOT)
+    from core.strategy.eventlog import StrategyLogger, LogSink, OFF, INFO
+
+    class NullSink(LogSink):
+        def write(self, records):
+            pass
+
+    sink = NullSink()
+    disabled = StrategyLogger("bench", lambda: 738000.5, level=OFF, sink=sink)
+    enabled = StrategyLogger("bench", lambda: 738000.5, level=INFO, sink=sink)
+    price, value, comm = 101.2345, 10123.45, 10.12
+    devnull = open(os.devnull, "w")
+
+    def legacy():
+        print('%s, %s' % (datetime(2020, 1, 1).date().isoformat(),
+                          'BUY EXECUTED, Price: %.2f, Cost: %.2f, Comm %.2f' % (price, value, comm)), file=devnull)
+
+    cases = {
+        "disabled": lambda: disabled.info('order', side='buy', price=price, value=value, commission=comm),
+        "disabled_guarded": lambda: disabled.debug_enabled and disabled.debug('bar', close=price),
+        "enabled_buffered": lambda: enabled.info('order', side='buy', price=price, value=value, commission=comm),
+        "legacy_print": legacy,
+    }
+    result = {name: timeit.timeit(fn, number=number) / number * 1e9 for name, fn in cases.items()}
+    sink.close()
+    return result
+
+
+def child(bars, mode, seed):
+    """在子进程中运行一种日志模式，打印一行 JSON"""
+    sys.path.insert(0, ROOT)
+    from core.engine import BacktestEngine
+    from core.data.synthetic import random_walk
+    from core.strategy.base import BaseStrategy
+
+    class LegacyStrategy(BaseStrategy):
+        """改动前的日志方式（每个事件同步格式化并 print）"""
+        def legacy_log(self, txt):
+            print('%s, %s' % (self.datas[0].datetime.date(0).isoformat(), txt))
+
+        def notify_order(self, order):
+            if order.status == order.Completed:
+                self.legacy_log('%s EXECUTED, Price: %.2f, Cost: %.2f, Comm %.2f' % (
+                    'BUY' if order.isbuy() else 'SELL', order.executed.price, order.executed.value, order.executed.comm))
+                self.bar_executed = len(self)
+            self.order = None
+
+        def notify_trade(self, trade):
+            if trade.isclosed:
+                self.legacy_log('OPERATION PROFIT, GROSS %.2f, NET %.2f' % (trade.pnl, trade.pnlcomm))
+
+        def next(self):
+            self.legacy_log('Close, %.2f' % self.dataclose[0])
+            super(LegacyStrategy, self).next()
+
+    df = random_walk(bars, seed, freq="min")
+    engine = BacktestEngine(df.index[0].to_pydatetime(), df.index[-1].to_pydatetime())
+    engine.set_data(df)
+    engine.add_strategy(LegacyStrategy if mode == "legacy" else BaseStrategy)
+    engine.add_analyzers()
+    stdout = sys.stdout
+    if mode == "legacy":
+        sys.stdout = open(os.devnull, "w")
+    t = time.perf_counter()
+    strat = engine.cerebro.run()[0]
+    run_s = time.perf_counter() - t
+    sys.stdout = stdout
+
+    # 后台线程写完剩余记录所需的时间（不在回测循环内）
+    t = time.perf_counter()
+    sink = strat.logger.sink
+    if sink is not None:
+        sink.flush()
+    drain_s = time.perf_counter() - t
+    print(json.dumps({
+        "mode": mode,
+        "bars": bars,
+        "run_s": run_s,
+        "drain_s": drain_s,
+        "bars_per_sec": bars / run_s,
+        "final_value": engine.cerebro.broker.getvalue(),
+        "dropped": sink.dropped if sink is not None else 0,
+        "log_bytes": os.path.getsize(sink.path) if getattr(sink, "path", None) and os.path.exists(sink.path) else 0,
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--bars", default="100k", help="K 线数量，如 100k、1m")
+    parser.add_argument("--modes", default=",".join(MODES), help="逗号分隔的日志模式")
+    parser.add_argument("--repeat", type=int, default=3, help="每种模式运行次数，取最快一次")
+    parser.add_argument("--number", type=int, default=200000, help="单次调用基准的循环次数")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="把结果写入 JSON 文件")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    bars = parse_size(args.bars)
+
+    if args.child:
+        child(bars, args.child, args.seed)
+        return
+
+    calls = micro(args.number)
+    for name, ns in calls.items():
+        print(f"{name:<18} {ns:8.0f} ns/call")
+
+    results = []
+    for mode in args.modes.split(","):
+        runs = []
+        for _ in range(args.repeat):
+            with tempfile.TemporaryDirectory() as tmp:
+                env = dict(os.environ, STRATEGY_LOG_FILE=os.path.join(tmp, "strategy.jsonl"), **MODES[mode])
+                out = subprocess.run([sys.executable, os.path.abspath(__file__), "--child", mode, "--bars", str(bars),
+                                      "--seed", str(args.seed)], cwd=ROOT, env=env, capture_output=True, text=True)
+            if out.returncode != 0:
+                print(out.stderr)
+                sys.exit(out.returncode)
+            runs.append(json.loads(out.stdout.strip().splitlines()[-1]))
+        r = min(runs, key=lambda run: run["run_s"])
+        results.append(r)
+        print(f"{r['mode']:<10} {r['bars']:>10} bars  run={r['run_s']:.3f}s drain={r['drain_s']:.3f}s "
+              f"{r['bars_per_sec']:,.0f} bars/s  log={r['log_bytes'] / 2 ** 20:.1f}MB dropped={r['dropped']}")
+
+    base = next((r for r in results if r["mode"] == "off"), None)
+    if base is not None:
+        for r in results:
+            print(f"  {r['mode']:<10} overhead vs off: {(r['run_s'] / base['run_s'] - 1) * 100:+.1f}%"
+                  + ("" if r["final_value"] == base["final_value"] else "  RESULT CHANGED"))
+
+    report = {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "calls_ns": calls,
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,261 @@
+"""
+交易所限频/请求合并基准（本地假交易所，不访问 OKX）
+
+父进程启动一个本地 HTTP 假交易所: 按 OKX 的方式对 K 线接口做 2 秒窗口限频（超出返回 429），
+每次请求有固定延迟。若干子进程（模拟 Celery worker / 实盘 / API）各开多个线程，从少量热门页
+（symbol × since）中随机请求 fetch_ohlcv，遇到 429 退避重试，统计成功吞吐、429 次数、实际发到交易所的请求数和延迟。
+
+    python scripts/bench_rate_limit.py                                  # 需要 REDIS_URL 指向可用的 Redis
+    python scripts/bench_rate_limit.py --procs 8 --threads 4 --duration 20 --output bench_rl.json
+
+模式:
+  local     每个进程各自的令牌桶，额度为整个官方限频（改动前 ccxt enableRateLimit 的行为，每个进程都以为独占额度）
+  shared    Redis 共享令牌桶（core.brokers.okx_limits.SharedRateLimiter）
+  coalesce  共享令牌桶 + 相同请求合并（RequestCoalescer）
+"""
+import sys
+import os
+import json
+import time
+import random
+import argparse
+import platform
+import threading
+import subprocess
+import urllib.error
+import urllib.request
+from collections import deque
+from datetime import datetime
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MODES = ("local", "shared", "coalesce")
+SYMBOLS = ("BTC/USDT", "ETH/USDT", "SOL/USDT", "XRP/USDT", "DOGE/USDT")
+
+
+class FakeExchangeServer(object):
+    """2 秒窗口内最多 limit 次请求（与 OKX market/candles 相同的计数方式），超出返回 429"""
+    def __init__(self, limit=20, window=2.0, latency=0.02):
+        self.limit = limit
+        self.window = window
+        self.latency = latency
+        self.hits = deque()
+        self.served = 0
+        self.rejected = 0
+        self._lock = threading.Lock()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                now = time.monotonic()
+                with server._lock:
+                    while server.hits and server.hits[0] <= now - server.window:
+                        server.hits.popleft()
+                    allowed = len(server.hits) < server.limit
+                    if allowed:
+                        server.hits.append(now)
+                        server.served += 1
+                    else:
+                        server.rejected += 1
+                time.sleep(server.latency)
+                body = json.dumps([[0, 1.0, 1.0, 1.0, 1.0, 1.0]] * 100 if allowed else {"code": "50011"}).encode()
+                self.send_response(200 if allowed else 429)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.httpd.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}"
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def reset(self):
+        with self._lock:
+            self.hits.clear()
+            self.served = self.rejected = 0
+
+    def close(self):
+        self.httpd.shutdown()
+
+
+class FakeOKX(object):
+    """只实现 fetch_ohlcv 的 ccxt 交易所替身，429 时抛出 ccxt.RateLimitExceeded"""
+    rateLimit = 100
+
+    def __init__(self, url):
+        self.url = url
+
+    def fetch_ohlcv(self, symbol, timeframe='1m', since=None, limit=100):
+        import ccxt
+        try:
+            with urllib.request.urlopen(f"{self.url}/candles?instId={symbol}&bar={timeframe}&after={since}") as resp:
+                return json.loads(resp.read())
+        except urllib.error.HTTPError as e:
+            if e.code == 429:
+                raise ccxt.RateLimitExceeded(f"429 {symbol}")
+            raise
+
+
+class LocalLimiter(object):
+    """每个进程独立的令牌桶，接口同 SharedRateLimiter"""
+    def __init__(self, rate, capacity):
+        from core.data.history import TokenBucket
+        self.bucket = TokenBucket(rate, capacity)
+
+    def acquire(self, name, cost=1):
+        self.bucket.acquire()
+
+    def penalize(self, name, seconds):
+        self.bucket.penalize(seconds)
+
+
+def child(url, mode, threads, duration, keys, seed):
+    """在子进程中运行，打印一行 JSON"""
+    sys.path.insert(0, ROOT)
+    import ccxt
+    import redis
+    from config.settings import settings
+    from core.brokers.okx_limits import SharedRateLimiter, RequestCoalescer, LimitedExchange, ENDPOINT_CLASSES
+
+    if mode == "local":
+        requests, window, _ = ENDPOINT_CLASSES['candles']
+        exchange = LimitedExchange(FakeOKX(url), LocalLimiter(requests / window, requests))
+    else:
+        client = redis.Redis.from_url(settings.REDIS_URL)
+        exchange = LimitedExchange(FakeOKX(url), SharedRateLimiter(client),
+                                   RequestCoalescer(client) if mode == "coalesce" else None)
+
+    # 所有进程请求同一组热门页，seed 只影响各线程的选择顺序
+    rng = random.Random(keys)
+    pages = [(rng.choice(SYMBOLS), rng.randrange(1000) * 6000000) for _ in range(keys)]
+    latencies, failures = [], [0]
+    deadline = time.monotonic() + duration
+    lock = threading.Lock()
+
+    def worker(i):
+        r = random.Random(seed * 1000 + i)
+        while time.monotonic() < deadline:
+            symbol, since = r.choice(pages)
+            t = time.perf_counter()
+            for attempt in range(10):
+                try:
+                    exchange.fetch_ohlcv(symbol, '1m', since=since, limit=100)
+                    break
+                except ccxt.RateLimitExceeded:
+                    # LimitedExchange 已让共享/本地令牌桶暂停，这里直接重试
+                    continue
+            else:
+                with lock:
+                    failures[0] += 1
+                continue
+            with lock:
+                latencies.append(time.perf_counter() - t)
+
+    pool = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    coalescer = exchange.coalescer
+    print(json.dumps({
+        "completed": len(latencies),
+        "failed": failures[0],
+        "latencies": latencies,
+        "coalesced": coalescer.shared if coalescer is not None else 0,
+    }))
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))] if values else None
+
+
+def run_mode(server, mode, args):
+    server.reset()
+    t = time.perf_counter()
+    procs = [subprocess.Popen([sys.executable, os.path.abspath(__file__), "--child", mode, "--url", server.url,
+                               "--threads", str(args.threads), "--duration", str(args.duration),
+                               "--keys", str(args.keys), "--seed", str(args.seed + i)],
+                              cwd=ROOT, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+             for i in range(args.procs)]
+    outputs = []
+    for p in procs:
+        out, err = p.communicate()
+        if p.returncode != 0:
+            print(err)
+            sys.exit(p.returncode)
+        outputs.append(json.loads(out.strip().splitlines()[-1]))
+    elapsed = time.perf_counter() - t
+    latencies = [x for o in outputs for x in o["latencies"]]
+    completed = sum(o["completed"] for o in outputs)
+    return {
+        "mode": mode,
+        "completed": completed,
+        "failed": sum(o["failed"] for o in outputs),
+        "requests_per_sec": completed / elapsed,
+        "upstream_served": server.served,
+        "upstream_429": server.rejected,
+        "coalesced": sum(o["coalesced"] for o in outputs),
+        "p50_ms": percentile(latencies, 0.5) * 1000 if latencies else None,
+        "p95_ms": percentile(latencies, 0.95) * 1000 if latencies else None,
+        "elapsed_s": elapsed,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--modes", default=",".join(MODES), help="逗号分隔的模式")
+    parser.add_argument("--procs", type=int, default=4, help="并发进程数")
+    parser.add_argument("--threads", type=int, default=4, help="每个进程的线程数")
+    parser.add_argument("--duration", type=float, default=10.0, help="每种模式的运行时间（秒）")
+    parser.add_argument("--keys", type=int, default=20, help="不同请求（symbol × since）的数量，越少重复越多")
+    parser.add_argument("--limit", type=int, default=20, help="假交易所 2 秒窗口内允许的请求数")
+    parser.add_argument("--latency", type=float, default=0.02, help="假交易所每次请求的延迟（秒）")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="把结果写入 JSON 文件")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    parser.add_argument("--url", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.url, args.child, args.threads, args.duration, args.keys, args.seed)
+        return
+
+    sys.path.insert(0, ROOT)
+    import redis
+    from config.settings import settings
+    client = redis.Redis.from_url(settings.REDIS_URL)
+    server = FakeExchangeServer(args.limit, latency=args.latency)
+    results = []
+    for mode in args.modes.split(","):
+        # 每种模式从满桶开始
+        for key in client.scan_iter("okx:*"):
+            client.delete(key)
+        r = run_mode(server, mode, args)
+        results.append(r)
+        print(f"{mode:<9} {r['requests_per_sec']:8.1f} req/s  completed={r['completed']} failed={r['failed']} "
+              f"upstream={r['upstream_served']} 429={r['upstream_429']} coalesced={r['coalesced']} "
+              f"p50={r['p50_ms']:.0f}ms p95={r['p95_ms']:.0f}ms")
+    server.close()
+
+    report = {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "config": {k: getattr(args, k) for k in ("procs", "threads", "duration", "keys", "limit", "latency")},
+        "rate_limit_scale": settings.OKX_RATE_LIMIT_SCALE,
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""
+Celery worker 启动耗时基准
+
+每次在全新的 Python 进程中测量:
+  - cold:    import tasks.worker + 第一个回测任务（子进程自己导入回测模块）
+  - prefork: 父进程 preload() 后 fork，子进程中第一个回测任务的耗时（即 worker 默认模式）
+回测数据是写入临时 K 线库的合成数据，不访问网络和 Redis。
+超过 --max-import-ms / --max-first-task-ms 时以非零状态退出，可用于防止启动耗时回退。
+
+    python scripts/bench_startup.py --runs 5
+    python scripts/bench_startup.py --max-import-ms 800 --max-first-task-ms 1500 --json
+"""
+import sys
+import os
+import json
+import time
+import argparse
+import statistics
+import subprocess
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SYMBOL = "BENCH/USDT"
+START_DATE = "2024-01-01"
+END_DATE = "2024-03-31"
+
+
+def write_bars(root):
+    """在临时 K 线库中写入 START_DATE 前后各留余量的 1m 随机游走数据（1h 由其聚合）"""
+    sys.path.append(ROOT)
+    from core.data.bar_store import BarStore, to_ms
+    from core.data.synthetic import random_walk_ohlcv
+    from datetime import datetime
+
+    ohlcv = random_walk_ohlcv(120 * 1440, 0, base_price=100.0,
+                              start_ms=to_ms(datetime(2023, 12, 25)), step_ms=60 * 1000)
+    BarStore(root).write(SYMBOL, '1m', ohlcv)
+
+
+def run_first_task():
+    from tasks.worker import run_backtest_celery
+    t = time.perf_counter()
+    result = run_backtest_celery(
+        "SmaCross", SYMBOL, {"pfast": 10, "pslow": 30, "printlog": False}, START_DATE, END_DATE)
+    if result["status"] != "success":
+        raise RuntimeError(result.get("error"))
+    return time.perf_counter() - t
+
+
+def child(mode):
+    """在新进程中执行，打印一行 JSON"""
+    t = time.perf_counter()
+    import tasks.worker
+    timings = {"import_ms": (time.perf_counter() - t) * 1000}
+
+    if mode == "cold":
+        timings["first_task_ms"] = run_first_task() * 1000
+        print(json.dumps(timings))
+        return
+
+    t = time.perf_counter()
+    tasks.worker.preload()
+    timings["preload_ms"] = (time.perf_counter() - t) * 1000
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(read_fd)
+        with os.fdopen(write_fd, "w") as f:
+            f.write(str(run_first_task() * 1000))
+        os._exit(0)
+    os.close(write_fd)
+    with os.fdopen(read_fd) as f:
+        timings["first_task_ms"] = float(f.read())
+    os.waitpid(pid, 0)
+    print(json.dumps(timings))
+
+
+def measure(mode, env, runs):
+    samples = []
+    for _ in range(runs):
+        out = subprocess.run([sys.executable, os.path.abspath(__file__), "--child", mode],
+                             cwd=ROOT, env=env, capture_output=True, text=True, check=True)
+        samples.append(json.loads(out.stdout.strip().splitlines()[-1]))
+    return {key: statistics.median(s[key] for s in samples) for key in samples[0]}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=3, help="每种模式重复次数（取中位数）")
+    parser.add_argument("--max-import-ms", type=float, default=None, help="import tasks.worker 耗时上限")
+    parser.add_argument("--max-first-task-ms", type=float, default=None, help="prefork 模式首个任务耗时上限")
+    parser.add_argument("--json", action="store_true", help="输出 JSON")
+    parser.add_argument("--child", choices=("cold", "prefork"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        sys.path.insert(0, ROOT)
+        child(args.child)
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        write_bars(tmp)
+        env = dict(os.environ, BAR_STORE_DIR=tmp, RESULT_CACHE_ENABLED="false",
+                   OKX_MARKETS_CACHE=os.path.join(tmp, "okx_markets.json"), PYTHONPATH=ROOT)
+        report = {mode: measure(mode, env, args.runs) for mode in ("cold", "prefork")}
+
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        for mode, timings in report.items():
+            print(f"{mode:<8} " + "  ".join(f"{k}={v:.0f}" for k, v in timings.items()))
+
+    failures = []
+    if args.max_import_ms is not None and report["cold"]["import_ms"] > args.max_import_ms:
+        failures.append(f"import tasks.worker {report['cold']['import_ms']:.0f}ms > {args.max_import_ms:.0f}ms")
+    if args.max_first_task_ms is not None and report["prefork"]["first_task_ms"] > args.max_first_task_ms:
+        failures.append(f"first task {report['prefork']['first_task_ms']:.0f}ms > {args.max_first_task_ms:.0f}ms")
+    for failure in failures:
+        print(f"REGRESSION: {failure}")
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""
+向量化回测与 backtrader 回测的一致性检查
+
+在多组确定性随机游走数据和参数上分别运行 BacktestEngine 与 VectorBacktestEngine，
+逐项比较指标和成交记录，不一致时以非零状态退出。
+
+    python scripts/check_vector_parity.py
+"""
+import sys
+import os
+import math
+import time
+
+# Add project root to sys.path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.engine import BacktestEngine, VectorBacktestEngine
+from core.strategy.base import SmaCross
+from core.data.synthetic import random_walk
+
+METRICS = ('final_value', 'pnl', 'sharpe_ratio', 'max_drawdown', 'total_trades', 'win_rate')
+REL_TOL = 1e-7
+ABS_TOL = 1e-9
+
+CASES = [
+    # (seed, bars, pfast, pslow)
+    (1, 2000, 10, 30),
+    (2, 5000, 5, 20),
+    (3, 5000, 20, 60),
+    (4, 800, 3, 7),
+    (5, 3000, 30, 30),
+    (6, 50, 10, 30),
+]
+
+
+def run(engine_class, data, params):
+    engine = engine_class(None, None)
+    engine.set_data(data)
+    engine.add_strategy(SmaCross, printlog=False, **params)
+    t = time.perf_counter()
+    result = engine.run()
+    return result, time.perf_counter() - t
+
+
+def compare(expected, actual):
+    errors = []
+    for key in METRICS:
+        if not math.isclose(expected[key], actual[key], rel_tol=REL_TOL, abs_tol=ABS_TOL):
+            errors.append(f"{key}: backtrader={expected[key]} vector={actual[key]}")
+
+    if len(expected['trade_markers']) != len(actual['trade_markers']):
+        errors.append(f"fills: backtrader={len(expected['trade_markers'])} vector={len(actual['trade_markers'])}")
+    else:
+        for e, a in zip(expected['trade_markers'], actual['trade_markers']):
+            if e['date'] != a['date'] or e['type'] != a['type'] \
+                    or not math.isclose(e['price'], a['price'], rel_tol=REL_TOL) \
+                    or not math.isclose(e['amount'], a['amount'], rel_tol=REL_TOL):
+                errors.append(f"fill mismatch: backtrader={e} vector={a}")
+                break
+
+    if expected['chart_data'] != actual['chart_data']:
+        errors.append("chart_data differs")
+    return errors
+
+
+def main():
+    failed = 0
+    for seed, n, pfast, pslow in CASES:
+        data = random_walk(n, seed)
+        params = {'pfast': pfast, 'pslow': pslow}
+        expected, bt_time = run(BacktestEngine, data, params)
+        actual, vec_time = run(VectorBacktestEngine, data, params)
+        errors = compare(expected, actual)
+        status = "OK" if not errors else "FAIL"
+        print(f"[{status}] seed={seed} bars={n} params={params} trades={expected['total_trades']} "
+              f"backtrader={bt_time:.3f}s vector={vec_time:.4f}s")
+        for error in errors:
+            print(f"    {error}")
+        failed += bool(errors)
+
+    if failed:
+        print(f"{failed}/{len(CASES)} cases failed")
+        sys.exit(1)
+    print(f"All {len(CASES)} cases match")
+
+
+if __name__ == "__main__":
+    main()
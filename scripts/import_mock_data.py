@@ -1,57 +1,137 @@
+"""
+批量生成模拟 K 线并导入 MongoDB（bars_{symbol}_{timeframe} 集合）
+
+用 NumPy 向量化生成 GBM / 跳跃扩散 OHLCV（core.data.synthetic.gbm_ohlcv），
+每个 (symbol, timeframe) 在独立进程中生成，按 --batch-size 分批无序 insert_many，内存占用与总量无关。
+随机种子由 --seed、symbol、timeframe 共同决定，同样的参数总是生成同样的数据，与并行顺序无关。
+
+    python scripts/import_mock_data.py                                   # XAUUSD/EURUSD 30 天 1h
+    python scripts/import_mock_data.py --symbols BTCUSDT,ETHUSDT,XAUUSD --timeframes 1m,1h \\
+        --days 3650 --model jump --workers 8                             # 数千万根 K 线压测
+"""
 import sys
 import os
-import datetime
-import random
+import time
+import zlib
+import argparse
+from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
 import pymongo
-from dotenv import load_dotenv
+from pymongo.errors import BulkWriteError
 
 # Add project root to sys.path
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from config.settings import settings
+from core.data.bar_store import timeframe_to_ms, to_ms, DAY_MS
+from core.data.synthetic import gbm_ohlcv
+from core.data.mongo_bars import MongoBarRepository
+
+FIELDS = ("open", "high", "low", "close", "volume")
+DUPLICATE_KEY = 11000
+
+MODELS = {
+    "gbm": {},
+    "jump": {"jump_intensity": 12.0, "jump_mean": -0.01, "jump_std": 0.04},
+}
+
+
+def collection_name(symbol, timeframe):
+    return f"bars_{symbol}_{timeframe}"
+
+
+def start_price(symbol):
+    return 1800.0 if "XAU" in symbol else 1.1000
+
+
+def job_rng(seed, symbol, timeframe, *extra):
+    # 每个序列独立且确定的随机数流（追加时再按起点区分，不重复已有数据的走势）
+    return np.random.default_rng([seed, zlib.crc32(symbol.encode()), zlib.crc32(timeframe.encode()), *extra])
 
-def generate_mock_data(symbol, start_date, days=30):
+
+def to_documents(ohlcv):
+    """(n, 6) 数组 -> MongoDB 文档列表（逐列 tolist 后组装，避免逐元素访问 numpy 标量）"""
+    dts = ohlcv[:, 0].astype("datetime64[ms]").tolist()
+    columns = [ohlcv[:, i].tolist() for i in range(1, 6)]
+    return [dict(zip(FIELDS, values), datetime=dt) for dt, *values in zip(dts, *columns)]
+
+
+def generate_series(symbol, timeframe, start, bars, seed, model, sigma, batch_size, append):
+    """在子进程中生成并写入一个序列，返回写入条数"""
     client = pymongo.MongoClient(settings.MONGO_URL)
-    db = client[settings.MONGO_DB_NAME]
-    collection = db[f"bars_{symbol}_1h"]
-    
-    # Clear existing
-    collection.delete_many({})
-    
-    base_price = 1800.0 if "XAU" in symbol else 1.1000
-    current_price = base_price
-    
-    start = datetime.datetime.strptime(start_date, "%Y-%m-%d")
-    records = []
-    
-    print(f"Generating data for {symbol}...")
-    
-    for i in range(days * 24):
-        dt = start + datetime.timedelta(hours=i)
-        
-        # Random walk
-        change = (random.random() - 0.5) * (base_price * 0.005)
-        open_p = current_price
-        close_p = current_price + change
-        high_p = max(open_p, close_p) + random.random() * (base_price * 0.001)
-        low_p = min(open_p, close_p) - random.random() * (base_price * 0.001)
-        
-        record = {
-            "datetime": dt,
-            "open": open_p,
-            "high": high_p,
-            "low": low_p,
-            "close": close_p,
-            "volume": int(random.random() * 1000)
+    repo = MongoBarRepository(client[settings.MONGO_DB_NAME])
+    collection = repo.collection(symbol, timeframe)
+    step = timeframe_to_ms(timeframe)
+    ts, price = to_ms(start), start_price(symbol)
+    rng = job_rng(seed, symbol, timeframe)
+    if not append:
+        collection.drop()
+    else:
+        # 追加时先建唯一索引，重复时间的 K 线被跳过；从已有的最后一根之后接着生成
+        repo.ensure_index(symbol, timeframe)
+        last = collection.find_one({}, {"_id": 0, "datetime": 1, "close": 1}, sort=[("datetime", -1)])
+        if last is not None:
+            ts, price = to_ms(last["datetime"]) + step, last["close"]
+            rng = job_rng(seed, symbol, timeframe, ts)
+    inserted = 0
+    for offset in range(0, bars, batch_size):
+        n = min(batch_size, bars - offset)
+        ohlcv = gbm_ohlcv(n, rng, price, ts, step, sigma=sigma, **MODELS[model])
+        try:
+            inserted += len(collection.insert_many(to_documents(ohlcv), ordered=False).inserted_ids)
+        except BulkWriteError as e:
+            if any(err["code"] != DUPLICATE_KEY for err in e.details["writeErrors"]):
+                raise
+            inserted += e.details["nInserted"]
+        ts, price = ohlcv[-1, 0] + step, ohlcv[-1, 4]
+
+    if not append:
+        # 全新导入时最后再建索引，比边写边维护索引更快
+        repo.ensure_index(symbol, timeframe)
+    if inserted or not append:
+        # 更新数据指纹，使基于旧数据的回测结果缓存失效
+        repo.mark_updated(symbol, timeframe)
+    client.close()
+    return inserted
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--symbols", default="XAUUSD,EURUSD")
+    parser.add_argument("--timeframes", default="1h")
+    parser.add_argument("--start", default="2023-01-01")
+    parser.add_argument("--days", type=float, default=30)
+    parser.add_argument("--model", choices=sorted(MODELS), default="gbm")
+    parser.add_argument("--sigma", type=float, default=0.3, help="年化波动率")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--batch-size", type=int, default=20000)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--append", action="store_true", help="不清空已有集合，从最后一根 K 线之后追加 --days 天（集合为空时从 --start 开始）")
+    args = parser.parse_args()
+
+    start = datetime.strptime(args.start, "%Y-%m-%d")
+    jobs = [(symbol, tf, int(args.days * DAY_MS // timeframe_to_ms(tf)))
+            for symbol in args.symbols.split(",") for tf in args.timeframes.split(",")]
+    print(f"Generating {sum(j[2] for j in jobs):,} bars in {len(jobs)} series ({args.model})...")
+
+    t = time.perf_counter()
+    total = 0
+    with ProcessPoolExecutor(max_workers=min(args.workers, len(jobs))) as pool:
+        futures = {
+            pool.submit(generate_series, symbol, tf, start, bars, args.seed, args.model,
+                        args.sigma, args.batch_size, args.append): (symbol, tf)
+            for symbol, tf, bars in jobs
         }
-        records.append(record)
-        current_price = close_p
+        for future in as_completed(futures):
+            symbol, tf = futures[future]
+            inserted = future.result()
+            total += inserted
+            print(f"Inserted {inserted:,} records into {collection_name(symbol, tf)}")
 
-    if records:
-        collection.insert_many(records)
-        print(f"Inserted {len(records)} records into {collection.name}")
+    elapsed = time.perf_counter() - t
+    print(f"Done: {total:,} bars in {elapsed:.1f}s ({total / elapsed:,.0f} bars/s)")
 
-if __name__ == "__main__":
-    generate_mock_data("XAUUSD", "2023-01-01")
-    generate_mock_data("EURUSD", "2023-01-01")
 
+if __name__ == "__main__":
+    main()
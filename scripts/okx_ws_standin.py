@@ -0,0 +1,86 @@
+"""
+本地 OKX WebSocket 行情替身，用于离线调试 OKXData / OKXStream
+
+支持 subscribe/unsubscribe 与 ping/pong，对已订阅的 candle 频道按 interval 推送随机游走的已收盘 K 线；
+--drop-after N 会在每推送 N 根后主动断开连接，用于验证自动重连与补数。
+
+    python scripts/okx_ws_standin.py --port 8765 --interval 0.2
+    OKX_WS_URL=ws://127.0.0.1:8765 python ...
+"""
+import sys
+import os
+import json
+import time
+import random
+import asyncio
+import argparse
+import websockets
+
+# Add project root to sys.path
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from core.brokers.okx_ws import CANDLE_CHANNELS
+
+CHANNEL_MS = {channel: 60 * 1000 * {'m': 1, 'H': 60, 'D': 1440}[channel[-1]] * int(channel[6:-1])
+              for channel in CANDLE_CHANNELS.values()}
+
+
+# 行情时钟与价格在连接之间共享，重连后继续推送后续 K 线
+prices = {}
+clock = {}
+
+
+async def serve_client(ws, interval, drop_after):
+    subs = set()
+    sent = 0
+
+    async def reader():
+        async for raw in ws:
+            if raw == "ping":
+                await ws.send("pong")
+                continue
+            msg = json.loads(raw)
+            for arg in msg.get("args", []):
+                key = (arg["channel"], arg["instId"])
+                if msg.get("op") == "subscribe":
+                    subs.add(key)
+                else:
+                    subs.discard(key)
+                await ws.send(json.dumps({"event": msg.get("op"), "arg": arg}))
+
+    read_task = asyncio.ensure_future(reader())
+    try:
+        while not read_task.done():
+            await asyncio.sleep(interval)
+            for channel, instid in list(subs):
+                step = CHANNEL_MS[channel]
+                ts = clock.get((channel, instid), int(time.time() * 1000) // step * step - step)
+                clock[(channel, instid)] = ts + step
+                open_p = prices.get(instid, 100.0)
+                close_p = open_p * (1 + random.gauss(0, 0.002))
+                prices[instid] = close_p
+                row = [str(ts), f"{open_p:.4f}", f"{max(open_p, close_p) * 1.001:.4f}",
+                       f"{min(open_p, close_p) * 0.999:.4f}", f"{close_p:.4f}", "10", "1000", "1000", "1"]
+                await ws.send(json.dumps({"arg": {"channel": channel, "instId": instid}, "data": [row]}))
+                sent += 1
+                if drop_after and sent % drop_after == 0:
+                    await ws.close()
+                    return
+    finally:
+        read_task.cancel()
+
+
+async def main(host, port, interval, drop_after):
+    async with websockets.serve(lambda ws: serve_client(ws, interval, drop_after), host, port):
+        print(f"OKX WebSocket stand-in listening on ws://{host}:{port}")
+        await asyncio.Future()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--interval", type=float, default=1.0, help="推送间隔（秒）")
+    parser.add_argument("--drop-after", type=int, default=0, help="每推送 N 根 K 线后断开连接")
+    args = parser.parse_args()
+    asyncio.run(main(args.host, args.port, args.interval, args.drop_after))
@@ -0,0 +1,169 @@
+import os
+import json
+import time
+import uuid
+import hashlib
+import resource
+from datetime import datetime
+import redis
+from config.settings import settings
+
+INTERACTIVE_QUEUE = "interactive"
+BATCH_QUEUE = "batch"
+
+# 各引擎单根 K 线的相对耗时（backtrader 为 1）
+ENGINE_COST = {
+    'backtrader': 1.0,
+    'vector': 0.05,
+}
+
+_MS_PER_DAY = 24 * 3600 * 1000
+
+
+class SchedulerLimitExceeded(Exception):
+    """用户在途任务数超过 SCHEDULER_MAX_INFLIGHT_PER_USER"""
+
+
+class MemoryLimitExceeded(Exception):
+    """任务进程常驻内存超过 TASK_MEMORY_LIMIT_MB"""
+
+
+def estimate_bars(start_date: str, end_date: str, timeframe: str = "1h") -> int:
+    from core.data.bar_store import timeframe_to_ms
+    days = (datetime.strptime(end_date, "%Y-%m-%d") - datetime.strptime(start_date, "%Y-%m-%d")).days
+    return max(1, days * _MS_PER_DAY // timeframe_to_ms(timeframe))
+
+
+def estimate_cost(bars: int, runs: int = 1, mode: str = "backtrader") -> float:
+    """任务代价估计: K 线根数 × 回测次数（标的数、参数组合数）× 引擎系数"""
+    return bars * runs * ENGINE_COST.get(mode, 1.0)
+
+
+def route(cost: float) -> str:
+    return INTERACTIVE_QUEUE if cost <= settings.SCHEDULER_INTERACTIVE_MAX_COST else BATCH_QUEUE
+
+
+def time_limits(queue: str) -> dict:
+    """软时限到达时任务内抛出 SoftTimeLimitExceeded（返回失败结果），硬时限再过 60 秒强制结束子进程"""
+    soft = settings.TASK_SOFT_TIME_LIMIT_INTERACTIVE if queue == INTERACTIVE_QUEUE else settings.TASK_SOFT_TIME_LIMIT_BATCH
+    return {"soft_time_limit": soft, "time_limit": soft + 60}
+
+
+def rss_mb() -> float:
+    """当前进程常驻内存（MB）；没有 /proc 时退化为峰值"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20
+    except (OSError, ValueError):
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def check_memory(limit_mb: int = None):
+    """常驻内存超过 limit_mb（默认 TASK_MEMORY_LIMIT_MB）时抛出 MemoryLimitExceeded，limit_mb 为 0 时不检查"""
+    limit_mb = settings.TASK_MEMORY_LIMIT_MB if limit_mb is None else limit_mb
+    if limit_mb:
+        used = rss_mb()
+        if used > limit_mb:
+            raise MemoryLimitExceeded(f"memory limit exceeded: {used:.0f}MB > {limit_mb}MB")
+
+
+def memory_guard(callback=None, limit_mb: int = None):
+    """
+    包装进度回调: 每次回调时检查常驻内存，超过 limit_mb 时抛出 MemoryLimitExceeded 终止回测
+    （进度回调在回测循环中调用，异常会直接结束 cerebro.run）。limit_mb 为 0 时不检查。
+    向量化回测只在结束时回调一次，参数寻优分片由 run_combos 在组合之间调用 check_memory；
+    任务之间由 worker_max_memory_per_child（WORKER_MAX_MEMORY_MB）回收内存过高的子进程
+    """
+    limit_mb = settings.TASK_MEMORY_LIMIT_MB if limit_mb is None else limit_mb
+    if not limit_mb:
+        return callback
+
+    def guarded(**progress):
+        check_memory(limit_mb)
+        if callback is not None:
+            callback(**progress)
+    return guarded
+
+
+class TaskScheduler(object):
+    """
+    回测任务调度（API 端）
+
+    - 按估计代价路由: 小任务进 interactive 队列，多年/多参数的大任务进 batch 队列，
+      interactive 队列有专用 worker，界面上的回测不会排在长任务后面
+    - 去重: 相同任务与参数的在途提交合并到同一个 task_id（key 见 dedup_key，任务结束时清除）
+    - 公平: 同一用户的在途任务越多，新任务的优先级越低（Redis broker 的优先级 0-9，0 最高），
+      其他用户的任务可以插到前面；SCHEDULER_MAX_INFLIGHT_PER_USER 限制单个用户的在途任务数
+    - 每个任务带软/硬时限（time_limits），内存上限见 memory_guard 和 worker_max_memory_per_child
+    """
+    DEDUP_PREFIX = "backtest:scheduler:dedup:"
+    INFLIGHT_PREFIX = "backtest:scheduler:inflight:"
+    TASKS_KEY = "backtest:scheduler:tasks"  # task_id -> {"user", "dedup"}
+
+    def __init__(self, client=None, app=None):
+        self.client = client or redis.Redis.from_url(settings.REDIS_URL)
+        self.app = app
+
+    @classmethod
+    def dedup_key(cls, name: str, **kwargs) -> str:
+        payload = json.dumps({"task": name, "kwargs": kwargs}, sort_keys=True, default=str)
+        return cls.DEDUP_PREFIX + hashlib.sha256(payload.encode()).hexdigest()
+
+    def submit(self, name: str, kwargs: dict, cost: float, launch, user: str = None, queue: str = None) -> dict:
+        """
+        launch(task_id, queue=, priority=, soft_time_limit=, time_limit=) 负责真正提交任务（必须使用给定的 task_id）
+        返回 {"task_id", "queue", "priority", "deduplicated"}
+        """
+        user = user or "anonymous"
+        key = self.dedup_key(name, **kwargs)
+        task_id = str(uuid.uuid4())
+        while not self.client.set(key, task_id, nx=True, ex=settings.SCHEDULER_DEDUP_TTL):
+            existing = self.client.get(key)
+            if existing is not None and not self._finished(existing.decode()):
+                return {"task_id": existing.decode(), "queue": None, "priority": None, "deduplicated": True}
+            # 已结束但未清理（如 worker 异常退出）: 删除后重新抢占
+            self.client.delete(key)
+
+        queue = queue or route(cost)
+        inflight = self.inflight(user)
+        limit = settings.SCHEDULER_MAX_INFLIGHT_PER_USER
+        if limit and inflight >= limit:
+            self.client.delete(key)
+            raise SchedulerLimitExceeded(f"Too many running tasks for {user}: {inflight} >= {limit}")
+        priority = min(9, inflight)
+        now = time.time()
+        pipe = self.client.pipeline(transaction=False)
+        pipe.zadd(self.INFLIGHT_PREFIX + user, {task_id: now})
+        pipe.expire(self.INFLIGHT_PREFIX + user, settings.SCHEDULER_DEDUP_TTL)
+        pipe.hset(self.TASKS_KEY, task_id, json.dumps({"user": user, "dedup": key}))
+        pipe.execute()
+        try:
+            launch(task_id, queue=queue, priority=priority, **time_limits(queue))
+        except Exception:
+            self.finished(task_id)
+            raise
+        return {"task_id": task_id, "queue": queue, "priority": priority, "deduplicated": False}
+
+    def inflight(self, user: str) -> int:
+        """用户的在途任务数（超过 SCHEDULER_DEDUP_TTL 的记录视为已丢失，不再计入）"""
+        key = self.INFLIGHT_PREFIX + user
+        self.client.zremrangebyscore(key, 0, time.time() - settings.SCHEDULER_DEDUP_TTL)
+        return self.client.zcard(key)
+
+    def finished(self, task_id: str):
+        """任务结束（worker 的 task_postrun 中调用）: 释放去重 key 和用户的在途名额"""
+        raw = self.client.hget(self.TASKS_KEY, task_id)
+        if raw is None:
+            return
+        info = json.loads(raw)
+        pipe = self.client.pipeline(transaction=False)
+        pipe.zrem(self.INFLIGHT_PREFIX + info["user"], task_id)
+        pipe.hdel(self.TASKS_KEY, task_id)
+        pipe.execute()
+        # 去重 key 可能已被新提交占用，只删除指向本任务的
+        if self.client.get(info["dedup"]) == task_id.encode():
+            self.client.delete(info["dedup"])
+
+    def _finished(self, task_id: str) -> bool:
+        from celery.result import AsyncResult
+        return AsyncResult(task_id, app=self.app).ready()
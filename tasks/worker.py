@@ -1,6 +1,20 @@
-from celery import Celery
+import time
+import importlib
+from datetime import datetime
+from celery import Celery, chord
+from celery.exceptions import SoftTimeLimitExceeded
+from celery.signals import worker_init, task_postrun
 from config.settings import settings
-from core.engine import run_backtest_task as engine_run_backtest
+from tasks.scheduler import (TaskScheduler, BATCH_QUEUE, INTERACTIVE_QUEUE, estimate_bars, estimate_cost,
+                             memory_guard, check_memory)
+
+# 回测相关模块（backtrader/pandas/ccxt）在任务内部按需导入，导入 tasks.worker 本身保持轻量；
+# prefork 模式下由 worker_init 在父进程预加载一次，fork 出的子进程直接复用
+PRELOAD_MODULES = (
+    'core.engine',
+    'core.optimize',
+    'core.data.sync',
+)
 
 celery_app = Celery(
     "roy_trade_worker",
@@ -14,16 +28,212 @@ celery_app.conf.update(
     result_serializer='json',
     timezone='UTC',
     enable_utc=True,
+    # 回测任务按估计代价分到 interactive / batch 队列（见 tasks.scheduler），其余任务默认走 interactive；
+    # 部署时 interactive 有专用 worker（-Q interactive），batch worker 用 -Q batch,interactive 在空闲时帮忙
+    task_default_queue=INTERACTIVE_QUEUE,
+    task_routes={
+        'tasks.worker.sync_bars_celery': {'queue': BATCH_QUEUE},
+        'tasks.worker.prefetch_bars_celery': {'queue': BATCH_QUEUE},
+        'tasks.worker.run_sweep_chunk_celery': {'queue': BATCH_QUEUE},
+        'tasks.worker.collect_sweep_celery': {'queue': BATCH_QUEUE},
+    },
+    # 长任务不预取: 每个子进程只占一个任务，排队的任务可以被空闲 worker 取走
+    worker_prefetch_multiplier=1,
+    task_acks_late=True,
+    broker_transport_options={
+        'queue_order_strategy': 'priority',
+        'priority_steps': list(range(10)),
+        'sep': ':',
+        # acks_late 时未确认的任务超过该时间会被重新投递，必须大于最长任务的硬时限
+        'visibility_timeout': settings.TASK_SOFT_TIME_LIMIT_BATCH + 600,
+    },
+    worker_max_memory_per_child=settings.WORKER_MAX_MEMORY_MB * 1024 or None,
 )
 
+
+def preload():
+    """导入回测模块并预热交易所元数据（优先读磁盘缓存），返回各步骤耗时（秒）"""
+    timings = {}
+    for name in PRELOAD_MODULES:
+        t = time.perf_counter()
+        importlib.import_module(name)
+        timings[name] = time.perf_counter() - t
+
+    t = time.perf_counter()
+    try:
+        from core.brokers.okx import OKXStore
+        store = OKXStore.get_instance()
+        store.load_markets()
+        # 父进程中用过的 HTTP 连接不能被 fork 出的子进程共享
+        store.exchange.session.close()
+    except Exception as e:
+        print(f"Skipping markets warm-up: {e}")
+    timings['markets'] = time.perf_counter() - t
+    return timings
+
+
+@worker_init.connect
+def preload_worker(**kwargs):
+    if settings.WORKER_PRELOAD:
+        timings = preload()
+        print("Worker preload: " + ", ".join(f"{k}={v * 1000:.0f}ms" for k, v in timings.items()))
+
+def store_result(result: dict) -> dict:
+    """
+    完整结果（K 线、成交点、权益曲线）以列式二进制写入 ResultStore，Celery 结果后端（Redis）中
+    只保存 {"status", "result_id", "metrics"}；/status 按需展开完整结果或其中的字段/时间片段
+    """
+    from core.result_store import ResultStore, result_metrics
+    return {"status": "success", "result_id": ResultStore().save(result), "metrics": result_metrics(result)}
+
+
+@task_postrun.connect
+def release_scheduled_task(task_id=None, **kwargs):
+    try:
+        TaskScheduler(app=celery_app).finished(task_id)
+    except Exception as e:
+        print(f"Scheduler release failed for {task_id}: {e}")
+
+
+def task_error(e: Exception) -> str:
+    if isinstance(e, SoftTimeLimitExceeded):
+        return "time limit exceeded"
+    return str(e)
+
+
 @celery_app.task(bind=True)
-def run_backtest_celery(self, strategy_name: str, symbol: str, params: dict, start_date: str, end_date: str):
+def run_backtest_celery(self, strategy_name: str, symbol: str, params: dict, start_date: str, end_date: str, mode: str = "backtrader",
+                        timeframe: str = "1h", extra_timeframes: list = None, symbols: list = None,
+                        initial_cash: float = 100000.0, metrics="core"):
     """
-    Celery 任务包装器：调用核心回测引擎
+    Celery 任务包装器：调用核心回测引擎，运行中通过 Redis pub/sub 推送进度（见 /stream/{task_id}）
+    完整结果写入 ResultStore，任务只返回句柄（见 store_result）
     """
+    from core.engine import run_backtest_task as engine_run_backtest
+    from core.progress import ProgressPublisher
+    publisher = ProgressPublisher(self.request.id)
     try:
-        result = engine_run_backtest(strategy_name, symbol, params, start_date, end_date)
-        return {"status": "success", "result": result}
+        result = engine_run_backtest(strategy_name, symbol, params, start_date, end_date, mode,
+                                     timeframe=timeframe, extra_timeframes=extra_timeframes,
+                                     symbols=symbols, initial_cash=initial_cash,
+                                     progress=memory_guard(publisher.update), ledger_id=self.request.id,
+                                     metrics=metrics)
+        payload = store_result(result)
     except Exception as e:
         # Log error properly in production
+        payload = {"status": "failed", "error": task_error(e)}
+    publisher.done(payload)
+    return payload
+
+
+@celery_app.task
+def sync_bars_celery(symbol: str, timeframe: str = '1h'):
+    """
+    增量同步本地 K 线库（可由 celery beat 定时触发）
+    """
+    from core.data.sync import sync_bars
+    try:
+        return {"status": "success", "result": sync_bars(symbol, timeframe)}
+    except Exception as e:
         return {"status": "failed", "error": str(e)}
+
+
+@celery_app.task
+def prefetch_bars_celery(symbol: str, start_date: str, end_date: str):
+    """
+    参数寻优前先把回测区间的数据补齐，避免多个分片任务同时下载
+    """
+    from core.engine import load_bars
+    load_bars(symbol, datetime.strptime(start_date, "%Y-%m-%d"), datetime.strptime(end_date, "%Y-%m-%d"))
+    return symbol
+
+
+@celery_app.task
+def run_sweep_chunk_celery(strategy_name: str, symbol: str, combos: list, start_date: str, end_date: str, initial_cash: float, mode: str = "vector"):
+    """
+    参数寻优分片: 同一 worker 进程内数据只加载一次；每个组合之前检查内存，超限时剩余组合记为失败
+    """
+    from core.optimize import get_cached_bars, run_combos
+    data = get_cached_bars(symbol, datetime.strptime(start_date, "%Y-%m-%d"), datetime.strptime(end_date, "%Y-%m-%d"))
+    return run_combos(strategy_name, data, combos, initial_cash, mode, memory_check=check_memory)
+
+
+@celery_app.task
+def collect_sweep_celery(chunks: list, sort_by: str = "sharpe_ratio", top_n: int = None):
+    """
+    chord 回调: 汇总所有分片并按指标排序
+    """
+    from core.optimize import rank_results
+    rows = [row for chunk in chunks for row in chunk]
+    return {"status": "success", "result": {"total": len(rows), "results": rank_results(rows, sort_by, top_n)}}
+
+
+@celery_app.task(bind=True)
+def run_walk_forward_celery(self, strategy_name: str, symbol: str, param_grid: dict, start_date: str, end_date: str,
+                            train="90d", test="30d", step=None, anchored: bool = False, timeframe: str = "1h",
+                            initial_cash: float = 100000.0, sort_by: str = "sharpe_ratio", mode: str = "vector",
+                            oos_mode: str = "backtrader"):
+    """
+    前推优化: 数据加载一次，各窗口的寻优/验证在任务内的进程池中并行（WALK_FORWARD_WORKERS），
+    每完成一个窗口推送一次进度
+    """
+    from core.engine import run_walk_forward_task
+    from core.progress import ProgressPublisher
+    publisher = ProgressPublisher(self.request.id)
+    try:
+        result = run_walk_forward_task(strategy_name, symbol, param_grid, start_date, end_date, train, test, step,
+                                       anchored, timeframe, initial_cash, sort_by, mode, oos_mode,
+                                       progress=memory_guard(publisher.update))
+        payload = store_result(result)
+    except Exception as e:
+        payload = {"status": "failed", "error": task_error(e)}
+    publisher.done(payload)
+    return payload
+
+
+def submit_backtest(user: str = None, **kwargs):
+    """
+    提交单次回测（经 TaskScheduler 去重、按代价路由），kwargs 同 run_backtest_celery
+    返回 {"task_id", "queue", "priority", "deduplicated"}
+    """
+    symbols = kwargs.get("symbols") or [kwargs.get("symbol")]
+    bars = estimate_bars(kwargs["start_date"], kwargs["end_date"], kwargs.get("timeframe", "1h"))
+    cost = estimate_cost(bars, len(symbols), kwargs.get("mode", "backtrader"))
+    return TaskScheduler(app=celery_app).submit(
+        run_backtest_celery.name, kwargs, cost,
+        lambda task_id, **options: run_backtest_celery.apply_async(kwargs=kwargs, task_id=task_id, **options),
+        user=user)
+
+
+def submit_walk_forward(user: str = None, **kwargs):
+    """提交前推优化（始终进 batch 队列），kwargs 同 run_walk_forward_celery"""
+    return TaskScheduler(app=celery_app).submit(
+        run_walk_forward_celery.name, kwargs, 0,
+        lambda task_id, **options: run_walk_forward_celery.apply_async(kwargs=kwargs, task_id=task_id, **options),
+        user=user, queue=BATCH_QUEUE)
+
+
+def submit_sweep(strategy_name: str, symbol: str, param_grid: dict, start_date: str, end_date: str,
+                 initial_cash: float, sort_by: str = "sharpe_ratio", top_n: int = None, mode: str = "vector",
+                 user: str = None):
+    """
+    提交参数寻优: 预取数据 -> 分片并行回测 (chord) -> 汇总排序，返回 (调度结果, 组合数)
+    调度结果中的 task_id 为汇总任务的 id；分片任务都在 batch 队列，优先级与软时限同整个寻优
+    """
+    from core.optimize import expand_grid, chunked
+    combos = expand_grid(param_grid)
+
+    def launch(task_id, queue, priority, soft_time_limit, time_limit):
+        options = {"queue": BATCH_QUEUE, "priority": priority, "soft_time_limit": soft_time_limit, "time_limit": time_limit}
+        header = [
+            run_sweep_chunk_celery.si(strategy_name, symbol, chunk, start_date, end_date, initial_cash, mode).set(**options)
+            for chunk in chunked(combos, settings.SWEEP_CHUNK_SIZE)
+        ]
+        body = collect_sweep_celery.s(sort_by, top_n).set(task_id=task_id, **options)
+        workflow = prefetch_bars_celery.si(symbol, start_date, end_date).set(**options) | chord(header, body)
+        return workflow.apply_async()
+
+    kwargs = dict(strategy_name=strategy_name, symbol=symbol, param_grid=param_grid, start_date=start_date,
+                  end_date=end_date, initial_cash=initial_cash, sort_by=sort_by, top_n=top_n, mode=mode)
+    scheduled = TaskScheduler(app=celery_app).submit("sweep", kwargs, 0, launch, user=user, queue=BATCH_QUEUE)
+    return scheduled, len(combos)
@@ -15,12 +15,21 @@ export interface BacktestRequest {
 }
 
 export interface TradeMarker {
-    date: string;
+    date: number; // Epoch ms
     type: 'buy' | 'sell';
     price: number;
     amount: number;
 }
 
+export type ChartRow = [number, number, number, number, number]; // Epoch ms, Open, Close, Low, High
+
+export interface ChartRangeResponse {
+  symbol: string;
+  timeframe: string;
+  bars: number;
+  chart_data: ChartRow[];
+}
+
 export interface BacktestResult {
   final_value: number;
   pnl: number;
@@ -28,7 +37,7 @@ export interface BacktestResult {
   max_drawdown: number;
   total_trades: number;
   win_rate: number;
-  chart_data: Array<[string, number, number, number, number]>; // Date, Open, Close, Low, High
+  chart_data: ChartRow[];
   trade_markers: TradeMarker[];
 }
 
@@ -55,6 +64,39 @@ export const getBacktestStatus = async (taskId: string) => {
     return response.data;
 }
 
+export interface BacktestProgress {
+    bars: number;
+    total_bars: number;
+    equity: number;
+    pnl: number;
+    trades: number;
+    max_drawdown: number;
+    elapsed: number | null;
+    eta: number | null; // 预计剩余秒数
+}
+
+// 订阅任务进度（Server-Sent Events），收到 done 后连接由服务端关闭；返回的 EventSource 需在组件卸载时 close()
+export const streamBacktest = (
+    taskId: string,
+    onProgress: (progress: BacktestProgress) => void,
+    onDone: (status: TaskStatusResponse) => void,
+) => {
+    const source = new EventSource(`${api.defaults.baseURL}/backtest/stream/${taskId}`);
+    source.addEventListener('progress', (e) => onProgress(JSON.parse((e as MessageEvent).data)));
+    source.addEventListener('done', (e) => {
+        source.close();
+        onDone(JSON.parse((e as MessageEvent).data));
+    });
+    return source;
+}
+
+export const getChartRange = async (symbol: string, start: number, end: number, timeframe = '1h') => {
+    const response = await api.get<ChartRangeResponse>('/backtest/chart', {
+        params: { symbol, start, end, timeframe },
+    });
+    return response.data;
+}
+
 export const getStrategies = async () => {
   const response = await api.get<string[]>('/backtest/strategies');
   return response.data;
@@ -1,8 +1,8 @@
-import React, { useState, useEffect, useRef } from 'react';
+import React, { useState, useEffect, useRef, useMemo } from 'react';
 import { ProForm, ProFormSelect, ProFormDateRangePicker, ProFormMoney, ProFormDigit } from '@ant-design/pro-components';
-import { Card, Row, Col, Statistic, message, Spin, Alert } from 'antd';
+import { Card, Row, Col, Statistic, message, Spin, Alert, Progress } from 'antd';
 import ReactECharts from 'echarts-for-react';
-import { runBacktest, getStrategies, getBacktestStatus, BacktestRequest, BacktestResult, TaskStatusResponse } from '../../api/backtest';
+import { runBacktest, getStrategies, streamBacktest, getChartRange, BacktestRequest, BacktestResult, BacktestProgress, ChartRow } from '../../api/backtest';
 import dayjs from 'dayjs';
 
 const BacktestPage: React.FC = () => {
@@ -10,61 +10,53 @@ const BacktestPage: React.FC = () => {
   const [loading, setLoading] = useState(false);
   const [result, setResult] = useState<BacktestResult | null>(null);
   const [taskId, setTaskId] = useState<string | null>(null);
-  const pollingTimer = useRef<any>(null);
+  const [progress, setProgress] = useState<BacktestProgress | null>(null);
+  const progressStream = useRef<EventSource | null>(null);
+  // 放大查看时按区间加载的完整精度 K 线
+  const [symbol, setSymbol] = useState<string>('');
+  const [zoom, setZoom] = useState({ start: 50, end: 100 });
+  const [detail, setDetail] = useState<{ start: number; end: number; data: ChartRow[] } | null>(null);
+  const zoomTimer = useRef<any>(null);
 
   useEffect(() => {
     getStrategies().then(setStrategies).catch(console.error);
     return () => {
-        if (pollingTimer.current) clearInterval(pollingTimer.current);
+        progressStream.current?.close();
     }
   }, []);
 
   useEffect(() => {
       if (taskId) {
           setLoading(true);
-          // Start polling
-          pollingTimer.current = setInterval(async () => {
-              try {
-                  const statusRes = await getBacktestStatus(taskId);
-                  console.log("Polling status:", statusRes);
-                  
-                  if (statusRes.state === 'SUCCESS' && statusRes.result) {
-                      // Note: Celery result might be wrapped in {status: success, result: ...} from our worker
-                      // Our worker returns {status: "success", result: {...actual data...}}
-                      // Let's check the structure.
-                      // The API returns result: result directly from AsyncResult.
-                      // So we need to unwrap the inner result
-                      const innerResult = statusRes.result as any;
-                      if (innerResult.status === 'success') {
-                           setResult(innerResult.result);
-                           message.success('回测完成');
-                      } else {
-                          message.error('回测失败: ' + innerResult.error);
-                      }
-                      
-                      setLoading(false);
-                      setTaskId(null);
-                      clearInterval(pollingTimer.current);
-                  } else if (statusRes.state === 'FAILURE') {
-                      message.error('回测失败: ' + statusRes.error);
-                      setLoading(false);
-                      setTaskId(null);
-                      clearInterval(pollingTimer.current);
+          setProgress(null);
+          // 服务端推送进度，结束时推送与 /status 相同的结果
+          progressStream.current = streamBacktest(taskId, setProgress, (statusRes) => {
+              if (statusRes.state === 'SUCCESS' && statusRes.result) {
+                  // Our worker returns {status: "success", result: {...actual data...}}
+                  const innerResult = statusRes.result as any;
+                  if (innerResult.status === 'success') {
+                       setResult(innerResult.result);
+                       message.success('回测完成');
+                  } else {
+                      message.error('回测失败: ' + innerResult.error);
                   }
-                  // PENDING or STARTED, continue polling
-              } catch (e) {
-                  console.error("Polling error", e);
-                  // Don't stop polling on transient network error, but maybe count errors
+              } else {
+                  message.error('回测失败: ' + statusRes.error);
               }
-          }, 2000);
+              setLoading(false);
+              setTaskId(null);
+          });
       }
       return () => {
-          if (pollingTimer.current) clearInterval(pollingTimer.current);
+          progressStream.current?.close();
       }
   }, [taskId]);
 
   const handleFinish = async (values: any) => {
     setResult(null);
+    setDetail(null);
+    setZoom({ start: 50, end: 100 });
+    setSymbol(values.symbol);
     try {
       const request: BacktestRequest = {
         strategy: values.strategy,
@@ -90,13 +82,40 @@ const BacktestPage: React.FC = () => {
     }
   };
 
+  // 概览数据（已降采样）中放大区间的部分替换为完整精度数据
+  const chartData = useMemo(() => {
+    if (!result || !result.chart_data) return [];
+    if (!detail) return result.chart_data;
+    return result.chart_data
+      .filter(item => item[0] < detail.start || item[0] > detail.end)
+      .concat(detail.data)
+      .sort((a, b) => a[0] - b[0]);
+  }, [result, detail]);
+
+  const onDataZoom = (e: any) => {
+    if (!result || result.chart_data.length === 0) return;
+    const z = e.batch ? e.batch[0] : e;
+    if (z.start === undefined || z.end === undefined) return;
+    setZoom({ start: z.start, end: z.end });
+
+    const first = result.chart_data[0][0];
+    const last = result.chart_data[result.chart_data.length - 1][0];
+    const start = Math.floor(first + (last - first) * z.start / 100);
+    const end = Math.ceil(first + (last - first) * z.end / 100);
+    if (zoomTimer.current) clearTimeout(zoomTimer.current);
+    zoomTimer.current = setTimeout(async () => {
+      try {
+        const res = await getChartRange(symbol, start, end);
+        setDetail({ start, end, data: res.chart_data });
+      } catch (err) {
+        console.error("Load chart range error", err);
+      }
+    }, 300);
+  };
+
   const getKLineOption = () => {
     if (!result || !result.chart_data) return {};
 
-    // Split data for echarts
-    const dates = result.chart_data.map(item => item[0]);
-    const data = result.chart_data.map(item => [item[1], item[2], item[3], item[4]]); // Open, Close, Low, High
-
     // MarkPoints for Buy/Sell
     const markPoints = result.trade_markers.map(m => ({
         name: m.type === 'buy' ? 'Buy' : 'Sell',
@@ -116,9 +135,8 @@ const BacktestPage: React.FC = () => {
             }
         },
         xAxis: {
-            data: dates,
+            type: 'time',
             scale: true,
-            boundaryGap: false,
         },
         yAxis: {
             scale: true,
@@ -129,22 +147,23 @@ const BacktestPage: React.FC = () => {
         dataZoom: [
             {
                 type: 'inside',
-                start: 50,
-                end: 100
+                start: zoom.start,
+                end: zoom.end
             },
             {
                 show: true,
                 type: 'slider',
                 y: '90%',
-                start: 50,
-                end: 100
+                start: zoom.start,
+                end: zoom.end
             }
         ],
         series: [
             {
                 name: 'KLine',
                 type: 'candlestick',
-                data: data,
+                data: chartData, // Epoch ms, Open, Close, Low, High
+                encode: { x: 0, y: [1, 2, 3, 4] },
                 itemStyle: {
                     color: '#ef232a', // Bullish (Red in China/some styles)
                     color0: '#14b143', // Bearish (Green)
@@ -219,7 +238,22 @@ const BacktestPage: React.FC = () => {
           </Card>
         </Col>
         <Col span={18}>
-          {loading && <Alert message="正在运行回测任务，请稍候..." type="info" showIcon style={{ marginBottom: 16 }} />}
+          {loading && (
+            <Alert
+              message="正在运行回测任务，请稍候..."
+              description={progress && (
+                <>
+                  <Progress percent={Math.floor(100 * progress.bars / Math.max(1, progress.total_bars))} size="small" />
+                  {`K 线 ${progress.bars}/${progress.total_bars}，权益 ${progress.equity.toFixed(2)}，`}
+                  {`交易 ${progress.trades} 笔，最大回撤 ${progress.max_drawdown.toFixed(2)}%`}
+                  {progress.eta != null && `，预计剩余 ${Math.ceil(progress.eta)} 秒`}
+                </>
+              )}
+              type="info"
+              showIcon
+              style={{ marginBottom: 16 }}
+            />
+          )}
           
             {result ? (
               <>
@@ -238,7 +272,7 @@ const BacktestPage: React.FC = () => {
                   </Col>
                 </Row>
                 <Card title="策略表现" bordered={false} style={{ minHeight: 500 }}>
-                   <ReactECharts option={getKLineOption()} style={{ height: 500 }} />
+                   <ReactECharts option={getKLineOption()} style={{ height: 500 }} onEvents={{ datazoom: onDataZoom }} />
                 </Card>
               </>
             ) : (